@@ -3,6 +3,7 @@ import pandas as pd
 from pathlib import Path
 from neo4j import GraphDatabase
 from utils.database import load_db_config
+from utils.query_profile import ProfiledDriver
 
 
 if __name__ == "__main__":
@@ -91,11 +92,11 @@ if __name__ == "__main__":
         st.session_state["credentials_locked"] = False  # Prevent changes after start
     if "db_connection" not in st.session_state:
         # Use the URI from the config file
-        st.session_state["db_connection"] = GraphDatabase.driver(
+        st.session_state["db_connection"] = ProfiledDriver(GraphDatabase.driver(
             db_config['uri'],
             auth=(st.session_state['username'],
                   st.session_state['password'])
-        )
+        ))
 
     ## main block
     if "connected" not in st.session_state:
@@ -1,6 +1,9 @@
 import streamlit as st
 from neo4j import GraphDatabase
 from utils.database import get_neo4j_session, create_pyvis_graph
+from utils.query_governor import GovernedDriver, QueryGovernor
+from utils.query_profile import profile_driver
+from utils.sidebar import query_limits, query_poll
 import time
 
 # Uncommented GraphRAG imports
@@ -58,13 +61,15 @@ def chat():
         """)
         try:
             # Create a connection pool for Neo4j
-            driver = GraphDatabase.driver(
+            neo4j_driver = GraphDatabase.driver(
                 uri, 
                 auth=(user, password),
                 max_connection_lifetime=3600,
                 max_connection_pool_size=50,
                 connection_acquisition_timeout=60
             )
+            # Chat's own queries show up in the query profile like every other page's
+            driver = profile_driver(neo4j_driver)
 
             # Check if GraphRAG is available
             if not GRAPHRAG_AVAILABLE:
@@ -130,7 +135,9 @@ def chat():
                 st.session_state["retriever_type"] = "Text2Cypher"
             else:
                 # Fall back to VectorRetriever if schema extraction fails
-                retriever = VectorRetriever(driver)
+                # neo4j-graphrag validates a real driver; the profiled one is swapped in afterwards
+                retriever = VectorRetriever(neo4j_driver)
+                retriever.driver = driver
                 st.session_state["retriever_type"] = "Vector"
 
             # Initialize GraphRAG with the appropriate LLM based on provider
@@ -145,7 +152,9 @@ def chat():
                 USER INPUT: 'Which actors starred in the Matrix?' 
                 QUERY: MATCH (p:Person)-[:ACTED_IN]->(m:Movie) WHERE m.title = 'The Matrix' RETURN p.name
                 """]
-                retriever = Text2CypherRetriever(driver, neo4j_schema=schema, llm=llm, examples=examples)
+                retriever = Text2CypherRetriever(neo4j_driver, neo4j_schema=schema, llm=llm, examples=examples)
+                # Generated Cypher runs through the query governor (EXPLAIN checks, row cap, timeout, cancel)
+                retriever.driver = GovernedDriver(QueryGovernor(driver, limits=query_limits()), action="Chat")
                 # embeddings = None  # Use default embeddings
                 return GraphRAG(retriever, llm=llm)
             elif llm_provider == "Anthropic" and llm_api_key:
@@ -293,6 +302,14 @@ def chat():
                             # Append user input to chat history
                             st.session_state["chat_history"].append({"role": "user", "content": user_input})
 
+                            # Apply the current governor limits, and let any click stop generated Cypher
+                            retriever = getattr(st.session_state["graph_rag"], "retriever", None)
+                            governed = getattr(retriever, "driver", None)
+                            if isinstance(governed, GovernedDriver):
+                                governed.governor.limits = query_limits()
+                                st.button("Stop", key="chat_stop_query")
+                                governed.poll = query_poll(st.empty(), "Running generated Cypher")
+
                             with st.spinner("Generating response..."):
                                 try:
                                     # Generate response using GraphRAG with error handling and timeout
@@ -1,7 +1,6 @@
 import streamlit as st
-import pandas as pd
-from io import BytesIO
-from utils.database import get_neo4j_session, create_pyvis_graph, fetch_nodes_by_label
+from utils.database import create_pyvis_graph, nodes_by_label_query, nodes_to_frame
+from utils.sidebar import export_button, governed_query
 
 # st.sidebar.title("Connect")
 
@@ -62,20 +61,18 @@ if st.session_state.connected:
             selected_labels = st.multiselect("Labels", st.session_state.cached_labels)
 
             if st.button("Pull Index"):
-                with st.spinner(f"Fetching nodes for labels: {', '.join(selected_labels)}"):
-                    session = get_neo4j_session(
-                        st.session_state.neo4j_uri,
-                        st.session_state.neo4j_user,
-                        st.session_state.neo4j_password,
-                        database=st.session_state.selected_db
+                node_dataframes = {}
+                for label in selected_labels:
+                    # The recall query's pattern is user-written, so each pull goes through the query governor
+                    handle = governed_query(
+                        nodes_by_label_query(label, st.session_state.recall_query.strip()),
+                        f"Fetching {label} nodes",
+                        key=f"label_index_{label}"
                     )
-                    node_dataframes = {}
-                    for label in selected_labels:
-                        node_data = fetch_nodes_by_label(
-                            session,
-                            label,
-                            st.session_state.recall_query.strip())
-                        node_dataframes[label] = pd.DataFrame(node_data)
+                    if handle is None:
+                        break
+                    node_dataframes[label] = nodes_to_frame(handle.records)
+                else:
                     st.session_state.node_dataframes = node_dataframes
 
     if "node_dataframes" in st.session_state:
@@ -109,27 +106,11 @@ if st.session_state.connected:
 
             # Set filename input outside of button press
             filename = st.text_input("Enter filename for Excel workbook", value="node_data.xlsx")
-            # Export all to Excel
-            if st.button("Export XLSX Workbook"):
-                if not filename.endswith(".xlsx"):
-                    st.error("Filename must end with .xlsx")
-                else:
-                    with st.spinner("Preparing Excel workbook..."):
-                        output = BytesIO()
-                        try:
-                            with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-                                for label, df in st.session_state.node_dataframes.items():
-                                    df.to_excel(writer, index=False, sheet_name=label)
-                            output.seek(0)
-
-                            # Once ready, provide the download button
-                            st.download_button(
-                                label="Download",
-                                data=output,
-                                file_name=filename,
-                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                            )
-                        except Exception as e:
-                            st.error(f"Failed to export workbook: {e}")
+            # Export all to Excel, written sheet by sheet when requested
+            if not filename.endswith(".xlsx"):
+                st.error("Filename must end with .xlsx")
+            else:
+                export_button("XLSX Workbook", lambda: st.session_state.node_dataframes, filename[:-len(".xlsx")],
+                              key="node_workbook", formats=("XLSX",))
 else:
     st.sidebar.success("Link database (DB) to recall and explore ontological maps stored in a graph")
\ No newline at end of file
@@ -1,363 +1,455 @@
+import time
 import streamlit as st
 import pandas as pd
+from neo4j.exceptions import ServiceUnavailable
 from pathlib import Path
 from utils.models import  merge_nodes_with_existing
-from utils.database import fetch_available_labels, fetch_entity_labels, fetch_node_properties, fetch_nodes_with_properties
+from utils.path_rules import DEFAULT_SAMPLE_SIZE, DEFAULT_WORKERS, apply_label_rules, compile_rules, preview_label_rules
+from utils.resolution import DEFAULT_THRESHOLD, apply_resolution, fetch_existing_keys, resolve_entities
+from utils.bulk_load import backfill_taxonomy_uids, build_taxonomy_tables, ensure_uid_constraints, push_nodes, push_edges, write_rows
+from utils.database import (count_filtered_nodes, fetch_entity_labels, fetch_filtered_nodes,
+                            fetch_indexed_properties, fetch_node_properties, fetch_nodes_with_properties, get_neo4j_container)
+from utils.scanner import load_ncdu_export
+from utils.filters import OPERATORS, FrameFilter, describe_filter, filter_from_rows, filter_properties
+from utils.text_index import build_index
+from utils.taxonomy import TaxonomyCache
+from utils.table_cache import content_digest, list_excel_sheets, load_table
+from utils.server_import import load_tables_via_csv
+from utils.sidebar import bulk_write_options, export_button, session_frames
+from utils.memory import renamed_view
+
+session_frames("entities_df", "taxonomy")
+
+
+def entity_filter():
+    """Return the filter bound to the current `entities_df`, starting a new one when the frame was replaced."""
+    current = st.session_state.get("entity_filter")
+    if current is None or current.frame is not st.session_state["entities_df"]:
+        current = FrameFilter(st.session_state["entities_df"])
+        st.session_state["entity_filter"] = current
+        # The filter tree outlives a spill of the frame (`utils.memory.KEPT_ON_SPILL`)
+        kept = st.session_state.pop("entity_filter_tree", None)
+        if kept is not None and kept[0] is current.frame:
+            current.apply(kept[1])
+    return current
+
+
+def filtered_entities():
+    """Return the entities that pass the active filter (all of them when none is set)."""
+    if st.session_state["entities_df"] is None:
+        return None
+    return entity_filter().filtered()
+
+
+EMPTY_PREDICATES = pd.DataFrame([{"group": 1, "column": None, "op": "==", "value": ""}])
+
+
+def predicate_editor(predicates, columns, key):
+    """Edit filter predicates as a table: one condition per row, grouped by `group`."""
+    return st.data_editor(
+        predicates,
+        column_config={
+            "group": st.column_config.NumberColumn("group", min_value=1, step=1, required=True),
+            "column": st.column_config.SelectboxColumn("column", options=list(columns), required=True),
+            "op": st.column_config.SelectboxColumn("op", options=OPERATORS, required=True),
+            "value": st.column_config.TextColumn("value"),
+        },
+        num_rows="dynamic",
+        hide_index=True,
+        key=key
+    )
+
+
+def apply_entity_filter(tree):
+    try:
+        matched = entity_filter().apply(tree)
+        st.session_state["filter_message"] = ("success", f"Filter applied. {matched} entities match {describe_filter(tree)}.")
+    except ValueError as e:
+        st.session_state["filter_message"] = ("error", str(e))
+
+
+def reset_entity_filter():
+    entity_filter().reset()
+    st.session_state["filter_message"] = ("success", "Filter reset. Showing all entities.")
+
+
+# Rows offered by the entity picker at a time
+ENTITY_PICKER_LIMIT = 50
+
+
+def entity_taxonomy(keys):
+    """Return the taxonomy of the filtered entities over `keys`, derived from earlier ones where possible."""
+    cache = st.session_state.setdefault("taxonomy_cache", TaxonomyCache())
+    return cache.taxonomy(filtered_entities(), keys)
+
+
+def entity_search_index(frame, column):
+    """Return the search index over `frame[column]`, rebuilt only when the frame or column changes."""
+    cached = st.session_state.get("entity_search_index")
+    if cached is None or cached[0] is not frame or cached[1] != column:
+        cached = (frame, column, build_index(frame, column))
+        st.session_state["entity_search_index"] = cached
+    return cached[2]
+
+
+def set_entities(frame):
+    """Replace `entities_df` with a table that did not come straight from a loaded file."""
+    st.session_state["entities_df"] = frame
+    # The next load of the same file must not be skipped as already loaded
+    st.session_state.pop("entities_file", None)
+
+
+def load_entities_file(source, file_type, description, sheet_name=None, force=False):
+    """
+    Load a table into `entities_df` through the parse cache, unless that content is already loaded.
+
+    Args:
+        force (bool): Load even if the same content is already loaded (an explicit load click).
+
+    Returns:
+        bool: True if a new table was loaded.
+    """
+    loaded = (content_digest(source), file_type, sheet_name)
+    if not force and st.session_state.get("entities_file") == loaded:
+        return False
+    st.session_state["entities_df"], _ = load_table(source, file_type, sheet_name)
+    st.session_state["entities_file"] = loaded
+    st.session_state["file_uploaded"] = description
+    return True
 
-st.session_state["available_labels"] = fetch_available_labels()
 
-# Title and description
-st.header("Entities")
+# Labels and property keys change rarely; fragments re-read them at most this often
+SCHEMA_CACHE_TTL = 60
+
+
+def _schema_lookup(key, fetch):
+    cache = st.session_state.setdefault("schema_cache", {})
+    cached = cache.get(key)
+    if cached is None or time.monotonic() - cached[0] > SCHEMA_CACHE_TTL:
+        with st.session_state["db_connection"].session() as session:
+            cache[key] = (time.monotonic(), fetch(session))
+    return cache[key][1]
 
-with st.expander("Resolve and define node labels", expanded=False):
-    # Create two columns layout
-    col1, col2 = st.columns(2)
 
-    # Right column for instructions
-    with col2:
-        st.markdown(
-            """
-            ## Review and Edit Entities
-            1. Load entities from a file or database.
-            2. Select label and properties.
-            3. Review dataset row by row.
-            4. Define relationships and push to the database.
-            """
-        )
+def database_labels():
+    """Return the node labels in the database, re-read at most every `SCHEMA_CACHE_TTL` seconds."""
+    try:
+        return _schema_lookup(("labels",), fetch_entity_labels)
+    except ServiceUnavailable:
+        st.warning("Database unavailable. Resolve connection to access database features.")
+        return []
 
-    # Left column for functionality
-    with col1:
-        # Data source selection
-        data_source = st.radio(
-            "Get entities from:",
-            ["File", "Database", "NCDU Scan"],
-            key="data_source_section1"
+
+def node_properties(label):
+    """Return the property keys of a label, re-read at most every `SCHEMA_CACHE_TTL` seconds."""
+    return _schema_lookup(("properties", label), lambda session: fetch_node_properties(session, label))
+
+
+def forget_schema():
+    """Drop cached labels, property keys and existing entity keys, e.g. after a push created new ones."""
+    st.session_state.pop("schema_cache", None)
+    st.session_state.pop("database_label_cache", None)
+    st.session_state.pop("resolution_existing", None)
+
+
+@st.fragment
+def entity_source():
+    """Load `entities_df` from a file, the database or a scan; a new table reruns the whole page."""
+    loaded = False
+    data_source = st.radio(
+        "Get entities from:",
+        ["File", "Database", "NCDU Scan"],
+        key="data_source_section1"
+    )
+
+    if data_source == "File":
+        # File type selection
+        file_type = st.radio(
+            "File type:",
+            ["CSV", "Excel", "JSON"],
+            key="file_type_section1"
         )
 
-        if data_source == "File":
-            # File type selection
-            file_type = st.radio(
-                "File type:",
-                ["CSV", "Excel", "JSON"],
-                key="file_type_section1"
-            )
-
-            if file_type in ["CSV", "JSON"]:
-                # File uploader for CSV or JSON
-                file_types = {"CSV": ["csv"], "JSON": ["json"]}
-                uploaded_file = st.file_uploader(f"Upload {file_type} file:", type=file_types[file_type], key=f"file_uploader_section1_{file_type}")
-                file_path = st.text_input(f"Or enter {file_type} file path:")
-
-                if st.button("Load File") and file_path:
-                    try:
-                        if file_type == "CSV":
-                            st.session_state["entities_df"] = pd.read_csv(file_path)
-                        else:  # JSON
-                            st.session_state["entities_df"] = pd.read_json(file_path)
-                        st.session_state["file_uploaded"] = file_path
-                    except Exception as e:
-                        st.error(f"Error loading file: {e}")
+        if file_type in ["CSV", "JSON"]:
+            # File uploader for CSV or JSON
+            file_types = {"CSV": ["csv"], "JSON": ["json"]}
+            uploaded_file = st.file_uploader(f"Upload {file_type} file:", type=file_types[file_type], key=f"file_uploader_section1_{file_type}")
+            file_path = st.text_input(f"Or enter {file_type} file path:")
 
-                if uploaded_file:
-                    try:
-                        if file_type == "CSV":
-                            st.session_state["entities_df"] = pd.read_csv(uploaded_file)
-                        else:  # JSON
-                            st.session_state["entities_df"] = pd.read_json(uploaded_file)
-                        st.session_state["file_uploaded"] = uploaded_file.name
-                    except Exception as e:
-                        st.error(f"Error loading file: {e}")
+            if st.button("Load File") and file_path:
+                try:
+                    loaded = load_entities_file(file_path, file_type, file_path, force=True)
+                except Exception as e:
+                    st.error(f"Error loading file: {e}")
 
-            elif file_type == "Excel":
-                # Excel file handling with sheet selection
-                uploaded_excel = st.file_uploader("Upload Excel file:", type=["xlsx", "xls"], key="excel_uploader_section1")
-                excel_path = st.text_input("Or enter Excel file path:")
+            if uploaded_file:
+                try:
+                    # Parsed once per upload; reruns find the same content already loaded
+                    loaded = load_entities_file(uploaded_file, file_type, uploaded_file.name)
+                except Exception as e:
+                    st.error(f"Error loading file: {e}")
 
-                excel_file = uploaded_excel if uploaded_excel else (excel_path if excel_path else None)
+        elif file_type == "Excel":
+            # Excel file handling with sheet selection
+            uploaded_excel = st.file_uploader("Upload Excel file:", type=["xlsx", "xls"], key="excel_uploader_section1")
+            excel_path = st.text_input("Or enter Excel file path:")
 
-                if excel_file:
-                    try:
+            excel_file = uploaded_excel if uploaded_excel else (excel_path if excel_path else None)
+
+            if excel_file:
+                try:
+                    # Sheet names come from the workbook metadata, not from parsing the sheets
+                    sheet_names = list_excel_sheets(excel_file)
+                    selected_sheet = st.selectbox("Select sheet:", options=sheet_names)
+
+                    if st.button("Load Sheet"):
                         if isinstance(excel_file, str):  # Path provided
-                            xls = pd.ExcelFile(excel_path)
+                            loaded = load_entities_file(excel_path, "Excel", f"{excel_path} (Sheet: {selected_sheet})",
+                                                        sheet_name=selected_sheet, force=True)
                         else:  # File uploaded
-                            xls = pd.ExcelFile(excel_file)
-
-                        sheet_names = xls.sheet_names
-                        selected_sheet = st.selectbox("Select sheet:", options=sheet_names)
-
-                        if st.button("Load Sheet"):
-                            if isinstance(excel_file, str):  # Path provided
-                                st.session_state["entities_df"] = pd.read_excel(excel_path, sheet_name=selected_sheet)
-                                st.session_state["file_uploaded"] = f"{excel_path} (Sheet: {selected_sheet})"
-                            else:  # File uploaded
-                                st.session_state["entities_df"] = pd.read_excel(excel_file, sheet_name=selected_sheet)
-                                st.session_state["file_uploaded"] = f"{uploaded_excel.name} (Sheet: {selected_sheet})"
-                    except Exception as e:
-                        st.error(f"Error loading Excel file: {e}")
+                            loaded = load_entities_file(excel_file, "Excel", f"{uploaded_excel.name} (Sheet: {selected_sheet})",
+                                                        sheet_name=selected_sheet, force=True)
+                except Exception as e:
+                    st.error(f"Error loading Excel file: {e}")
 
-        elif data_source == "Database":
-            # Database entity loading
-            if st.session_state.connected:
-                st.session_state["available_entity_labels"] = fetch_entity_labels(st.session_state["db_connection"].session())
-                entity_label = st.selectbox("Select Node Label:", st.session_state["available_entity_labels"])
+    elif data_source == "Database":
+        # Database entity loading
+        if st.session_state.connected:
+            st.session_state["available_entity_labels"] = database_labels()
+            entity_label = st.selectbox("Select Node Label:", st.session_state["available_entity_labels"])
 
-                if entity_label and st.button("Pull Entities from Database"):
-                    try:
-                        properties = fetch_node_properties(st.session_state["db_connection"].session(), entity_label)
-                        entities_data = fetch_nodes_with_properties(
-                            st.session_state["db_connection"].session(),
-                            entity_label, 
-                            properties
-                        )
-                        st.session_state["entities_df"] = entities_data
-                        st.session_state["file_uploaded"] = f"Database: {entity_label} nodes"
-                        st.success(f"Loaded {len(entities_data)} entities from database")
-                    except Exception as e:
-                        st.error(f"Error loading entities from database: {e}")
-            else:
-                st.warning("Please connect to a database first")
-
-        elif data_source == "NCDU Scan":
-            # NCDU scan results handling
-            ncdu_source = st.radio(
-                "NCDU source:",
-                ["Survey Page Results", "NCDU JSON File"],
-                key="ncdu_source"
-            )
-
-            if ncdu_source == "Survey Page Results":
-                if "scanned_files" in st.session_state and not st.session_state["scanned_files"].empty:
-                    if st.button("Load Survey Scan Results"):
-                        st.session_state["entities_df"] = st.session_state["scanned_files"]
-                        st.session_state["file_uploaded"] = "NCDU Survey Scan Results"
-                else:
-                    st.warning("No scan results available. Please run a scan on the Survey page first.")
-
-            else:  # NCDU JSON File
-                uploaded_ncdu = st.file_uploader("Upload NCDU JSON file:", type=["json"], key="ncdu_uploader")
-                ncdu_path = st.text_input("Or enter NCDU JSON file path:")
+            if entity_label:
+                # Property keys and indexes are looked up once per label
+                label_cache = st.session_state.setdefault("database_label_cache", {})
+                if entity_label not in label_cache:
+                    with st.session_state["db_connection"].session() as session:
+                        try:
+                            indexed = fetch_indexed_properties(session, entity_label)
+                        except Exception:
+                            indexed = {}
+                        label_cache[entity_label] = (fetch_node_properties(session, entity_label), indexed)
+                label_properties, indexed_properties = label_cache[entity_label]
+
+                selected_properties = st.multiselect("Properties to pull:", options=label_properties,
+                                                     default=label_properties, key=f"pull_properties_{entity_label}")
+                st.markdown("Only pull nodes matching (AND within a group, OR across groups; leave empty for all):")
+                database_filter = filter_from_rows(
+                    predicate_editor(EMPTY_PREDICATES, label_properties, f"pull_filter_{entity_label}")
+                )
+                if database_filter:
+                    unindexed = [prop for prop in filter_properties(database_filter) if prop not in indexed_properties]
+                    st.caption(f"Filter runs in Neo4j: {describe_filter(database_filter)}"
+                               + (f" (no index on {', '.join(unindexed)}: label scan)" if unindexed else " (index-backed)"))
+                pull_limit = st.number_input("Row limit (0 for no limit):", min_value=0, value=0, step=1000,
+                                             key="pull_limit")
+
+                count_col, pull_col = st.columns(2)
+                with count_col:
+                    if st.button("Count Matches"):
+                        try:
+                            with st.session_state["db_connection"].session() as session:
+                                matches = count_filtered_nodes(session, entity_label, database_filter)
+                            st.info(f"{matches} {entity_label} nodes match.")
+                        except Exception as e:
+                            st.error(f"Error counting entities: {e}")
+                with pull_col:
+                    pull_clicked = st.button("Pull Entities from Database")
 
-                if st.button("Load NCDU File") and (uploaded_ncdu or ncdu_path):
+                if pull_clicked:
                     try:
-                        import json
-
-                        # Load the JSON file
-                        if uploaded_ncdu:
-                            ncdu_data = json.load(uploaded_ncdu)
-                            file_source = uploaded_ncdu.name
-                        else:
-                            with open(ncdu_path, 'r') as f:
-                                ncdu_data = json.load(f)
-                            file_source = ncdu_path
-
-                        # Parse NCDU JSON (similar to survey.py implementation)
-                        def parse_ncdu_json(node, parent_path=""):
-                            path = f"{parent_path}/{node['name']}" if parent_path else node["name"]
-                            file_info = {
-                                "Path": path,
-                                "Size (Bytes)": node.get("asize", 0),
-                                "Disk Usage (Bytes)": node.get("dsize", 0),
-                                "Type": "Directory" if "children" in node else "File"
-                            }
-                            parsed_files = [file_info]
-                            if "children" in node:
-                                for child in node["children"]:
-                                    parsed_files.extend(parse_ncdu_json(child, path))
-                            return parsed_files
-
-                        # Transform to dataframe
-                        parsed_files = parse_ncdu_json(ncdu_data)
-                        st.session_state["entities_df"] = pd.DataFrame(parsed_files)
-                        st.session_state["file_uploaded"] = f"NCDU: {file_source}"
-
+                        with st.session_state["db_connection"].session() as session:
+                            entities_data = fetch_filtered_nodes(
+                                session, entity_label, selected_properties, database_filter, limit=pull_limit or None
+                            )
+                        set_entities(entities_data)
+                        st.session_state["file_uploaded"] = f"Database: {entity_label} nodes" + (
+                            f" where {describe_filter(database_filter)}" if database_filter else "")
+                        st.toast(f"Loaded {len(entities_data)} entities from database")
+                        loaded = True
                     except Exception as e:
-                        st.error(f"Error loading NCDU file: {e}")
+                        st.error(f"Error loading entities from database: {e}")
+        else:
+            st.warning("Please connect to a database first")
+
+    elif data_source == "NCDU Scan":
+        # NCDU scan results handling
+        ncdu_source = st.radio(
+            "NCDU source:",
+            ["Survey Page Results", "NCDU JSON File"],
+            key="ncdu_source"
+        )
 
-    # Display the dataframe if loaded
-    if st.session_state["entities_df"] is not None:
-        st.markdown(f"`{st.session_state['file_uploaded']}`")
-        st.subheader("Input DataFrame")
+        if ncdu_source == "Survey Page Results":
+            session_frames("scanned_files")
+            if "scanned_files" in st.session_state and not st.session_state["scanned_files"].empty:
+                if st.button("Load Survey Scan Results"):
+                    set_entities(st.session_state["scanned_files"])
+                    st.session_state["file_uploaded"] = "NCDU Survey Scan Results"
+                    loaded = True
+            else:
+                st.warning("No scan results available. Please run a scan on the Survey page first.")
 
-        # Display the DataFrame
-        try:
-            # Try to display the full dataframe
-            st.dataframe(st.session_state["entities_df"], use_container_width=True)
-        except Exception as e:
-            if "MessageSizeError" in str(e) or "exceeds the message size limit" in str(e):
-                # If the dataframe is too large, show an abbreviated version
-                st.warning("The data is too large to display in full. Showing abbreviated version (first 1000 rows).")
+        else:  # NCDU JSON File
+            uploaded_ncdu = st.file_uploader("Upload NCDU JSON file:", type=["json"], key="ncdu_uploader")
+            ncdu_path = st.text_input("Or enter NCDU JSON file path:")
 
-                # Create an abbreviated dataframe
-                abbreviated_df = st.session_state["entities_df"].head(1000)
-                st.dataframe(abbreviated_df, use_container_width=True)
+            if st.button("Load NCDU File") and (uploaded_ncdu or ncdu_path):
+                try:
+                    # Same parser as the Survey page's background scans
+                    if uploaded_ncdu:
+                        set_entities(load_ncdu_export(uploaded_ncdu))
+                        file_source = uploaded_ncdu.name
+                    else:
+                        set_entities(load_ncdu_export(ncdu_path))
+                        file_source = ncdu_path
+                    st.session_state["file_uploaded"] = f"NCDU: {file_source}"
+                    loaded = True
+                except Exception as e:
+                    st.error(f"Error loading NCDU file: {e}")
+
+    # Everything below depends on the table, so a new one reruns the whole page
+    if loaded:
+        st.rerun()
+
+
+@st.fragment
+def entity_mapping(entities_view):
+    """
+    Label and property columns, their Neo4j names, the entity picker, relationships and the push.
+
+    Runs as a fragment: typing a property name or searching for an entity reruns
+    only this section, against the `entities_view` of the last full run.
+    """
+    # Select label column
+    st.subheader("Define Entity Structure")
+    st.session_state["label_column"] = st.selectbox("Select Label Column:",
+                                                    options=entities_view.columns)
+    st.session_state["property_columns"] = st.multiselect("Select Property Columns:",
+                                                          options=entities_view.columns)
+
+    # Initialize property mappings if not already in session state
+    if "property_mappings" not in st.session_state:
+        st.session_state["property_mappings"] = {}
+
+    # Only show property mapping if properties are selected
+    if st.session_state["property_columns"]:
+        st.subheader("Map Property Columns to Neo4j Property Names")
+        st.markdown("Define how selected columns should be named in Neo4j nodes.")
+
+        # Create a container for the property mappings
+        mapping_container = st.container()
+
+        with mapping_container:
+            # Create two columns for each property mapping
+            for prop in st.session_state["property_columns"]:
+                col1, col2 = st.columns([1, 1])
+                with col1:
+                    st.text(f"Column: {prop}")
+                with col2:
+                    # Initialize with the original name if not already mapped
+                    default_value = st.session_state["property_mappings"].get(prop, prop)
+                    new_name = st.text_input(f"Neo4j Property Name for {prop}", 
+                                            value=default_value,
+                                            key=f"mapping_{prop}")
+                    # Store the mapping
+                    st.session_state["property_mappings"][prop] = new_name
+
+    # Display individual entity view
+    # Typeahead over the label column: only the top matches are sent to the browser
+    search_index = entity_search_index(entities_view, st.session_state["label_column"])
+    entity_query = st.text_input("Find entity to edit:", key="entity_search",
+                                 placeholder=f"Type part of a {st.session_state['label_column']} value")
+    entity_indices, match_count = search_index.search(entity_query, limit=ENTITY_PICKER_LIMIT)
+    if match_count > len(entity_indices):
+        st.caption(f"Showing the first {len(entity_indices)} entities; {match_count} values match. "
+                   "Type more to narrow down.")
+    selected_entity_index = st.selectbox("Select entity to edit:", options=entity_indices,
+                                         format_func=lambda x: f"{search_index.value(x)} (row {x})")
+
+    if selected_entity_index is not None:
+        st.session_state["selected_entity_index"] = selected_entity_index
+        # Get the original entity data
+        selected_entity = entities_view.loc[selected_entity_index][
+            st.session_state["property_columns"]].to_dict()
+
+        # Create a new dictionary with mapped property names as keys
+        mapped_entity = {}
+        for prop, value in selected_entity.items():
+            mapped_name = st.session_state["property_mappings"].get(prop, prop)
+            mapped_entity[mapped_name] = value
+
+        # Create DataFrame with mapped property names
+        selected_entity_df = pd.DataFrame(list(mapped_entity.items()), columns=["Key", "Value"])
+
+        edited_entity_df = st.data_editor(
+            selected_entity_df,
+            key="individual_entity_editor",
+            use_container_width=True,
+            num_rows="dynamic"
+        )
 
-                # Add download button for the full dataset
-                csv_data = st.session_state["entities_df"].to_csv(index=False)
-                st.download_button(
-                    label="Download Full Dataset as CSV",
-                    data=csv_data,
-                    file_name="entities_data.csv",
-                    mime="text/csv",
-                )
+    # Define relationships
+    st.subheader("Define Relationships")
+
+    # Add option to create a new node label
+    label_option = st.radio("Target Node Label:", ["Existing Label", "New Label"], key="label_option")
+
+    if label_option == "Existing Label":
+        st.session_state["available_labels"] = database_labels()
+        target_label = st.selectbox("Select Target Node Label:", options=st.session_state["available_labels"])
+    else:
+        st.info("A new node label will be created in the database if it doesn't already exist.")
+        target_label = st.text_input("Enter New Node Label:")
+
+    # Create a list of property columns with their mapped names for selection
+    if "property_mappings" in st.session_state and st.session_state["property_mappings"]:
+        # Create a list of tuples (original_name, mapped_name) for display
+        property_options = []
+        for col in entities_view.columns:
+            mapped_name = st.session_state["property_mappings"].get(col, col)
+            if col == mapped_name:
+                property_options.append(f"{col}")
             else:
-                # If it's a different error, show it
-                st.error(f"Error displaying data: {e}")
+                property_options.append(f"{col} → {mapped_name}")
 
-        # Select label column
-        st.subheader("Define Entity Structure")
-        st.session_state["label_column"] = st.selectbox("Select Label Column:",
-                                                        options=st.session_state["entities_df"].columns)
-        st.session_state["property_columns"] = st.multiselect("Select Property Columns:",
-                                                              options=st.session_state["entities_df"].columns)
+        # Display the selection with mapped names
+        st.markdown("### Select Matching Properties")
+        st.markdown("Select properties to match with target nodes. Properties with mapped names show both original and mapped names.")
 
-        # Initialize property mappings if not already in session state
-        if "property_mappings" not in st.session_state:
-            st.session_state["property_mappings"] = {}
+        # Store the selected options
+        selected_options = st.multiselect(
+            "Select Matching Properties:", 
+            options=property_options
+        )
 
-        # Only show property mapping if properties are selected
-        if st.session_state["property_columns"]:
-            st.subheader("Map Property Columns to Neo4j Property Names")
-            st.markdown("Define how selected columns should be named in Neo4j nodes.")
+        # Extract the original column names from the selected options
+        match_columns = []
+        for option in selected_options:
+            if " → " in option:
+                # Extract the original column name (before the arrow)
+                original_col = option.split(" → ")[0]
+                match_columns.append(original_col)
+            else:
+                match_columns.append(option)
+    else:
+        # If no mappings exist, use the original column selection
+        match_columns = st.multiselect("Select Matching Properties:", options=entities_view.columns)
 
-            # Create a container for the property mappings
-            mapping_container = st.container()
+    # Initialize target property mappings if not already in session state
+    if "target_property_mappings" not in st.session_state:
+        st.session_state["target_property_mappings"] = {}
 
-            with mapping_container:
-                # Create two columns for each property mapping
-                for prop in st.session_state["property_columns"]:
-                    col1, col2 = st.columns([1, 1])
-                    with col1:
-                        st.text(f"Column: {prop}")
-                    with col2:
-                        # Initialize with the original name if not already mapped
-                        default_value = st.session_state["property_mappings"].get(prop, prop)
-                        new_name = st.text_input(f"Neo4j Property Name for {prop}", 
-                                                value=default_value,
-                                                key=f"mapping_{prop}")
-                        # Store the mapping
-                        st.session_state["property_mappings"][prop] = new_name
-
-        # Display individual entity view
-        entity_indices = st.session_state["entities_df"].index.tolist()
-        selected_entity_index = st.selectbox("Select entity to edit:", options=entity_indices, format_func=lambda
-            x: f"{st.session_state['entities_df'].at[x, st.session_state['label_column']]}" if st.session_state[
-            "label_column"] else f"Entity {x}")
-
-        if selected_entity_index is not None:
-            st.session_state["selected_entity_index"] = selected_entity_index
-            # Get the original entity data
-            selected_entity = st.session_state["entities_df"].iloc[selected_entity_index][
-                st.session_state["property_columns"]].to_dict()
-
-            # Create a new dictionary with mapped property names as keys
-            mapped_entity = {}
-            for prop, value in selected_entity.items():
-                mapped_name = st.session_state["property_mappings"].get(prop, prop)
-                mapped_entity[mapped_name] = value
-
-            # Create DataFrame with mapped property names
-            selected_entity_df = pd.DataFrame(list(mapped_entity.items()), columns=["Key", "Value"])
-
-            edited_entity_df = st.data_editor(
-                selected_entity_df,
-                key="individual_entity_editor",
-                use_container_width=True,
-                num_rows="dynamic"
-            )
-
-        # Define relationships
-        st.subheader("Define Relationships")
-
-        # Add option to create a new node label
-        label_option = st.radio("Target Node Label:", ["Existing Label", "New Label"], key="label_option")
-
-        if label_option == "Existing Label":
-            target_label = st.selectbox("Select Target Node Label:", options=st.session_state["available_labels"])
-        else:
-            st.info("A new node label will be created in the database if it doesn't already exist.")
-            target_label = st.text_input("Enter New Node Label:")
-
-        # Create a list of property columns with their mapped names for selection
-        if "property_mappings" in st.session_state and st.session_state["property_mappings"]:
-            # Create a list of tuples (original_name, mapped_name) for display
-            property_options = []
-            for col in st.session_state["entities_df"].columns:
-                mapped_name = st.session_state["property_mappings"].get(col, col)
-                if col == mapped_name:
-                    property_options.append(f"{col}")
-                else:
-                    property_options.append(f"{col} → {mapped_name}")
-
-            # Display the selection with mapped names
-            st.markdown("### Select Matching Properties")
-            st.markdown("Select properties to match with target nodes. Properties with mapped names show both original and mapped names.")
-
-            # Store the selected options
-            selected_options = st.multiselect(
-                "Select Matching Properties:", 
-                options=property_options
-            )
-
-            # Extract the original column names from the selected options
-            match_columns = []
-            for option in selected_options:
-                if " → " in option:
-                    # Extract the original column name (before the arrow)
-                    original_col = option.split(" → ")[0]
-                    match_columns.append(original_col)
-                else:
-                    match_columns.append(option)
-        else:
-            # If no mappings exist, use the original column selection
-            match_columns = st.multiselect("Select Matching Properties:", options=st.session_state["entities_df"].columns)
+    # Only show property mapping if properties are selected
+    if match_columns:
+        st.markdown("### Map Properties to Target Node Properties")
 
-        # Initialize target property mappings if not already in session state
-        if "target_property_mappings" not in st.session_state:
-            st.session_state["target_property_mappings"] = {}
+        # For existing labels, fetch available properties
+        if label_option == "Existing Label" and target_label:
+            try:
+                # Fetch available properties for the selected target label
+                target_properties = node_properties(target_label)
 
-        # Only show property mapping if properties are selected
-        if match_columns:
-            st.markdown("### Map Properties to Target Node Properties")
-
-            # For existing labels, fetch available properties
-            if label_option == "Existing Label" and target_label:
-                try:
-                    # Fetch available properties for the selected target label
-                    with st.session_state["db_connection"].session() as session:
-                        target_properties = fetch_node_properties(session, target_label)
-
-                    st.markdown(f"Map source properties to existing properties in '{target_label}' nodes")
-
-                    # Create a container for the property mappings
-                    mapping_container = st.container()
-
-                    with mapping_container:
-                        # Create two columns for each property mapping
-                        for prop in match_columns:
-                            col1, col2 = st.columns([1, 1])
-                            with col1:
-                                # Show the source property name (with mapped name if applicable)
-                                mapped_name = st.session_state["property_mappings"].get(prop, prop)
-                                if prop == mapped_name:
-                                    st.text(f"Source: {prop}")
-                                else:
-                                    st.text(f"Source: {prop} → {mapped_name}")
-                            with col2:
-                                # Default to the same property name if it exists in target properties
-                                default_index = target_properties.index(mapped_name) if mapped_name in target_properties else 0
-                                target_prop = st.selectbox(
-                                    f"Target property for {mapped_name}",
-                                    options=target_properties,
-                                    index=default_index,
-                                    key=f"target_mapping_{prop}"
-                                )
-                                # Store the mapping
-                                st.session_state["target_property_mappings"][prop] = target_prop
-                except Exception as e:
-                    st.error(f"Error fetching properties for {target_label}: {e}")
-            else:
-                # For new labels, provide free text input
-                st.markdown(f"Define property names for the new '{target_label}' nodes")
+                st.markdown(f"Map source properties to existing properties in '{target_label}' nodes")
 
                 # Create a container for the property mappings
                 mapping_container = st.container()
@@ -374,171 +466,290 @@ with st.expander("Resolve and define node labels", expanded=False):
                             else:
                                 st.text(f"Source: {prop} → {mapped_name}")
                         with col2:
-                            # Default to the same property name
-                            default_value = st.session_state["target_property_mappings"].get(prop, mapped_name)
-                            target_prop = st.text_input(
-                                f"Target property name for {mapped_name}",
-                                value=default_value,
+                            # Default to the same property name if it exists in target properties
+                            default_index = target_properties.index(mapped_name) if mapped_name in target_properties else 0
+                            target_prop = st.selectbox(
+                                f"Target property for {mapped_name}",
+                                options=target_properties,
+                                index=default_index,
                                 key=f"target_mapping_{prop}"
                             )
                             # Store the mapping
                             st.session_state["target_property_mappings"][prop] = target_prop
+            except Exception as e:
+                st.error(f"Error fetching properties for {target_label}: {e}")
+        else:
+            # For new labels, provide free text input
+            st.markdown(f"Define property names for the new '{target_label}' nodes")
 
-        relationship_type = st.text_input("Define Relationship Type (e.g., STORED_IN):")
-
-        # Submit to database
-        if st.button("Push to Database"):
-            # Validate that a target label is provided if "New Label" is selected
-            if label_option == "New Label" and not target_label:
-                st.error("Please enter a new node label name.")
-                st.stop()
-
-            # Validate that a relationship type is provided
-            if not relationship_type:
-                st.error("Please enter a relationship type.")
-                st.stop()
+            # Create a container for the property mappings
+            mapping_container = st.container()
 
-            with st.spinner("Pushing to database..."):
-                try:
-                    # Generate Neomodel classes dynamically if not already defined
-                    neomodel_map = {}
-                    for _label in st.session_state["entities_df"][st.session_state["label_column"]].unique():
-                        neomodel_map[_label] = {
-                            st.session_state["property_mappings"].get(col, col): 'String' for col in st.session_state["property_columns"]
-                        }
-
-                    # Create a copy of the DataFrame with mapped column names
-                    mapped_df = st.session_state["entities_df"].copy()
-
-                    # Create a dictionary to map original column names to new column names
-                    column_mapping = {}
-                    for col in st.session_state["property_columns"]:
-                        new_name = st.session_state["property_mappings"].get(col, col)
-                        if new_name != col:
-                            column_mapping[col] = new_name
-
-                    # If there are any mappings, rename the columns in the DataFrame
-                    if column_mapping:
-                        # First, create new columns with the mapped names
-                        for old_name, new_name in column_mapping.items():
-                            mapped_df[new_name] = mapped_df[old_name]
-
-                        # Update property_columns to use the new names
-                        mapped_property_columns = [st.session_state["property_mappings"].get(col, col) for col in st.session_state["property_columns"]]
-                    else:
-                        # If no mappings, use the original property columns
-                        mapped_property_columns = st.session_state["property_columns"]
-
-                    # Update match_columns to use the new names if they are in the property_columns
-                    mapped_match_columns = []
-                    for col in match_columns:
-                        if col in st.session_state["property_columns"]:
-                            mapped_match_columns.append(st.session_state["property_mappings"].get(col, col))
+            with mapping_container:
+                # Create two columns for each property mapping
+                for prop in match_columns:
+                    col1, col2 = st.columns([1, 1])
+                    with col1:
+                        # Show the source property name (with mapped name if applicable)
+                        mapped_name = st.session_state["property_mappings"].get(prop, prop)
+                        if prop == mapped_name:
+                            st.text(f"Source: {prop}")
                         else:
-                            # For columns not in property_columns, check if they have a mapping anyway
-                            mapped_match_columns.append(st.session_state["property_mappings"].get(col, col))
-
-                    # Create a mapping from source property names to target property names
-                    target_property_map = {}
-                    for col in match_columns:
-                        source_prop = st.session_state["property_mappings"].get(col, col)
-                        target_prop = st.session_state["target_property_mappings"].get(col, source_prop)
-                        target_property_map[source_prop] = target_prop
-
-                    # Create a list of target property names for the match columns
-                    target_match_columns = []
-                    for col in mapped_match_columns:
-                        target_match_columns.append(target_property_map.get(col, col))
-
-                    # Merge new nodes with existing nodes in the database
-                    merge_nodes_with_existing(
-                        db_connection=st.session_state["db_connection"],
-                        entities_df=mapped_df,
-                        label_column=st.session_state["label_column"],
-                        property_columns=mapped_property_columns,
-                        target_label=target_label,
-                        match_columns=target_match_columns,
-                        relationship_type=relationship_type,
-                        source_to_target_map=target_property_map
-                    )
-
-                    # Success message with specific information about new labels
-                    if label_option == "New Label":
-                        st.success(f"Entities and relationships pushed successfully! New node label '{target_label}' created if it didn't exist.")
-                    else:
-                        st.success("Entities and relationships pushed successfully!")
-                except Exception as e:
-                    st.error(f"Error: {e}")
-
-
-# Add filtering options if entities are loaded
-if st.session_state["entities_df"] is not None:
-    with st.expander("Filter Entities", expanded=False):
-        st.markdown("Filter entities based on column values")
+                            st.text(f"Source: {prop} → {mapped_name}")
+                    with col2:
+                        # Default to the same property name
+                        default_value = st.session_state["target_property_mappings"].get(prop, mapped_name)
+                        target_prop = st.text_input(
+                            f"Target property name for {mapped_name}",
+                            value=default_value,
+                            key=f"target_mapping_{prop}"
+                        )
+                        # Store the mapping
+                        st.session_state["target_property_mappings"][prop] = target_prop
 
-        # Select column to filter on
-        filter_column = st.selectbox(
-            "Select column to filter on:",
-            options=st.session_state["entities_df"].columns,
-            key="filter_column"
-        )
+    relationship_type = st.text_input("Define Relationship Type (e.g., STORED_IN):")
 
-        # Select filter operation
-        filter_operation = st.selectbox(
-            "Filter operation:",
-            options=["==", "!=", ">", "<", ">=", "<=", "contains", "starts with", "ends with"],
-            key="filter_operation"
+    # Fuzzy resolution of near-duplicate keys before the exact MERGE
+    if match_columns:
+        st.markdown("### Resolve Near-Duplicates")
+        st.markdown(
+            "Find keys that differ only in case, punctuation or small typos (`Mouse_07`, `mouse07`), "
+            "among the loaded entities and against existing target nodes, and confirm which to merge."
         )
+        resolution_threshold = st.slider("Similarity threshold:", 0.3, 1.0, DEFAULT_THRESHOLD, 0.05,
+                                         key="resolution_threshold")
+        if st.button("Find Near-Duplicates"):
+            try:
+                existing_keys = None
+                if label_option == "Existing Label" and target_label and st.session_state.connected:
+                    target_props = [
+                        st.session_state["target_property_mappings"].get(
+                            col, st.session_state["property_mappings"].get(col, col))
+                        for col in match_columns
+                    ]
+                    # Existing keys are fetched once per label and properties
+                    cache_key = (target_label, tuple(target_props))
+                    existing_cache = st.session_state.setdefault("resolution_existing", {})
+                    if cache_key not in existing_cache:
+                        with st.session_state["db_connection"].session() as session:
+                            existing_cache[cache_key] = fetch_existing_keys(session, target_label, target_props)
+                    existing_keys = existing_cache[cache_key].set_axis(match_columns, axis=1)
+                with st.spinner("Resolving entities..."):
+                    st.session_state["resolution_clusters"] = resolve_entities(
+                        entities_view, match_columns, existing_keys,
+                        threshold=resolution_threshold
+                    )
+                st.session_state["resolution_match_columns"] = match_columns
+            except Exception as e:
+                st.error(f"Error resolving entities: {e}")
+
+        clusters = st.session_state.get("resolution_clusters")
+        if clusters is not None and st.session_state.get("resolution_match_columns") == match_columns:
+            if clusters.empty:
+                st.info("No near-duplicates found.")
+            else:
+                st.write(f"{len(clusters)} clusters found; untick the ones that are distinct entities:")
+                # The canonical values are mixed-type tuples: keep them out of the editor
+                shown = clusters.drop(columns="canonical_values")
+                edited = st.data_editor(
+                    shown,
+                    disabled=[col for col in shown.columns if col != "merge"],
+                    hide_index=True,
+                    use_container_width=True,
+                    key="resolution_editor"
+                )
+                confirmed = clusters.assign(merge=edited["merge"].to_numpy())
+                if st.button("Apply Confirmed Merges"):
+                    set_entities(apply_resolution(st.session_state["entities_df"], match_columns, confirmed))
+                    st.session_state["resolution_clusters"] = None
+                    st.toast(f"Rewrote {int(confirmed.loc[confirmed['merge'], 'rows'].sum())} rows "
+                             f"to {int(confirmed['merge'].sum())} canonical keys.")
+                    # The table changed: rerun the whole page
+                    st.rerun()
+
+    # Submit to database
+    if st.button("Push to Database"):
+        # Validate that a target label is provided if "New Label" is selected
+        if label_option == "New Label" and not target_label:
+            st.error("Please enter a new node label name.")
+            st.stop()
+
+        # Validate that a relationship type is provided
+        if not relationship_type:
+            st.error("Please enter a relationship type.")
+            st.stop()
+
+        with st.spinner("Pushing to database..."):
+            try:
+                # Generate Neomodel classes dynamically if not already defined
+                neomodel_map = {}
+                for _label in entities_view[st.session_state["label_column"]].unique():
+                    neomodel_map[_label] = {
+                        st.session_state["property_mappings"].get(col, col): 'String' for col in st.session_state["property_columns"]
+                    }
+
+                # Create a dictionary to map new column names to the original ones
+                column_mapping = {}
+                for col in st.session_state["property_columns"]:
+                    new_name = st.session_state["property_mappings"].get(col, col)
+                    if new_name != col:
+                        column_mapping[new_name] = col
+
+                # Property columns under their mapped names
+                mapped_property_columns = [st.session_state["property_mappings"].get(col, col) for col in st.session_state["property_columns"]]
+
+                # Update match_columns to use the new names if they are in the property_columns
+                mapped_match_columns = []
+                for col in match_columns:
+                    if col in st.session_state["property_columns"]:
+                        mapped_match_columns.append(st.session_state["property_mappings"].get(col, col))
+                    else:
+                        # For columns not in property_columns, check if they have a mapping anyway
+                        mapped_match_columns.append(st.session_state["property_mappings"].get(col, col))
+
+                # Create a mapping from source property names to target property names
+                target_property_map = {}
+                for col in match_columns:
+                    source_prop = st.session_state["property_mappings"].get(col, col)
+                    target_prop = st.session_state["target_property_mappings"].get(col, source_prop)
+                    target_property_map[source_prop] = target_prop
+
+                # Create a list of target property names for the match columns
+                target_match_columns = []
+                for col in mapped_match_columns:
+                    target_match_columns.append(target_property_map.get(col, col))
+
+                # Only the pushed columns, under their mapped names; the data is shared, not copied
+                mapped_df = renamed_view(
+                    entities_view,
+                    [st.session_state["label_column"]] + mapped_property_columns + target_match_columns,
+                    column_mapping
+                )
 
-        # Input filter value
-        filter_value = st.text_input("Filter value:", key="filter_value")
-
-        # Apply filter button
-        if st.button("Apply Filter"):
-            if filter_value:
-                # Create a filtered copy of the DataFrame
-                original_df = st.session_state["entities_df"].copy()
-
-                # Apply the filter based on the selected operation
-                if filter_operation == "==":
-                    filtered_df = original_df[original_df[filter_column].astype(str) == filter_value]
-                elif filter_operation == "!=":
-                    filtered_df = original_df[original_df[filter_column].astype(str) != filter_value]
-                elif filter_operation == ">":
-                    filtered_df = original_df[pd.to_numeric(original_df[filter_column], errors='coerce') > float(filter_value)]
-                elif filter_operation == "<":
-                    filtered_df = original_df[pd.to_numeric(original_df[filter_column], errors='coerce') < float(filter_value)]
-                elif filter_operation == ">=":
-                    filtered_df = original_df[pd.to_numeric(original_df[filter_column], errors='coerce') >= float(filter_value)]
-                elif filter_operation == "<=":
-                    filtered_df = original_df[pd.to_numeric(original_df[filter_column], errors='coerce') <= float(filter_value)]
-                elif filter_operation == "contains":
-                    filtered_df = original_df[original_df[filter_column].astype(str).str.contains(filter_value, na=False)]
-                elif filter_operation == "starts with":
-                    filtered_df = original_df[original_df[filter_column].astype(str).str.startswith(filter_value, na=False)]
-                elif filter_operation == "ends with":
-                    filtered_df = original_df[original_df[filter_column].astype(str).str.endswith(filter_value, na=False)]
-
-                # Update the DataFrame in session state
-                st.session_state["entities_df"] = filtered_df
-                st.success(f"Filter applied. {len(filtered_df)} entities match the filter.")
-
-        # Reset filter button
-        if st.button("Reset Filter"):
-            if "original_entities_df" in st.session_state:
-                st.session_state["entities_df"] = st.session_state["original_entities_df"].copy()
-                st.success("Filter reset. Showing all entities.")
-
-    # Store original DataFrame for reset functionality if not already stored
-    if "original_entities_df" not in st.session_state:
-        st.session_state["original_entities_df"] = st.session_state["entities_df"].copy()
-
-### pasting from 03 _ relate.py (current file was previously 2_resolve
+                # Merge new nodes with existing nodes in the database
+                merge_nodes_with_existing(
+                    db_connection=st.session_state["db_connection"],
+                    entities_df=mapped_df,
+                    label_column=st.session_state["label_column"],
+                    property_columns=mapped_property_columns,
+                    target_label=target_label,
+                    match_columns=target_match_columns,
+                    relationship_type=relationship_type,
+                    source_to_target_map=target_property_map
+                )
 
-# Title and description
-st.header("Structure")
+                # New labels and properties show up in the pickers right away
+                forget_schema()
 
-with st.expander("Assemble ontology, taxonomy, or schema using properties", expanded=False):
+                # Success message with specific information about new labels
+                if label_option == "New Label":
+                    st.success(f"Entities and relationships pushed successfully! New node label '{target_label}' created if it didn't exist.")
+                else:
+                    st.success("Entities and relationships pushed successfully!")
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+
+@st.fragment
+def path_rule_extraction():
+    """Edit, preview and apply path label rules."""
+    st.markdown(
+        "Turn paths into labeled entities. A **template** such as "
+        "`/data/{study}/{subject}/day{session}/{modality}` gives one column per `{field}` "
+        "(`{session:\\d+}` matches a custom expression); a **regex** gives one column per named group. "
+        "Rules are tried in order and the first match wins."
+    )
+    if "path_rules" not in st.session_state:
+        st.session_state["path_rules"] = pd.DataFrame([
+            {"label": "Session", "kind": "template", "expression": "{subject}/ses-{session}", "type": "Directory"}
+        ])
+    edited_rules = st.data_editor(
+        st.session_state["path_rules"],
+        column_config={
+            "kind": st.column_config.SelectboxColumn("kind", options=["template", "regex", "glob"], required=True),
+            "type": st.column_config.SelectboxColumn("type", options=["", "Directory", "File", "Dataset", "Archive"]),
+        },
+        num_rows="dynamic",
+        hide_index=True,
+        key="path_rules_editor"
+    )
+    kind_keys = {"template": "template", "regex": "pattern", "glob": "glob"}
+    rule_dicts = [
+        {"label": row["label"], kind_keys.get(row["kind"], "template"): row["expression"], "type": row.get("type") or None}
+        for row in edited_rules.fillna("").to_dict("records") if row["label"] and row["expression"]
+    ]
+
+    preview_col, run_col = st.columns(2)
+    with preview_col:
+        if st.button("Preview Match Rates", disabled=not rule_dicts):
+            try:
+                summary, sample_entities = preview_label_rules(filtered_entities(), rule_dicts)
+                st.session_state["path_rules"] = edited_rules
+                st.session_state["path_rules_preview"] = (summary, sample_entities)
+            except ValueError as e:
+                st.error(str(e))
+    extracted_entities = False
+    with run_col:
+        if st.button("Extract Entities", disabled=not rule_dicts):
+            try:
+                compiled = compile_rules(rule_dicts)
+                with st.spinner(f"Matching {len(filtered_entities()):,} paths..."):
+                    extracted = apply_label_rules(filtered_entities(), compiled, workers=DEFAULT_WORKERS)
+                st.session_state["path_rules"] = edited_rules
+                st.session_state["path_rules_preview"] = None
+                set_entities(extracted.reset_index(drop=True))
+                st.session_state["file_uploaded"] = f"{st.session_state['file_uploaded']} (path rules)"
+                st.toast(f"Extracted {len(extracted):,} entities.")
+                extracted_entities = True
+            except ValueError as e:
+                st.error(str(e))
+    if extracted_entities:
+        st.rerun()
+
+    if st.session_state.get("path_rules_preview"):
+        summary, sample_entities = st.session_state["path_rules_preview"]
+        st.write(f"Match rates on a sample of up to {DEFAULT_SAMPLE_SIZE:,} rows:")
+        st.dataframe(summary.assign(match_rate=summary["match_rate"] * 100), column_config={
+            "match_rate": st.column_config.ProgressColumn("Match Rate", min_value=0.0, max_value=100.0, format="%.1f%%")
+        }, hide_index=True, use_container_width=True)
+        st.dataframe(sample_entities.head(100), use_container_width=True)
+
+
+@st.fragment
+def entity_filter_editor(columns):
+    """Edit the entity filter over `columns`; applying or resetting it reruns the whole page."""
+    st.markdown(
+        "Filter entities based on column values. Conditions in the same group must all match (AND); "
+        "an entity is kept when any group matches (OR)."
+    )
+
+    # The editor keeps its rows across reruns under its key
+    filter_tree = filter_from_rows(
+        predicate_editor(EMPTY_PREDICATES, columns, "filter_predicates_editor")
+    )
+
+    apply_col, reset_col = st.columns(2)
+    with apply_col:
+        apply_clicked = st.button("Apply Filter", disabled=filter_tree is None)
+    with reset_col:
+        reset_clicked = st.button("Reset Filter")
+    # Editing predicates reruns only this fragment; the filtered tables above update on a full rerun
+    if apply_clicked:
+        apply_entity_filter(filter_tree)
+        st.rerun()
+    if reset_clicked:
+        reset_entity_filter()
+        st.rerun()
+
+    if st.session_state.get("filter_message"):
+        level, message = st.session_state["filter_message"]
+        getattr(st, level)(message)
+
+
+@st.fragment
+def taxonomy_builder():
+    """Choose taxonomy levels and show the grouped taxonomy."""
+    loaded = False
     # Create two columns layout
     col1, col2 = st.columns(2)
 
@@ -581,11 +792,9 @@ with st.expander("Assemble ontology, taxonomy, or schema using properties", expa
 
                     if uploaded_file:
                         try:
-                            if file_type == "CSV":
-                                st.session_state["entities_df"] = pd.read_csv(uploaded_file)
-                            else:  # JSON
-                                st.session_state["entities_df"] = pd.read_json(uploaded_file)
-                            st.success(f"{file_type} file loaded successfully!")
+                            if load_entities_file(uploaded_file, file_type, uploaded_file.name):
+                                st.toast(f"{file_type} file loaded successfully!")
+                                loaded = True
                         except Exception as e:
                             st.error(f"Error loading file: {e}")
 
@@ -595,13 +804,13 @@ with st.expander("Assemble ontology, taxonomy, or schema using properties", expa
 
                     if uploaded_excel:
                         try:
-                            xls = pd.ExcelFile(uploaded_excel)
-                            sheet_names = xls.sheet_names
+                            sheet_names = list_excel_sheets(uploaded_excel)
                             selected_sheet = st.selectbox("Select sheet:", options=sheet_names)
 
                             if st.button("Load Sheet"):
-                                st.session_state["entities_df"] = pd.read_excel(uploaded_excel, sheet_name=selected_sheet)
-                                st.success(f"Excel sheet '{selected_sheet}' loaded successfully!")
+                                loaded = load_entities_file(uploaded_excel, "Excel", f"{uploaded_excel.name} (Sheet: {selected_sheet})",
+                                                            sheet_name=selected_sheet, force=True)
+                                st.toast(f"Excel sheet '{selected_sheet}' loaded successfully!")
                         except Exception as e:
                             st.error(f"Error loading Excel file: {e}")
 
@@ -609,11 +818,11 @@ with st.expander("Assemble ontology, taxonomy, or schema using properties", expa
 
         elif data_source == "Database":
             # Fetch available node labels from Neo4j
-            st.session_state["available_entity_labels"] = fetch_entity_labels(st.session_state["db_connection"].session())
+            st.session_state["available_entity_labels"] = database_labels()
             # Allow the user to select a label type
             entity_label = st.selectbox("Select Node Label to Use:", st.session_state["available_entity_labels"])
             if entity_label:
-                st.session_state["entity_properties"] = fetch_node_properties(st.session_state["db_connection"].session(), entity_label)
+                st.session_state["entity_properties"] = node_properties(entity_label)
                 entities_df = pd.DataFrame(columns=st.session_state['entity_properties'])
 
     # Move back to full width for the taxonomy creation
@@ -653,43 +862,23 @@ with st.expander("Assemble ontology, taxonomy, or schema using properties", expa
                     if st.button("Pull Entities from Database"):
                         entities_df = fetch_nodes_with_properties(st.session_state["db_connection"].session(),
                                                                 entity_label, all_selected_keys)
-                        st.session_state["entities_df"] = entities_df
+                        set_entities(entities_df)
+                        loaded = True
 
                 st.session_state["taxonomy_set"] = st.toggle("Set Taxonomy", value=False)
 
                 # Option to save the taxonomy
                 st.subheader("Save Taxonomy")
-                save_format = st.selectbox("Select file format:", ["CSV", "JSON"])
-
                 if st.session_state["taxonomy"] is not None:
-                    if save_format == "CSV":
-                        csv_data = st.session_state["taxonomy"].to_csv(index=False)
-                        st.download_button(
-                            label="Download Taxonomy as CSV",
-                            data=csv_data,
-                            file_name="taxonomy.csv",
-                            mime="text/csv",
-                        )
-                    elif save_format == "JSON":
-                        json_data = st.session_state["taxonomy"].to_json(orient="records")
-                        st.download_button(
-                            label="Download Taxonomy as JSON",
-                            data=json_data,
-                            file_name="taxonomy.json",
-                            mime="application/json",
-                        )
+                    export_button("Taxonomy", lambda: st.session_state["taxonomy"], "taxonomy",
+                                  key="taxonomy", formats=("CSV", "JSON", "Parquet"))
 
             with tax_col2:
                 # Create the taxonomy by grouping the dataframe
                 if st.session_state["taxonomy_keys"]:
                     try:
                         if not st.session_state["taxonomy_set"]:
-                            taxonomy_df = (
-                                st.session_state["entities_df"].groupby(st.session_state["taxonomy_keys"])
-                                .size()
-                                .reset_index(name="Count")
-                            )
-                            st.session_state["taxonomy"] = taxonomy_df
+                            st.session_state["taxonomy"] = entity_taxonomy(st.session_state["taxonomy_keys"])
 
                         # Display the resulting taxonomy
                         st.subheader("**Generated Taxonomy:**")
@@ -716,88 +905,177 @@ with st.expander("Assemble ontology, taxonomy, or schema using properties", expa
                         st.error(f"Error generating taxonomy: {e}")
                 else:
                     st.info("Select keys on the left to build a taxonomy")
+        else:
+            st.warning("No file loaded yet. Please load a file or pull entities from the database.")
 
-                # Option to save the taxonomy in the database
-                st.subheader("Save Taxonomy to Database")
+    # The Entities section shows the new table too
+    if loaded:
+        st.rerun()
+
+
+def taxonomy_source_columns():
+    """Return the columns the Structure section works on (the chosen label's property keys for a database source), or None."""
+    if st.session_state.get("data_source_section2") == "Database":
+        return st.session_state.get("entity_properties")
+    entities_df = st.session_state["entities_df"]
+    return None if entities_df is None else entities_df.columns.tolist()
+
+
+@st.fragment
+def taxonomy_push():
+    """Write the taxonomy to Neo4j and link its leaves to entities."""
+    available_columns = taxonomy_source_columns()
+    if available_columns is None:
+        return
+
+    # Option to save the taxonomy in the database
+    st.subheader("Save Taxonomy to Database")
+
+    # Fetch available entity labels from Neo4j
+    st.session_state["available_entity_labels"] = database_labels()
+
+    # Select fields to match entities
+    available_labels = st.session_state["available_entity_labels"]
+    entity_label = st.selectbox("Select entity label to connect to:",
+                                options=available_labels)
+    match_columns = st.multiselect("Select columns to match with entity nodes:",
+                                options=available_columns)
+    relationship_type = st.text_input("Define Relationship Type (e.g., BELONGS_TO, PART_OF):")
+    taxonomy_write_options = bulk_write_options("taxonomy_push")
+
+    if st.button("Push Taxonomy to Database"):
+        with st.session_state["db_connection"].session() as session:
+            try:
+                taxonomy = st.session_state["taxonomy"]
+                taxonomy_keys = st.session_state["taxonomy_keys"]
+
+                # Taxonomy nodes carry deterministic uids, so levels and their OF links
+                # are MERGEd in batches without looking up node ids first
+                nodes, edges, leaf_uids = build_taxonomy_tables(taxonomy, taxonomy_keys)
+                # Levels pushed before taxonomy nodes had uids are adopted, not duplicated
+                backfill_taxonomy_uids(session, nodes)
+                if taxonomy_write_options is None:
+                    ensure_uid_constraints(session, nodes["label"].unique())
+                    push_nodes(session, nodes)
+                    push_edges(session, edges)
+                else:
+                    container = get_neo4j_container()
+                    if container is None or container.status != "running":
+                        raise RuntimeError("Server-side LOAD CSV needs the managed Neo4j container. Start it on the Connect page.")
+                    load_tables_via_csv(
+                        st.session_state["db_connection"],
+                        container,
+                        nodes,
+                        edges,
+                        **taxonomy_write_options
+                    )
 
-                # Fetch available entity labels from Neo4j
-                st.session_state["available_entity_labels"] = fetch_entity_labels(st.session_state["db_connection"].session())
+                # Match the final node with an existing entity
+                # Use target property names for the match conditions if available
+                if "target_property_mappings" in st.session_state:
+                    # Map source columns to target property names
+                    target_props = []
+                    for i, col in enumerate(match_columns):
+                        source_prop = st.session_state["property_mappings"].get(col, col)
+                        target_prop = st.session_state["target_property_mappings"].get(col, source_prop)
+                        target_props.append(target_prop)
 
-                # Select fields to match entities
-                available_columns = entities_df.columns.tolist() if entities_df is not None else []
-                available_labels = st.session_state["available_entity_labels"]
-                entity_label = st.selectbox("Select entity label to connect to:",
-                                            options=available_labels)
-                match_columns = st.multiselect("Select columns to match with entity nodes:",
-                                            options=available_columns)
-                relationship_type = st.text_input("Define Relationship Type (e.g., BELONGS_TO, PART_OF):")
+                    # Create match conditions using target property names
+                    match_conditions = " AND ".join([f"e.{target_prop} = row.col_{i}" for i, target_prop in enumerate(target_props)])
+                else:
+                    # Fall back to using source property names
+                    mapped_match_columns = [st.session_state["property_mappings"].get(col, col) for col in match_columns]
+                    match_conditions = " AND ".join([f"e.{mapped_col} = row.col_{i}" for i, mapped_col in enumerate(mapped_match_columns)])
 
-                if st.button("Push Taxonomy to Database"):
-                    with st.session_state["db_connection"].session() as session:
-                        try:
-                            for _, row in st.session_state["taxonomy"].iterrows():
-                                _path_id_chain = []
-                                prev_node_id = None
-                                for col in st.session_state["taxonomy_keys"]:
-                                    instance_value = row[col]
-                                    _path_id_chain.append(str(instance_value))
-                                    query = f"""
-                                    MERGE (f:{col} {{is: $instance_value, path_id: $path_id}})
-                                    RETURN id(f) as node_id
-                                    """
-                                    result = session.run(
-                                            query,
-                                            instance_value=instance_value,
-                                            path_id='-'.join(_path_id_chain)
-                                            )
-                                    current_node_id = result.single()["node_id"]
-
-                                    if prev_node_id is not None:
-                                        session.run(
-                                            """
-                                            MATCH (prev), (curr)
-                                            WHERE id(prev) = $prev_id AND id(curr) = $curr_id
-                                            MERGE (prev)<-[:OF]-(curr)
-                                            """,
-                                            prev_id=prev_node_id,
-                                            curr_id=current_node_id
-                                        )
-                                    prev_node_id = current_node_id
-
-                                # Match the final node with an existing entity
-                                # Use target property names for the match conditions if available
-                                if "target_property_mappings" in st.session_state:
-                                    # First get the source property names (with property_mappings applied)
-                                    source_props = [st.session_state["property_mappings"].get(col, col) for col in match_columns]
-
-                                    # Then map to target property names
-                                    target_props = []
-                                    for i, col in enumerate(match_columns):
-                                        source_prop = st.session_state["property_mappings"].get(col, col)
-                                        target_prop = st.session_state["target_property_mappings"].get(col, source_prop)
-                                        target_props.append(target_prop)
-
-                                    # Create match conditions using target property names
-                                    match_conditions = " AND ".join([f"e.{target_prop} = $col_{i}" for i, target_prop in enumerate(target_props)])
-                                else:
-                                    # Fall back to using source property names
-                                    mapped_match_columns = [st.session_state["property_mappings"].get(col, col) for col in match_columns]
-                                    match_conditions = " AND ".join([f"e.{mapped_col} = $col_{i}" for i, mapped_col in enumerate(mapped_match_columns)])
-
-                                # Create parameters using original column names to access values in the row
-                                match_params = {}
-                                for i, col in enumerate(match_columns):
-                                    match_params[f"col_{i}"] = row[col]
-
-                                entity_query = f"""
-                                MATCH (e:{entity_label}) WHERE {match_conditions}
-                                MATCH (t) WHERE id(t) = $final_node_id
-                                MERGE (t)-[:{relationship_type}]->(e)
-                                """
-                                session.run(entity_query, final_node_id=prev_node_id, **match_params)
-
-                            st.success("Taxonomy pushed to database and linked to entities successfully!")
-                        except Exception as e:
-                            st.error(f"Error saving taxonomy: {e}")
-        else:
-            st.warning("No file loaded yet. Please load a file or pull entities from the database.")
+                # One row per leaf, with the values to match read from the taxonomy columns
+                links = pd.DataFrame({"final_uid": leaf_uids})
+                for i, col in enumerate(match_columns):
+                    links[f"col_{i}"] = taxonomy[col]
+
+                entity_query = f"""
+                UNWIND $rows AS row
+                MATCH (e:{entity_label}) WHERE {match_conditions}
+                MATCH (t:`{taxonomy_keys[-1]}` {{uid: row.final_uid}})
+                MERGE (t)-[:{relationship_type}]->(e)
+                """
+                write_rows(session, entity_query, links)
+
+                forget_schema()
+                st.success("Taxonomy pushed to database and linked to entities successfully!")
+            except Exception as e:
+                st.error(f"Error saving taxonomy: {e}")
+
+
+# Title and description
+st.header("Entities")
+
+with st.expander("Resolve and define node labels", expanded=False):
+    # Create two columns layout
+    col1, col2 = st.columns(2)
+
+    # Right column for instructions
+    with col2:
+        st.markdown(
+            """
+            ## Review and Edit Entities
+            1. Load entities from a file or database.
+            2. Select label and properties.
+            3. Review dataset row by row.
+            4. Define relationships and push to the database.
+            """
+        )
+
+    # Left column for functionality
+    with col1:
+        entity_source()
+
+    # Display the dataframe if loaded
+    if st.session_state["entities_df"] is not None:
+        entities_view = filtered_entities()
+        st.markdown(f"`{st.session_state['file_uploaded']}`")
+        st.subheader("Input DataFrame")
+        if entity_filter().tree is not None:
+            st.caption(f"Filtered: {len(entities_view)} of {len(st.session_state['entities_df'])} entities "
+                       f"match {describe_filter(entity_filter().tree)}")
+
+        # Display the DataFrame
+        try:
+            # Try to display the full dataframe
+            st.dataframe(entities_view, use_container_width=True)
+        except Exception as e:
+            if "MessageSizeError" in str(e) or "exceeds the message size limit" in str(e):
+                # If the dataframe is too large, show an abbreviated version
+                st.warning("The data is too large to display in full. Showing abbreviated version (first 1000 rows).")
+
+                # Create an abbreviated dataframe
+                abbreviated_df = entities_view.head(1000)
+                st.dataframe(abbreviated_df, use_container_width=True)
+
+                # Export the full dataset on request
+                export_button("Full Dataset", lambda: entities_view, "entities_data", key="entities")
+            else:
+                # If it's a different error, show it
+                st.error(f"Error displaying data: {e}")
+
+        entity_mapping(entities_view)
+
+
+# Path-pattern entity extraction for scan rows
+if st.session_state["entities_df"] is not None and "Path" in st.session_state["entities_df"].columns:
+    with st.expander("Extract Entities from Paths", expanded=False):
+        path_rule_extraction()
+
+
+# Add filtering options if entities are loaded
+if st.session_state["entities_df"] is not None:
+    with st.expander("Filter Entities", expanded=False):
+        entity_filter_editor(st.session_state["entities_df"].columns)
+
+### pasting from 03 _ relate.py (current file was previously 2_resolve
+
+# Title and description
+st.header("Structure")
+
+with st.expander("Assemble ontology, taxonomy, or schema using properties", expanded=False):
+    taxonomy_builder()
+    taxonomy_push()
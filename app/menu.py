@@ -2,6 +2,7 @@ import streamlit as st
 from pathlib import Path
 from about import about
 from chat import chat
+from utils.sidebar import memory_sidebar, query_governor_sidebar, query_profile_sidebar, track_page
 
 def menu():
     # st.sidebar.markdown("️️🖥️ **Science Data Toolkit**")
@@ -14,4 +15,11 @@ def menu():
         st.Page(chat, title="chat", icon="💬"),
         st.Page(about, title="learn", icon="📖")
     ])
+    # Pages mark the tables they read through `session_frames`; the rest may be spilled afterwards
+    st.session_state["memory_in_use"] = set()
+    track_page(pg.title)
     pg.run()
+    if st.session_state.get("connected"):
+        query_governor_sidebar()
+    query_profile_sidebar()
+    memory_sidebar()
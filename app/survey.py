@@ -1,10 +1,20 @@
 import streamlit as st
-import subprocess
-import json
 from pathlib import Path
 import pandas as pd
-from neomodel import db
-from utils.registry import Folder, File
+from utils.archives import ARCHIVE_PROPERTIES
+from utils.identity import scan_namespace
+from utils.bulk_load import build_scan_tables, build_taxonomy_tables, build_entity_tables
+from utils.admin_import import run_admin_import, register_database
+from utils.database import get_neo4j_container
+from utils.datasets import DATASET_PROPERTIES, collapse_datasets
+from utils.hashing import DEFAULT_WORKERS as HASH_WORKERS, HASH_ALGORITHMS, duplicate_groups, hash_tables
+from utils.jobs import get_job_manager
+from utils.metadata import DEFAULT_WORKERS as METADATA_WORKERS, PYDICOM_AVAILABLE, extractor_names, join_metadata
+from utils.prune import DEFAULT_EXCLUDES, DEFAULT_SKIP_MARKERS, PruneRules
+from utils.sharded_scan import DEFAULT_SHARDS
+from utils.tree_estimate import estimate_tree, suggest_shards
+from utils.watch import DEFAULT_DEBOUNCE, DEFAULT_RESCAN_INTERVAL, WATCHDOG_AVAILABLE, inotify_watch_limit
+from utils.sidebar import bulk_write_options, export_button, job_resources, jobs_panel, session_frames
 
 
 # Initialize session state variables for entity labeling
@@ -15,6 +25,8 @@ if "file_label" not in st.session_state:
 
 st.title("Survey")
 
+session_frames("scanned_files", "file_hashes")
+
 with st.expander("Scan Your FileTree", expanded=True):
     # Create two columns layout
     col1, col2 = st.columns(2)
@@ -61,72 +73,170 @@ with st.expander("Scan Your FileTree", expanded=True):
         # Show the full path
         st.info(f"Output will be saved to: {json_save_path}")
 
+        # Parallel scanning of several roots or of one large root
+        with st.popover("Parallel scan options"):
+            extra_roots = st.text_area(
+                "Additional roots (one per line):",
+                key="scan_extra_roots",
+                help="Scanned together with the folder above, e.g. other instrument volumes."
+            )
+            st.session_state["scan_roots"] = [line.strip() for line in extra_roots.splitlines() if line.strip()]
+            if "scan_shards_input" not in st.session_state:
+                st.session_state["scan_shards_input"] = 1
+            st.session_state["scan_shards"] = st.number_input(
+                "Shards",
+                min_value=1,
+                max_value=64,
+                key="scan_shards_input",
+                help="Top-level directories are weighed by a quick pre-pass and split into this many "
+                     f"balanced shards, each scanned by its own process. 1 runs a single ncdu; "
+                     f"{DEFAULT_SHARDS} uses every core."
+            )
+            st.session_state["scan_pin_mounts"] = st.checkbox(
+                "Keep each shard on one mount",
+                key="scan_pin_mounts_input",
+                help="Shards never mix directories from different volumes."
+            )
+
+        # Subtrees to leave out, applied while walking so they are never read
+        with st.popover("Pruning rules"):
+            use_pruning = st.toggle("Prune while scanning", key="scan_prune_enabled")
+            exclude_text = st.text_area(
+                "Exclude (gitignore-style, relative to the scanned folder):",
+                value="\n".join(DEFAULT_EXCLUDES),
+                key="scan_prune_exclude",
+                help="`/` anchors a pattern to the folder, a trailing `/` matches directories only, "
+                     "`**` spans directories and `!` re-includes."
+            )
+            skip_markers = st.multiselect(
+                "Skip directories containing:",
+                options=DEFAULT_SKIP_MARKERS,
+                default=DEFAULT_SKIP_MARKERS,
+                key="scan_prune_markers",
+                help="conda-meta marks a conda environment, pyvenv.cfg a virtualenv, CACHEDIR.TAG a cache."
+            )
+            max_depth = st.number_input("Max depth (0 = unlimited):", min_value=0, value=0, key="scan_prune_depth")
+            one_file_system = st.checkbox("Do not cross mount boundaries", key="scan_prune_one_fs")
+            min_size = st.number_input("Minimum file size (bytes):", min_value=0, value=0, key="scan_prune_min_size")
+            st.session_state["scan_prune"] = PruneRules(
+                exclude=exclude_text.splitlines(),
+                skip_markers=skip_markers,
+                max_depth=max_depth or None,
+                one_file_system=one_file_system,
+                min_size=min_size
+            ).to_dict() if use_pruning else None
+
+        # Archives are listed from their central directory / headers, never extracted
+        with st.popover("Archives"):
+            list_archives = st.checkbox("List members of zip and tar archives", key="scan_archives_input",
+                                        help="Members become virtual rows below the archive, with their sizes.")
+            compressed_tars = st.checkbox("Include compressed tars (.tar.gz, .tgz, ...)", key="scan_archives_compressed",
+                                          disabled=not list_archives,
+                                          help="Compressed tars can only be listed by decompressing them in full.")
+            st.session_state["scan_archives"] = {"compressed": compressed_tars} if list_archives else None
+
+# Quick estimate before committing to a full scan
+def apply_scan_plan(shards, weights, excludes):
+    st.session_state["scan_shards_input"] = shards
+    st.session_state["scan_weights"] = weights
+    st.session_state["scan_excludes"] = excludes
+
+
+with st.expander("Quick Estimate", expanded=False):
+    est_col1, est_col2 = st.columns(2)
+
+    with est_col2:
+        st.markdown(
+            """
+            ## Quick Estimate
+            Randomly descends into the folder many times and extrapolates (Knuth's
+            tree-size estimator) to estimate how many files and bytes it holds,
+            which extensions dominate, and which top-level directories are largest,
+            after reading only a small fraction of the tree.
+
+            Use the estimate to plan the full scan: how many shards to split it
+            into, and which subtrees to leave out.
+            """
+        )
+
+    with est_col1:
+        time_budget = st.slider("Seconds to spend estimating:", min_value=1, max_value=60, value=5)
+        if st.button("Estimate Tree Size", disabled=not st.session_state["folder"]):
+            with st.spinner("Sampling directories..."):
+                st.session_state["tree_estimate"] = estimate_tree(st.session_state["folder"], time_budget=time_budget)
+
+    estimate = st.session_state.get("tree_estimate")
+    if estimate is not None:
+        files, files_low, files_high = estimate["files"]
+        size, size_low, size_high = estimate["bytes"]
+        metric_cols = st.columns(3)
+        metric_cols[0].metric("Estimated files", f"{files:,.0f}")
+        metric_cols[1].metric("Estimated size (GB)", f"{size / 1e9:,.2f}")
+        metric_cols[2].metric("Probes", f"{estimate['probes']:,}")
+        if files_low is not None:
+            st.caption(
+                f"95% intervals: {files_low:,.0f} - {files_high:,.0f} files, "
+                f"{size_low / 1e9:,.2f} - {size_high / 1e9:,.2f} GB "
+                f"({estimate['directories_listed']:,} directories read in {estimate['seconds']:.1f} s)"
+            )
+
+        mix_col, subtree_col = st.columns(2)
+        with mix_col:
+            st.write("Extension mix:")
+            st.bar_chart(estimate["extensions"].head(15), x="Extension", y="Share")
+        with subtree_col:
+            st.write("Top-level directories (tick to exclude from the full scan):")
+            subtrees = estimate["subtrees"].assign(Exclude=False)
+            edited = st.data_editor(
+                subtrees,
+                disabled=["Path", "Estimated Files", "Estimated Bytes", "Share"],
+                hide_index=True,
+                key="tree_estimate_subtrees"
+            )
+
+        kept = edited[~edited["Exclude"]]
+        suggested = suggest_shards(kept["Estimated Files"].sum())
+        st.info(f"Suggested plan: {suggested} shard(s), excluding {int(edited['Exclude'].sum())} directories.")
+        st.button(
+            "Use This Scan Plan",
+            on_click=apply_scan_plan,
+            args=(
+                suggested,
+                {path: float(files) for path, files in zip(kept["Path"], kept["Estimated Files"]) if files > 0},
+                edited.loc[edited["Exclude"], "Path"].tolist()
+            )
+        )
+
 
-# Function to run NCDU scan with live output
-def run_ncdu_scan():
+# Function to start an NCDU scan as a background job
+def start_ncdu_scan():
     if not st.session_state["folder"]:
         st.error("Please select a folder first.")
         return
 
-    dataset_path = st.session_state["folder"]
-    output_json_path = Path(st.session_state["ncdu_json_path"])
-
     st.session_state["scan_completed"] = False
     st.session_state["ncdu_output"] = ""
 
-    # Use the scrollable container defined at the top of the file
-    status_box = st.empty()
-
-    try:
-        with subprocess.Popen(
-                ["ncdu", "-o", str(output_json_path), dataset_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1
-        ) as process:
-            for line in process.stdout:
-                st.session_state["ncdu_output"] += line
-                # Update the scrollable container with the current output
-                status_box.text_area("Live Output", st.session_state["ncdu_output"], height=300)
-
-        # Check if JSON was created
-        if output_json_path.exists():
-            st.success(f"Scan complete! Results saved to `{output_json_path}`")
-            st.session_state["scan_completed"] = True
-
-            # Run jq transformation
-            jq_filter = 'def c: (arrays | .[0] + {children: [.[1:][] | c]}) // .; last | c'
-            result = subprocess.run(
-                ["jq", jq_filter, str(output_json_path)],
-                text=True,
-                capture_output=True,
-                check=True
-            )
-
-            # Load transformed JSON
-            scan_data = json.loads(result.stdout)
-
-            # Convert to DataFrame
-            def parse_ncdu_json(node, parent_path=""):
-                path = f"{parent_path}/{node['name']}" if parent_path else node["name"]
-                file_info = {
-                    "Path": path,
-                    "Size (Bytes)": node.get("asize", 0),
-                    "Disk Usage (Bytes)": node.get("dsize", 0),
-                    "Type": "Directory" if "children" in node else "File"
-                }
-                parsed_files = [file_info]
-                if "children" in node:
-                    for child in node["children"]:
-                        parsed_files.extend(parse_ncdu_json(child, path))
-                return parsed_files
-
-            parsed_files = parse_ncdu_json(scan_data)
-            st.session_state["scanned_files"] = pd.DataFrame(parsed_files)
-
-    except Exception as e:
-        st.error(f"An error occurred while running NCDU: {e}")
+    excludes = st.session_state.get("scan_excludes", [])
+
+    # The scan runs in a worker thread, so reruns and closed tabs do not interrupt it
+    job = get_job_manager().submit(
+        "scan",
+        {
+            "root": st.session_state["folder"],
+            "roots": st.session_state.get("scan_roots", []),
+            "shards": int(st.session_state.get("scan_shards", 1)),
+            "pin_mounts": st.session_state.get("scan_pin_mounts", False),
+            "weights": st.session_state.get("scan_weights"),
+            "exclude": excludes,
+            "prune": st.session_state.get("scan_prune"),
+            "archives": st.session_state.get("scan_archives"),
+            "extra_args": [arg for path in excludes for arg in ("--exclude", path)],
+            "output_json_path": st.session_state["ncdu_json_path"],
+        },
+        title=f"Scan {st.session_state['folder']}"
+    )
+    st.session_state["survey_scan_attached"] = job.id
 
 # Create expander for scanning functionality
 with st.expander("Run Filesystem Scan", expanded=True):
@@ -150,7 +260,22 @@ with st.expander("Run Filesystem Scan", expanded=True):
 
         # Run scan button
         if st.button("Run NCDU Scan", use_container_width=True):
-            run_ncdu_scan()
+            start_ncdu_scan()
+
+        # Background scans, including ones started before this page was (re)opened
+        scan_job = jobs_panel(kinds=["scan"], key="survey_scan")
+        if scan_job is not None:
+            st.session_state["ncdu_output"] = "\n".join(scan_job.logs)
+            if scan_job.status == "completed" and st.session_state.get("scan_loaded_job") != scan_job.id:
+                try:
+                    st.session_state["scanned_files"] = pd.read_parquet(scan_job.result["scanned_files"])
+                    st.session_state["scan_completed"] = True
+                    st.session_state["scan_loaded_job"] = scan_job.id
+                    # Hashes belong to the scan they were computed for
+                    st.session_state.pop("file_hashes", None)
+                    st.success(f"Scan complete! Results saved to `{scan_job.params['output_json_path']}`")
+                except Exception as e:
+                    st.error(f"An error occurred while loading the scan results: {e}")
 
         # Show scan status if available
         if "ncdu_output" in st.session_state and st.session_state["ncdu_output"]:
@@ -175,6 +300,7 @@ with st.expander("Run Filesystem Scan", expanded=True):
             if st.button("Reset Scan", use_container_width=True):
                 st.session_state["scan_completed"] = False
                 st.session_state["ncdu_output"] = ""
+                st.session_state.pop("survey_scan_attached", None)
                 st.rerun()
 
 # Display scanned results in an expander
@@ -200,7 +326,7 @@ if st.session_state["scan_completed"] and not st.session_state["scanned_files"].
                     abbreviated_df = st.session_state["scanned_files"].head(1000)
                     st.dataframe(abbreviated_df)
 
-                    st.info("Download the complete results using the 'Download Results as CSV' button below.")
+                    st.info("Download the complete results using the 'Prepare Scan Results' button below.")
                 else:
                     # If it's a different error, show it
                     st.error(f"Error displaying results: {e}")
@@ -229,6 +355,7 @@ if st.session_state["scan_completed"] and not st.session_state["scanned_files"].
             if st.button("Use in Map Page", use_container_width=True):
                 # Store the necessary data in session state for the map page
                 st.session_state["entities_df"] = st.session_state["scanned_files"]
+                st.session_state.pop("entities_file", None)
                 st.session_state["file_uploaded"] = "Survey Scan Results"
 
                 # Add label column based on the Type column and user-specified labels
@@ -245,29 +372,101 @@ if st.session_state["scan_completed"] and not st.session_state["scanned_files"].
                 # Add a link to the map page
                 st.markdown("[Go to Map Page](/map)")
 
-            # Add download option
-            if st.button("Download Results as CSV", use_container_width=True):
+            # Export the full results on request
+            export_button("Scan Results", lambda: st.session_state["scanned_files"], "scan_results",
+                          key="scan_results")
+
+# Optional content hashing stage for duplicate detection
+if st.session_state["scan_completed"] and not st.session_state["scanned_files"].empty:
+    with st.expander("Find Duplicate Files", expanded=False):
+        hash_col1, hash_col2 = st.columns(2)
+
+        with hash_col2:
+            st.markdown(
+                """
+                ## Find Duplicate Files
+                1. **Choose what to hash** - By default only files sharing their size with another file are read.
+                2. **Run hashing** - Files are hashed in parallel; unchanged files are reused from the hash cache.
+                3. **Push with the scan** - Hashes become `File` properties and copies get `DUPLICATE_OF` links.
+                """
+            )
+
+        with hash_col1:
+            st.subheader("Content Hashing")
+            hash_algorithm = st.selectbox("Hash algorithm:", HASH_ALGORITHMS, key="hash_algorithm")
+            hash_workers = st.number_input("Worker processes:", min_value=1, value=HASH_WORKERS, key="hash_workers")
+            hash_all = st.checkbox("Hash every file", value=False, key="hash_all",
+                                   help="Also hash files whose size is unique, e.g. to record checksums for all files.")
+
+            if st.button("Hash Files", use_container_width=True):
+                job = get_job_manager().submit(
+                    "hash",
+                    {"algorithm": hash_algorithm, "workers": int(hash_workers), "hash_all": hash_all},
+                    title=f"Hash {len(st.session_state['scanned_files'])} scanned items",
+                    inputs={"scanned_files": st.session_state["scanned_files"]}
+                )
+                st.session_state["survey_hash_attached"] = job.id
+
+            hash_job = jobs_panel(kinds=["hash"], key="survey_hash")
+            if hash_job is not None and hash_job.status == "completed" and \
+                    st.session_state.get("hash_loaded_job") != hash_job.id:
                 try:
-                    # Try to convert the dataframe to CSV and create a download button
-                    csv_data = st.session_state["scanned_files"].to_csv(index=False)
-                    st.download_button(
-                        label="Download CSV",
-                        data=csv_data,
-                        file_name="scan_results.csv",
-                        mime="text/csv",
-                    )
+                    st.session_state["file_hashes"] = pd.read_parquet(hash_job.result["hashes"])
+                    st.session_state["hash_loaded_job"] = hash_job.id
                 except Exception as e:
-                    if "MessageSizeError" in str(e) or "exceeds the message size limit" in str(e):
-                        # If the CSV data is too large, suggest alternative approaches
-                        st.warning("The scan results are too large to download directly. Consider these alternatives:")
-                        st.info("""
-                        1. Filter the data to reduce its size before downloading
-                        2. Export in smaller batches
-                        3. Use the database export functionality for very large datasets
-                        """)
-                    else:
-                        # If it's a different error, show it
-                        st.error(f"Error preparing download: {e}")
+                    st.error(f"An error occurred while loading the hashes: {e}")
+
+            if st.session_state.get("file_hashes") is not None:
+                groups = duplicate_groups(st.session_state["file_hashes"], st.session_state["scanned_files"])
+                st.metric("Duplicate groups", len(groups))
+                st.metric("Redundant size (GB)", round(groups["redundant_bytes"].sum() / 1e9, 2) if len(groups) else 0)
+                st.dataframe(groups.head(1000), use_container_width=True)
+
+# Optional header-only metadata extraction for imaging files
+if st.session_state["scan_completed"] and not st.session_state["scanned_files"].empty:
+    with st.expander("Extract Imaging Metadata", expanded=False):
+        meta_col1, meta_col2 = st.columns(2)
+
+        with meta_col2:
+            st.markdown(
+                """
+                ## Extract Imaging Metadata
+                1. **Choose formats** - DICOM, NIfTI, TIFF and Bruker ParaVision headers are read; pixel data never is.
+                2. **Run extraction** - Headers are read in parallel as a background job.
+                3. **Use the columns** - Modality, subject, dimensions, voxel size (mm) and acquisition date
+                   are added to the scan results, ready to map to node properties.
+                """
+            )
+
+        with meta_col1:
+            st.subheader("Header Metadata")
+            metadata_formats = st.multiselect("Formats:", extractor_names(), default=extractor_names(),
+                                              key="metadata_formats")
+            if "DICOM" in metadata_formats and not PYDICOM_AVAILABLE:
+                st.info("Install `pydicom` to read DICOM headers; DICOM files are only recognised without it.")
+            metadata_workers = st.number_input("Worker processes:", min_value=1, value=METADATA_WORKERS,
+                                               key="metadata_workers")
+
+            if st.button("Extract Metadata", use_container_width=True, disabled=not metadata_formats):
+                job = get_job_manager().submit(
+                    "metadata",
+                    {"formats": metadata_formats, "workers": int(metadata_workers)},
+                    title=f"Read headers in {len(st.session_state['scanned_files'])} scanned items",
+                    inputs={"scanned_files": st.session_state["scanned_files"]}
+                )
+                st.session_state["survey_metadata_attached"] = job.id
+
+            metadata_job = jobs_panel(kinds=["metadata"], key="survey_metadata")
+            if metadata_job is not None and metadata_job.status == "completed" and \
+                    st.session_state.get("metadata_loaded_job") != metadata_job.id:
+                try:
+                    metadata = pd.read_parquet(metadata_job.result["metadata"])
+                    st.session_state["scanned_files"] = join_metadata(st.session_state["scanned_files"], metadata)
+                    st.session_state["metadata_loaded_job"] = metadata_job.id
+                    st.success(f"Added header metadata for {len(metadata)} files to the scan results.")
+                    st.dataframe(metadata["format"].value_counts())
+                except Exception as e:
+                    st.error(f"An error occurred while loading the metadata: {e}")
 
 # Database push functionality in an expander with two columns
 if st.session_state["scan_completed"] and not st.session_state["scanned_files"].empty:
@@ -294,49 +493,207 @@ if st.session_state["scan_completed"] and not st.session_state["scanned_files"].
             st.subheader("Step 5: Pushing Data to Neo4j")
 
             include_files = st.checkbox("Include Files", value=False)
+            collapse = st.checkbox(
+                "Collapse instrument datasets", value=True,
+                help="Bruker ParaVision experiments, DICOM series and Zarr stores become one Dataset node "
+                     "with file counts, sizes and a file manifest, instead of a node per file."
+            )
+            has_hashes = st.session_state.get("file_hashes") is not None
+            include_hashes = st.checkbox("Include content hashes and duplicates", value=has_hashes,
+                                         disabled=not (has_hashes and include_files))
+            namespace = st.text_input(
+                "Namespace (host or volume name):",
+                value=scan_namespace(),
+                help="Node ids are derived from this namespace and the path, so re-pushing a scan updates the same nodes."
+            )
+            write_options = bulk_write_options("survey_push")
             st.write("Total items to push:", len(st.session_state["scanned_files"]))
 
             if st.button("Push to Database"):
                 st.success(f"Include files: {include_files}")
                 try:
-                    # Progress bar outside columns to span full width
-                    with st.container():
-                        first_file = True
-                        # TODO: Fix filter here for on/off switch
-                        bar_total = len(st.session_state["scanned_files"])
-                        my_bar = st.progress(0., text="Pushing Filetrees to Database...")
-                        for _, row in st.session_state["scanned_files"].iterrows():
-                            progress_ratio = (float(_)/bar_total)
-                            if progress_ratio > 1:
-                                progress_ratio = 1
-                            if progress_ratio < 0:
-                                progress_ratio = 0
-                            my_bar.progress(progress_ratio, f"{int(100*progress_ratio)}%")
-                            path = Path(row["Path"]).as_posix()
-                            size = row["Size (Bytes)"]
-                            disk_usage = row["Disk Usage (Bytes)"]
-                            parent_path = Path(path).parent.as_posix()
-
-                            with db.transaction:
-                                parent_folder = Folder.nodes.first_or_none(filepath=parent_path)
-                                if parent_folder is None:
-                                    parent_folder = Folder(filepath=parent_path).save()
-
-                                if row["Type"] == "Directory":
-                                    folder_node = Folder.nodes.first_or_none(filepath=path)
-                                    if folder_node is None:
-                                        folder_node = Folder(filepath=path).save()
-                                        if parent_folder:
-                                            folder_node.is_in.connect(parent_folder)
-
-                                if include_files:
-                                    if row["Type"] == "File":
-                                        file_node = File.nodes.first_or_none(filepath=path)
-                                        if file_node is None:
-                                            file_node = File(filepath=path).save()
-                                            if parent_folder:
-                                                file_node.is_in.connect(parent_folder)
-
-                        st.success("Data successfully pushed to Neo4j!")
+                    scan_rows = st.session_state["scanned_files"]
+                    if collapse:
+                        scan_rows, datasets = collapse_datasets(scan_rows)
+                        if not datasets.empty:
+                            st.info(f"Collapsed {len(st.session_state['scanned_files']) - len(scan_rows)} items "
+                                    f"into {len(datasets)} datasets.")
+                    nodes, edges = build_scan_tables(
+                        scan_rows,
+                        scan_namespace(namespace),
+                        include_files=include_files,
+                        property_columns=DATASET_PROPERTIES + ARCHIVE_PROPERTIES
+                    )
+                    if include_files and include_hashes and has_hashes:
+                        # Files inside collapsed datasets have no node of their own
+                        hashes = st.session_state["file_hashes"]
+                        hashes = hashes[hashes["Path"].isin(scan_rows["Path"])]
+                        hash_nodes, hash_edges = hash_tables(hashes, scan_namespace(namespace))
+                        nodes = pd.concat([nodes, hash_nodes], ignore_index=True).drop_duplicates("uid", keep="last")
+                        edges = pd.concat([edges, hash_edges], ignore_index=True)
+                    resources = job_resources()
+                    if write_options is not None and (
+                            resources["container"] is None or resources["container"].status != "running"):
+                        st.error("Server-side LOAD CSV needs the managed Neo4j container. Start it on the Connect page.")
+                    else:
+                        # The tables are saved with the job, so a failed push can be resumed from its checkpoint
+                        job = get_job_manager().submit(
+                            "push",
+                            {"write_options": write_options},
+                            title=f"Push {len(nodes)} folders/files",
+                            resources=resources,
+                            inputs={"nodes": nodes, "edges": edges}
+                        )
+                        st.session_state["survey_push_attached"] = job.id
                 except Exception as e:
                     st.error(f"An error occurred while pushing data to Neo4j: {e}")
+
+            push_job = jobs_panel(kinds=["push"], key="survey_push")
+            if push_job is not None and push_job.status == "completed":
+                st.success(f"Data successfully pushed to Neo4j! {push_job.checkpoint.get('rows_committed', 0)} rows committed.")
+
+# Watch mode: keep the surveyed folder in sync with the graph
+if st.session_state["scan_completed"] and not st.session_state["scanned_files"].empty:
+    with st.expander("Keep in Sync (Watch Mode)", expanded=False):
+        watch_col1, watch_col2 = st.columns(2)
+
+        with watch_col2:
+            st.markdown(
+                """
+                ## Keep in Sync
+                For active acquisition folders, new, moved and deleted files reach the graph within seconds:
+                1. **Push the scan first** - Watching updates the nodes a push created.
+                2. **Start watching** - Filesystem events are collected into batches and written together.
+                3. **Cancel to stop** - The watch runs as a background job until it is cancelled.
+
+                When the folder has more directories than the system's inotify watch limit, the
+                watch rescans periodically instead, only re-reading directories that changed.
+                """
+            )
+
+        with watch_col1:
+            st.subheader("Watch Mode")
+            watch_namespace = st.text_input("Namespace (host or volume name):", value=scan_namespace(),
+                                            key="watch_namespace",
+                                            help="Use the namespace the scan was pushed with.")
+            watch_files = st.checkbox("Include Files", value=False, key="watch_include_files")
+            watch_debounce = st.number_input("Batch after quiet period (seconds):", min_value=0.5, value=DEFAULT_DEBOUNCE,
+                                             key="watch_debounce")
+            watch_interval = st.number_input("Rescan interval when polling (seconds):", min_value=10.,
+                                             value=DEFAULT_RESCAN_INTERVAL, key="watch_interval")
+            limit = inotify_watch_limit()
+            directories = int((st.session_state["scanned_files"]["Type"] == "Directory").sum())
+            if not WATCHDOG_AVAILABLE or (limit is not None and directories > limit):
+                st.info("Filesystem events are unavailable here; the watch will poll for changes.")
+
+            if st.button("Start Watching", use_container_width=True):
+                resources = job_resources()
+                if resources["driver"] is None:
+                    st.error("Connect to a database on the Connect page first.")
+                else:
+                    job = get_job_manager().submit(
+                        "watch",
+                        {
+                            "roots": [st.session_state["folder"]] + st.session_state.get("scan_roots", []),
+                            "namespace": scan_namespace(watch_namespace),
+                            "include_files": watch_files,
+                            "prune": st.session_state.get("scan_prune"),
+                            "debounce": watch_debounce,
+                            "rescan_interval": watch_interval,
+                            "expected_directories": directories,
+                        },
+                        title=f"Watch {st.session_state['folder']}",
+                        resources=resources
+                    )
+                    st.session_state["survey_watch_attached"] = job.id
+
+            jobs_panel(kinds=["watch"], key="survey_watch")
+
+# Offline initial load into a fresh database
+if st.session_state["scan_completed"] and not st.session_state["scanned_files"].empty:
+    with st.expander("Initial Load (neo4j-admin import)", expanded=False):
+        init_col1, init_col2 = st.columns(2)
+
+        with init_col2:
+            st.markdown(
+                """
+                ## Initial Load
+                For the first load of a large archive, `neo4j-admin database import` is much faster
+                than pushing in transactions.
+                1. **Name a new database** - The import always creates a fresh database.
+                2. **Add optional tables** - Entities and the taxonomy from the Map page.
+                3. **Run the import** - It runs inside the managed Neo4j container.
+
+                Node ids are deterministic, so later pushes update the imported nodes in place.
+                """
+            )
+
+        with init_col1:
+            st.subheader("Initial Load")
+            import_database = st.text_input("New database name:", value="survey", key="admin_import_database")
+            import_namespace = st.text_input("Namespace (host or volume name):", value=scan_namespace(),
+                                             key="admin_import_namespace")
+            import_files = st.checkbox("Include Files", value=True, key="admin_import_files")
+
+            has_taxonomy = st.session_state.get("taxonomy") is not None and bool(st.session_state.get("taxonomy_keys"))
+            import_taxonomy = st.checkbox("Include taxonomy from the Map page", value=False,
+                                          disabled=not has_taxonomy, key="admin_import_taxonomy")
+
+            entities_df = st.session_state.get("entities_df")
+            has_entities = (entities_df is not None and st.session_state.get("label_column")
+                            and st.session_state.get("property_columns"))
+            import_entities = st.checkbox("Include entities from the Map page", value=False,
+                                          disabled=not has_entities, key="admin_import_entities")
+            entity_keys = []
+            if import_entities:
+                entity_keys = st.multiselect("Columns identifying an entity:",
+                                             options=st.session_state["property_columns"],
+                                             key="admin_import_entity_keys")
+
+            if st.button("Run Initial Import", use_container_width=True):
+                container = get_neo4j_container()
+                if container is None or container.status != "running":
+                    st.error("The initial import needs the managed Neo4j container. Start it on the Connect page.")
+                else:
+                    try:
+                        # The Map page's tables may have been spilled to disk since it last ran
+                        session_frames("entities_df", "taxonomy")
+                        entities_df = st.session_state.get("entities_df")
+                        with st.spinner("Preparing import files..."):
+                            node_tables, edge_tables = [], []
+                            nodes, edges = build_scan_tables(st.session_state["scanned_files"],
+                                                             scan_namespace(import_namespace),
+                                                             include_files=import_files)
+                            node_tables.append(nodes)
+                            edge_tables.append(edges)
+                            if import_taxonomy:
+                                nodes, edges, _ = build_taxonomy_tables(st.session_state["taxonomy"],
+                                                                        st.session_state["taxonomy_keys"])
+                                node_tables.append(nodes)
+                                edge_tables.append(edges)
+                            if import_entities:
+                                nodes, edges = build_entity_tables(entities_df,
+                                                                   st.session_state["label_column"],
+                                                                   st.session_state["property_columns"],
+                                                                   entity_keys,
+                                                                   st.session_state.get("property_mappings"))
+                                node_tables.append(nodes)
+
+                        with st.spinner(f"Importing into database '{import_database}'..."):
+                            output = run_admin_import(
+                                container,
+                                pd.concat(node_tables, ignore_index=True),
+                                pd.concat(edge_tables, ignore_index=True),
+                                import_database,
+                                legacy=str(st.session_state.get("neo4j_version", "")).startswith("4.")
+                            )
+                        st.text_area("Import Output", output, height=200)
+
+                        registered, message = register_database(st.session_state["db_connection"], import_database)
+                        if registered:
+                            st.session_state.selected_db = import_database
+                            st.success(message)
+                        else:
+                            st.warning(message)
+                    except Exception as e:
+                        st.error(f"An error occurred during the initial import: {e}")
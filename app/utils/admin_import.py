@@ -0,0 +1,192 @@
+"""
+Offline initial loads with `neo4j-admin database import`.
+
+For the first load of a large survey, transactional writes are orders of
+magnitude slower than the offline importer. This module turns the node/edge
+tables from `utils.bulk_load` into the header and data CSV files the importer
+expects, runs it inside the managed Neo4j container into a fresh database, and
+creates that database so it shows up in the database selector.
+
+Node ids are the deterministic uids, so the imported graph can later be
+updated in place by the regular (MERGE on uid) pushes.
+"""
+import re
+import shutil
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+from utils.server_import import (
+    CONTAINER_DEFAULT_IMPORT_DIR, CONTAINER_IMPORT_MOUNT, DEFAULT_IMPORT_DIR,
+    mounted_import_dir, safe_file_name, stage_files
+)
+
+# pandas inferred dtype -> neo4j-admin header type (strings need no suffix)
+_HEADER_TYPES = {
+    "integer": "long",
+    "floating": "double",
+    "mixed-integer-float": "double",
+    "decimal": "double",
+    "boolean": "boolean",
+}
+
+# Neo4j database names: ASCII letters, digits, dots and dashes, starting with a letter
+DATABASE_NAME_PATTERN = re.compile(r"^[a-z][a-z0-9.-]{2,62}$")
+
+
+def _header_field(name, series):
+    header_type = _HEADER_TYPES.get(pd.api.types.infer_dtype(series, skipna=True))
+    return f"{name}:{header_type}" if header_type else name
+
+
+def validate_database_name(name):
+    """Raise ValueError unless `name` is a valid name for a new Neo4j database."""
+    if not DATABASE_NAME_PATTERN.match(name or ""):
+        raise ValueError(
+            "Database names must be 3-63 characters of lowercase letters, digits, dots or dashes, "
+            "starting with a letter."
+        )
+    if name in ("system", "neo4j"):
+        raise ValueError(f"'{name}' is reserved; choose a new database name.")
+
+
+def write_admin_import_files(nodes, edges, directory, prefix):
+    """
+    Write header and data files for `neo4j-admin database import`.
+
+    One header/data pair is written per node label and per relationship type.
+    Nodes share one ID space, keyed by `uid`, which is also stored as a property.
+
+    Args:
+        nodes (pd.DataFrame): Node table from `utils.bulk_load`.
+        edges (pd.DataFrame): Edge table from `utils.bulk_load`.
+        directory (Path): Directory to write into.
+        prefix (str): Prefix for the file names.
+
+    Returns:
+        dict: {"nodes": [(header, data), ...], "relationships": [(header, data), ...]}
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    files = {"nodes": [], "relationships": []}
+
+    for label, group in nodes.groupby("label", sort=False):
+        # Columns another label brought into the combined table are empty here
+        frame = group.drop(columns="label").dropna(axis=1, how="all")
+        frame = frame[["uid"] + [col for col in frame.columns if col != "uid"]].assign(**{":LABEL": label})
+
+        fields = ["uid:ID"] + [_header_field(col, frame[col]) for col in frame.columns[1:-1]] + [":LABEL"]
+        header = f"{prefix}_nodes_{safe_file_name(label)}_header.csv"
+        data = f"{prefix}_nodes_{safe_file_name(label)}.csv"
+        pd.DataFrame(columns=fields).to_csv(directory / header, index=False)
+        frame.to_csv(directory / data, index=False, header=False)
+        files["nodes"].append((header, data))
+
+    for rel_type, group in edges.groupby("type", sort=False):
+        header = f"{prefix}_rels_{safe_file_name(rel_type)}_header.csv"
+        data = f"{prefix}_rels_{safe_file_name(rel_type)}.csv"
+        pd.DataFrame(columns=[":START_ID", ":END_ID", ":TYPE"]).to_csv(directory / header, index=False)
+        group[["start_uid", "end_uid", "type"]].to_csv(directory / data, index=False, header=False)
+        files["relationships"].append((header, data))
+
+    return files
+
+
+def admin_import_command(files, database, import_dir, legacy=False):
+    """
+    Build the `neo4j-admin` command line for the written files.
+
+    Args:
+        files (dict): Output of `write_admin_import_files`.
+        database (str): Name of the database to create.
+        import_dir (str): Directory holding the files, as seen inside the container.
+        legacy (bool): Use the Neo4j 4.x `neo4j-admin import` syntax.
+
+    Returns:
+        list: Command arguments.
+    """
+    def _group(pair):
+        return ",".join(f"{import_dir}/{name}" for name in pair)
+
+    if legacy:
+        command = ["neo4j-admin", "import", f"--database={database}"]
+    else:
+        command = ["neo4j-admin", "database", "import", "full"]
+    command += [f"--nodes={_group(pair)}" for pair in files["nodes"]]
+    command += [f"--relationships={_group(pair)}" for pair in files["relationships"]]
+    command += ["--multiline-fields=true", "--skip-duplicate-nodes=true"]
+    if not legacy:
+        command.append(database)
+    return command
+
+
+def run_admin_import(container, nodes, edges, database, legacy=False, keep_files=False):
+    """
+    Import node and edge tables into a new database inside the managed container.
+
+    Args:
+        container: Docker container running Neo4j.
+        nodes (pd.DataFrame): Node table from `utils.bulk_load`.
+        edges (pd.DataFrame): Edge table from `utils.bulk_load`.
+        database (str): Name of the database to create; it must not exist yet.
+        legacy (bool): Use the Neo4j 4.x `neo4j-admin import` syntax.
+        keep_files (bool): Leave the import files in place afterwards.
+
+    Returns:
+        str: Output of the importer.
+    """
+    validate_database_name(database)
+    prefix = f"sdk_admin_{uuid.uuid4().hex[:12]}"
+    mounted_dir = mounted_import_dir(container)
+    staging_dir = mounted_dir if mounted_dir is not None else DEFAULT_IMPORT_DIR / prefix
+    container_dir = CONTAINER_IMPORT_MOUNT if mounted_dir is not None else CONTAINER_DEFAULT_IMPORT_DIR
+
+    files = write_admin_import_files(nodes, edges, staging_dir, prefix)
+    written = [{"file": name} for pairs in files.values() for pair in pairs for name in pair]
+    try:
+        if mounted_dir is None:
+            stage_files(container, staging_dir, written)
+
+        # Run as the server's user so the new store files are owned by it
+        exit_code, output = container.exec_run(
+            admin_import_command(files, database, container_dir, legacy=legacy),
+            user="neo4j"
+        )
+        output = output.decode("utf-8", errors="replace")
+        if exit_code != 0:
+            raise RuntimeError(f"neo4j-admin import failed (exit code {exit_code}):\n{output}")
+        return output
+    finally:
+        if not keep_files:
+            for entry in written:
+                (staging_dir / entry["file"]).unlink(missing_ok=True)
+            if mounted_dir is None:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                container.exec_run(["sh", "-c", f"rm -f {CONTAINER_DEFAULT_IMPORT_DIR}/{prefix}_*"])
+
+
+def register_database(driver, database):
+    """
+    Create the imported database on the server so it can be selected and queried.
+
+    `CREATE DATABASE` is an Enterprise Edition command. On Community Edition the
+    store is imported but can only be served by making it the default database.
+
+    Args:
+        driver: Neo4j driver connected to the managed container.
+        database (str): Name of the imported database.
+
+    Returns:
+        tuple: (success, message)
+    """
+    try:
+        with driver.session(database="system") as session:
+            session.run(f"CREATE DATABASE `{database}` IF NOT EXISTS WAIT").consume()
+        return True, f"Database '{database}' created from the imported store."
+    except Exception as e:
+        return False, (
+            f"The store was imported, but the database could not be created ({e}). "
+            f"On Neo4j Community Edition, restart the container with "
+            f"NEO4J_initial_dbms_default__database={database} to serve it."
+        )
@@ -0,0 +1,157 @@
+"""
+Archive introspection: zip and tar members as virtual scan rows.
+
+A scan sees an archive as one opaque file. `expand_archives` lists what is
+inside without extracting anything:
+
+- zip: only the central directory at the end of the file is read
+- tar: member headers are read and the payloads between them skipped with
+  seeks; compressed tars (`.tar.gz`, `.tgz`, ...) can only be listed by
+  decompressing the whole stream, so they are opt-in
+
+Members become rows below the archive's own path (`/data/raw.zip/sub/a.tif`)
+with their uncompressed sizes and an `archive` column naming the archive, and
+the archive row itself gets Type `Archive` and a `member_count`. Archives are
+listed in parallel in a process pool.
+"""
+import os
+import posixpath
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils.identity import normalize_path
+from utils.scanner import SCAN_COLUMNS
+
+ARCHIVE_TYPE = "Archive"
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar",)
+COMPRESSED_TAR_SUFFIXES = (".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+DEFAULT_WORKERS = max(1, min(8, os.cpu_count() or 1))
+
+# Members listed per archive before the rest are left out
+DEFAULT_MAX_MEMBERS = 100000
+
+# Scan columns written as node properties (`utils.bulk_load.build_scan_tables(property_columns=...)`)
+ARCHIVE_PROPERTIES = ["archive", "member_count"]
+
+
+def _member_path(archive, name):
+    name = posixpath.normpath(name.replace("\\", "/").lstrip("/"))
+    if name in (".", "") or name.startswith(".."):
+        return None
+    return f"{archive}/{name}"
+
+
+def _zip_members(path, max_members):
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist()[:max_members]:
+            yield info.filename, info.file_size, info.compress_size, info.is_dir()
+
+
+def _tar_members(path, max_members, compressed):
+    # Plain tars are opened seekable, so tarfile skips payloads with seeks
+    with tarfile.open(path, "r:*" if compressed else "r:") as archive:
+        for i, info in enumerate(archive):
+            if i >= max_members:
+                break
+            yield info.name, info.size, info.size, info.isdir()
+
+
+def list_archive(path, max_members=DEFAULT_MAX_MEMBERS, compressed=False):
+    """
+    List the members of a zip or tar archive as scan rows.
+
+    Args:
+        path (str): Archive file.
+        max_members (int): Members listed before the rest are left out.
+        compressed (bool): Also list compressed tars (reads the whole stream).
+
+    Returns:
+        list: (path, size, stored size, type) tuples; empty if the archive
+        is not supported or cannot be read.
+    """
+    archive = normalize_path(path)
+    lower = archive.lower()
+    try:
+        if lower.endswith(ZIP_SUFFIXES):
+            members = _zip_members(path, max_members)
+        elif lower.endswith(TAR_SUFFIXES):
+            members = _tar_members(path, max_members, compressed=False)
+        elif compressed and lower.endswith(COMPRESSED_TAR_SUFFIXES):
+            members = _tar_members(path, max_members, compressed=True)
+        else:
+            return []
+        rows = {}
+        for name, size, stored, is_dir in members:
+            member = _member_path(archive, name)
+            if member is None:
+                continue
+            rows[member] = (member, size, stored, "Directory" if is_dir else "File")
+            # Archives often leave out entries for the directories their members sit in
+            parent = posixpath.dirname(member)
+            while parent != archive and parent not in rows:
+                rows[parent] = (parent, 0, 0, "Directory")
+                parent = posixpath.dirname(parent)
+        return list(rows.values())
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError, ValueError):
+        return []
+
+
+def is_archive(path, compressed=False):
+    """Return True if `path` names an archive `list_archive` can read."""
+    suffixes = ZIP_SUFFIXES + TAR_SUFFIXES + (COMPRESSED_TAR_SUFFIXES if compressed else ())
+    return path.lower().endswith(suffixes)
+
+
+def _list_chunk(args):
+    paths, max_members, compressed = args
+    return [(path, list_archive(path, max_members, compressed)) for path in paths]
+
+
+def expand_archives(scanned_files, compressed=False, max_members=DEFAULT_MAX_MEMBERS, workers=DEFAULT_WORKERS,
+                    chunk_size=50, on_progress=None, cancel_event=None):
+    """
+    Add the members of the archives in a scan as virtual rows.
+
+    Args:
+        scanned_files (pd.DataFrame): Scan rows (`utils.scanner.SCAN_COLUMNS`).
+        compressed (bool): Also list compressed tars, which means decompressing them.
+        max_members (int): Members listed per archive.
+        workers (int): Listing processes.
+        chunk_size (int): Archives per task.
+        on_progress (callable, optional): Called with the number of archives listed in each chunk.
+        cancel_event (threading.Event, optional): Stops listing when set.
+
+    Returns:
+        pd.DataFrame: The scan rows, with readable archives as Type `Archive`
+        (plus `member_count`) followed by their members (plus `archive`).
+    """
+    is_file = scanned_files["Type"] == "File"
+    archives = [path for path in scanned_files.loc[is_file, "Path"] if is_archive(path, compressed)]
+    if not archives:
+        return scanned_files
+
+    chunks = [(archives[i:i + chunk_size], max_members, compressed) for i in range(0, len(archives), chunk_size)]
+    member_frames, counts = [], {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (paths, _, _), listed in zip(chunks, pool.map(_list_chunk, chunks)):
+            if cancel_event is not None and cancel_event.is_set():
+                pool.shutdown(cancel_futures=True)
+                raise InterruptedError("Archive listing was cancelled.")
+            for path, rows in listed:
+                if rows:
+                    counts[path] = len(rows)
+                    frame = pd.DataFrame(rows, columns=SCAN_COLUMNS)
+                    frame["archive"] = normalize_path(path)
+                    member_frames.append(frame)
+            if on_progress:
+                on_progress(len(paths))
+
+    expanded = scanned_files.copy()
+    listed = expanded["Path"].isin(counts.keys()) & is_file
+    expanded.loc[listed, "Type"] = ARCHIVE_TYPE
+    expanded["member_count"] = expanded["Path"].map(counts).astype("Int64")
+    return pd.concat([expanded] + member_frames, ignore_index=True)
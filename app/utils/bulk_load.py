@@ -0,0 +1,333 @@
+"""
+Node and edge tables for bulk writes to Neo4j.
+
+Scans and taxonomies are turned into two flat DataFrames keyed by the
+deterministic uids from `utils.identity`:
+
+- nodes: `uid`, `label` and one column per property
+- edges: `start_uid`, `start_label`, `end_uid`, `end_label`, `type`
+
+The tables are written with batched `UNWIND ... MERGE` statements. Because the
+uids are computed client side, rows can be written in any order, by any number
+of workers, and re-running a load is idempotent.
+"""
+from pathlib import PurePosixPath
+
+import pandas as pd
+
+from utils.identity import entity_uid, normalize_path, path_uid, taxonomy_uid
+
+DEFAULT_BATCH_SIZE = 5000
+EDGE_COLUMNS = ["start_uid", "start_label", "end_uid", "end_label", "type"]
+
+
+def _parent_path(path):
+    parent = PurePosixPath(path).parent.as_posix()
+    return None if parent == path else parent
+
+
+def build_scan_tables(scanned_files, namespace, include_files=False,
+                      folder_label="Folder", file_label="File", relationship_type="IS_IN",
+                      dataset_label="Dataset", archive_label="Archive", property_columns=None):
+    """
+    Build node and edge tables from a scan DataFrame.
+
+    Args:
+        scanned_files (pd.DataFrame): Scan rows with `Path` and `Type` columns.
+        namespace (str): Namespace from `utils.identity.scan_namespace`.
+        include_files (bool): Whether to emit File nodes as well as Folders.
+        folder_label (str): Label for directory nodes.
+        file_label (str): Label for file nodes.
+        relationship_type (str): Type of the child -> parent relationship.
+        dataset_label (str): Label for rows collapsed by `utils.datasets.collapse_datasets`.
+        archive_label (str): Label for archives listed by `utils.archives.expand_archives`.
+        property_columns (list, optional): Scan columns copied onto the nodes as properties.
+
+    Returns:
+        tuple: (nodes, edges) DataFrames.
+    """
+    rows = scanned_files
+    if not include_files:
+        rows = rows[rows["Type"] != "File"]
+
+    type_labels = {"Directory": folder_label, "Dataset": dataset_label, "Archive": archive_label}
+    paths = rows["Path"].map(normalize_path)
+    labels = rows["Type"].map(lambda t: type_labels.get(t, file_label))
+    parents = paths.map(_parent_path)
+
+    row_uids = [path_uid(namespace, p) for p in paths]
+    nodes = pd.DataFrame({
+        "uid": row_uids,
+        "label": labels.to_numpy(),
+        "filepath": paths.to_numpy(),
+    })
+    for column in property_columns or []:
+        if column in rows.columns:
+            nodes[column] = rows[column].to_numpy()
+
+    # Every other parent is a folder, even when it lies above the scan root
+    parent_paths = pd.Series(parents.dropna().unique(), dtype=object)
+    parent_nodes = pd.DataFrame({
+        "uid": [path_uid(namespace, p) for p in parent_paths],
+        "label": folder_label,
+        "filepath": parent_paths.to_numpy(),
+    })
+    nodes = pd.concat([nodes, parent_nodes], ignore_index=True).drop_duplicates("uid")
+
+    # Parents are folders unless they are rows themselves, like an archive holding its members
+    has_parent = parents.notna().to_numpy()
+    parent_labels = parents[has_parent].map(pd.Series(labels.to_numpy(), index=paths.to_numpy()).groupby(level=0).first())
+    edges = pd.DataFrame({
+        "start_uid": pd.Series(row_uids, dtype=object).to_numpy()[has_parent],
+        "start_label": labels.to_numpy()[has_parent],
+        "end_uid": [path_uid(namespace, p) for p in parents[has_parent]],
+        "end_label": parent_labels.fillna(folder_label).to_numpy(),
+        "type": relationship_type,
+    }, columns=EDGE_COLUMNS)
+
+    return nodes.reset_index(drop=True), edges.drop_duplicates().reset_index(drop=True)
+
+
+def build_taxonomy_tables(taxonomy, taxonomy_keys, relationship_type="OF"):
+    """
+    Build node and edge tables from a grouped taxonomy DataFrame.
+
+    Each level becomes a node labelled by its key, with the `is` and `path_id`
+    properties the Map page has always written, and each level points at its
+    parent level with an `OF` relationship.
+
+    Args:
+        taxonomy (pd.DataFrame): One row per leaf, one column per taxonomy key.
+        taxonomy_keys (list): Ordered taxonomy keys (root first).
+        relationship_type (str): Type of the child -> parent relationship.
+
+    Returns:
+        tuple: (nodes, edges, leaf_uids) where leaf_uids is a Series aligned with `taxonomy`.
+    """
+    node_frames = []
+    edge_frames = []
+    parent_uids = None
+    for depth, key in enumerate(taxonomy_keys, 1):
+        level_keys = taxonomy_keys[:depth]
+        values = [[str(v) for v in row] for row in taxonomy[level_keys].to_numpy().tolist()]
+        uids = pd.Series([taxonomy_uid(level_keys, v) for v in values], index=taxonomy.index)
+        node_frames.append(pd.DataFrame({
+            "uid": uids.to_numpy(),
+            "label": key,
+            "is": taxonomy[key].to_numpy(),
+            "path_id": ["-".join(v) for v in values],
+        }))
+        if parent_uids is not None:
+            edge_frames.append(pd.DataFrame({
+                "start_uid": uids.to_numpy(),
+                "start_label": key,
+                "end_uid": parent_uids.to_numpy(),
+                "end_label": taxonomy_keys[depth - 2],
+                "type": relationship_type,
+            }, columns=EDGE_COLUMNS))
+        parent_uids = uids
+
+    nodes = pd.concat(node_frames, ignore_index=True).drop_duplicates("uid")
+    edges = (pd.concat(edge_frames, ignore_index=True).drop_duplicates()
+             if edge_frames else pd.DataFrame(columns=EDGE_COLUMNS))
+    return nodes.reset_index(drop=True), edges.reset_index(drop=True), parent_uids
+
+
+def backfill_taxonomy_uids(session, nodes, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Give taxonomy nodes written before they had uids the uid of the matching row.
+
+    The Map page used to MERGE taxonomy levels on `{is, path_id}`; those nodes
+    have no `uid`, so a MERGE on uid would duplicate them. Each such node gets
+    the uid of the row with its label and `path_id`, the key the old MERGE
+    used. A node whose uid is already held by another node (a duplicate pushed
+    in between) is left as it is and must be merged by hand, e.g. with
+    `apoc.refactor.mergeNodes`.
+
+    Args:
+        session: Neo4j session.
+        nodes (pd.DataFrame): Node table from `build_taxonomy_tables`.
+        batch_size (int): Rows per transaction.
+
+    Returns:
+        int: Number of rows checked.
+    """
+    written = 0
+    for label, group in nodes.groupby("label", sort=False):
+        query = f"""
+        UNWIND $rows AS row
+        MATCH (n:`{label}` {{path_id: row.path_id}})
+        WHERE n.uid IS NULL
+        WITH row, collect(n)[0] AS n
+        OPTIONAL MATCH (m:`{label}` {{uid: row.uid}})
+        WITH row, n, m WHERE m IS NULL
+        SET n.uid = row.uid
+        """
+        written += write_rows(session, query, group[["uid", "path_id"]], batch_size)
+    return written
+
+
+def build_entity_tables(entities_df, label_column, property_columns, key_columns, property_mappings=None):
+    """
+    Build a node table from a Map-page entity DataFrame.
+
+    Entities are identified by their label and the values of `key_columns`, so
+    the same entity always gets the same uid.
+
+    Args:
+        entities_df (pd.DataFrame): Entities, one per row.
+        label_column (str): Column holding each entity's label.
+        property_columns (list): Columns written as node properties.
+        key_columns (list): Columns that identify an entity within its label.
+        property_mappings (dict, optional): Source column -> Neo4j property name.
+
+    Returns:
+        tuple: (nodes, edges) DataFrames; edges is always empty.
+    """
+    if not key_columns:
+        raise ValueError("At least one key column is needed to identify entities.")
+    property_mappings = property_mappings or {}
+    labels = entities_df[label_column].astype(str)
+    keys = entities_df[key_columns].to_numpy().tolist()
+
+    nodes = pd.DataFrame({
+        "uid": [entity_uid(label, values) for label, values in zip(labels, keys)],
+        "label": labels.to_numpy(),
+    })
+    for col in property_columns:
+        nodes[property_mappings.get(col, col)] = entities_df[col].to_numpy()
+
+    return nodes.drop_duplicates("uid").reset_index(drop=True), pd.DataFrame(columns=EDGE_COLUMNS)
+
+
+def to_parameter_rows(frame):
+    """Convert a DataFrame to a list of query parameter dicts, turning NaN into null."""
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+def write_rows(session, query, frame, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """
+    Run an `UNWIND $rows AS row ...` write query over a DataFrame in batches.
+
+    Each batch is its own managed transaction, so transient errors are retried
+    by the driver and a failure only rolls back the batch in flight.
+
+    Args:
+        session: Neo4j session.
+        query (str): Cypher query reading its input from `$rows`.
+        frame (pd.DataFrame): Rows to write.
+        batch_size (int): Rows per transaction.
+        on_batch (callable, optional): Called with the number of rows written after each batch.
+
+    Returns:
+        int: Number of rows written.
+    """
+    rows = to_parameter_rows(frame)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        session.execute_write(lambda tx: tx.run(query, rows=batch).consume())
+        if on_batch:
+            on_batch(len(batch))
+    return len(rows)
+
+
+def ensure_uid_constraints(session, labels):
+    """Create a uniqueness constraint on `uid` for each label so MERGE uses an index."""
+    for label in labels:
+        try:
+            session.run(f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:`{label}`) REQUIRE n.uid IS UNIQUE")
+        except Exception:
+            # Older servers use a different syntax; MERGE still works without the constraint
+            pass
+
+
+def node_statements(nodes):
+    """Return the (query, rows) pairs that MERGE a node table, one per label."""
+    statements = []
+    for label, group in nodes.groupby("label", sort=False):
+        query = f"""
+        UNWIND $rows AS row
+        MERGE (n:`{label}` {{uid: row.uid}})
+        SET n += row
+        """
+        statements.append((query, group.drop(columns="label")))
+    return statements
+
+
+def edge_statements(edges):
+    """Return the (query, rows) pairs that MERGE an edge table, one per label pair and type."""
+    statements = []
+    for (start_label, end_label, rel_type), group in edges.groupby(
+            ["start_label", "end_label", "type"], sort=False):
+        query = f"""
+        UNWIND $rows AS row
+        MATCH (a:`{start_label}` {{uid: row.start_uid}})
+        MATCH (b:`{end_label}` {{uid: row.end_uid}})
+        MERGE (a)-[:`{rel_type}`]->(b)
+        """
+        statements.append((query, group[["start_uid", "end_uid"]]))
+    return statements
+
+
+def push_nodes(session, nodes, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """
+    MERGE a node table into Neo4j in batches.
+
+    Args:
+        session: Neo4j session.
+        nodes (pd.DataFrame): Node table with `uid` and `label` columns.
+        batch_size (int): Rows per transaction.
+        on_batch (callable, optional): Called with the number of rows written after each batch.
+
+    Returns:
+        int: Number of rows written.
+    """
+    return sum(write_rows(session, query, rows, batch_size, on_batch) for query, rows in node_statements(nodes))
+
+
+def push_edges(session, edges, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """
+    MERGE an edge table into Neo4j in batches, matching endpoints by uid.
+
+    Args:
+        session: Neo4j session.
+        edges (pd.DataFrame): Edge table with the columns in `EDGE_COLUMNS`.
+        batch_size (int): Rows per transaction.
+        on_batch (callable, optional): Called with the number of rows written after each batch.
+
+    Returns:
+        int: Number of rows written.
+    """
+    return sum(write_rows(session, query, rows, batch_size, on_batch) for query, rows in edge_statements(edges))
+
+
+def push_tables(driver, nodes, edges, batch_size=DEFAULT_BATCH_SIZE, database=None, on_batch=None, skip_rows=0):
+    """
+    Write node and edge tables through a driver, nodes first.
+
+    Rows are always written in the same order, so a push that stopped part way
+    can be resumed by skipping the rows its last completed batch had reached.
+    Replaying a batch is harmless because every write is a MERGE on uid.
+
+    Args:
+        driver: Neo4j driver.
+        nodes (pd.DataFrame): Node table.
+        edges (pd.DataFrame): Edge table.
+        batch_size (int): Rows per transaction.
+        database (str, optional): Target database. Defaults to the server default.
+        on_batch (callable, optional): Called with the number of rows written after each batch.
+        skip_rows (int): Rows already committed by an earlier run.
+
+    Returns:
+        int: Number of rows written by this call.
+    """
+    written = 0
+    with driver.session(database=database) as session:
+        ensure_uid_constraints(session, nodes["label"].unique())
+        for query, rows in node_statements(nodes) + edge_statements(edges):
+            if skip_rows >= len(rows):
+                skip_rows -= len(rows)
+                continue
+            written += write_rows(session, query, rows.iloc[skip_rows:], batch_size, on_batch)
+            skip_rows = 0
+    return written
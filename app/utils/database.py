@@ -14,6 +14,9 @@ import io
 from datetime import datetime
 from pyvis.network import Network
 from neo4j.exceptions import ServiceUnavailable
+from utils.filters import cypher_name, cypher_property, filter_to_cypher
+from utils.query_profile import ProfiledDriver
+from utils.server_import import CONTAINER_IMPORT_MOUNT, DEFAULT_IMPORT_DIR
 
 client = docker.from_env()
 
@@ -110,6 +113,15 @@ def get_neo4j_hostname():
         return "localhost"  # Fallback
 
 
+def get_neo4j_container():
+    """Return the managed Neo4j container, or None if it does not exist."""
+    try:
+        initialize_session()
+        return client.containers.get(st.session_state["container_name"])
+    except docker.errors.DockerException:
+        return None
+
+
 def find_free_port(start_port):
     """Finds a free port starting from `start_port`."""
     initialize_session()
@@ -236,6 +248,9 @@ def start_neo4j_container():
                     st.error(f"Failed to pull Neo4j Docker image {neo4j_image}: {e}")
                     return
 
+            import_dir = Path(st.session_state.get("neo4j_import_dir", DEFAULT_IMPORT_DIR))
+            import_dir.mkdir(parents=True, exist_ok=True)
+
             container = client.containers.run(
                 neo4j_image,
                 name=container_name,
@@ -243,6 +258,10 @@ def start_neo4j_container():
                     "7474/tcp": st.session_state["http_port"],
                     "7687/tcp": st.session_state["bolt_port"]
                 },
+                # Host directory for LOAD CSV / neo4j-admin import files (see utils.server_import)
+                volumes={
+                    str(import_dir): {"bind": CONTAINER_IMPORT_MOUNT, "mode": "rw"},
+                },
                 environment={
                     "NEO4J_AUTH": f"{st.session_state['username']}/{st.session_state['password']}",
                     "NEO4J_PLUGINS": "[\"apoc\"]",
@@ -344,6 +363,70 @@ def fetch_nodes_with_properties(session, label, selected_properties):
     nodes = [record.data() for record in result]
     return pd.DataFrame(nodes) if nodes else pd.DataFrame(columns=selected_properties)
 
+def _filtered_match(label, tree):
+    """Return the MATCH ... WHERE part and parameters for a filter tree (see `utils.filters`)."""
+    query = f"MATCH (n:{cypher_name(label)})"
+    params = {}
+    if tree:
+        where, params = filter_to_cypher(tree, alias="n")
+        query += f" WHERE {where}"
+    return query, params
+
+
+def fetch_filtered_nodes(session, label, selected_properties, tree=None, limit=None):
+    """
+    Fetch the nodes of a label that match a filter tree, with selected properties only.
+
+    The filter runs in the database as a parameterized WHERE clause, so only
+    matching rows and requested columns are transferred.
+
+    Args:
+        session: Neo4j session.
+        label (str): Node label.
+        selected_properties (list): Properties returned as columns.
+        tree (dict, optional): Filter tree from `utils.filters`.
+        limit (int, optional): Most rows returned.
+
+    Returns:
+        pd.DataFrame: One row per matching node.
+    """
+    if not selected_properties:
+        return pd.DataFrame(columns=["No properties selected"])
+    query, params = _filtered_match(label, tree)
+    # Escaped as in the WHERE clause, so a name containing a backtick cannot break out of the query
+    returns = ", ".join(f"{cypher_property('n', prop)} AS {cypher_name(prop)}" for prop in selected_properties)
+    query += f" RETURN {returns}"
+    if limit:
+        query += " LIMIT $limit"
+        params["limit"] = int(limit)
+    nodes = [record.data() for record in session.run(query, params)]
+    return pd.DataFrame(nodes, columns=selected_properties)
+
+
+def count_filtered_nodes(session, label, tree=None):
+    """Count the nodes of a label that match a filter tree."""
+    query, params = _filtered_match(label, tree)
+    return session.run(query + " RETURN count(n) AS count", params).single()["count"]
+
+
+def fetch_indexed_properties(session, label):
+    """
+    Return the properties of a label covered by an online index, by index type.
+
+    Returns:
+        dict: Property -> list of index types (RANGE, TEXT, ...).
+    """
+    result = session.run(
+        "SHOW INDEXES YIELD labelsOrTypes, properties, type, state "
+        "WHERE $label IN labelsOrTypes AND state = 'ONLINE' RETURN properties, type",
+        label=label
+    )
+    indexed = {}
+    for record in result:
+        for prop in record["properties"] or []:
+            indexed.setdefault(prop, []).append(record["type"])
+    return indexed
+
 # Utility Functions
 def load_saved_queries():
     """Load saved queries from the JSON file."""
@@ -392,8 +475,14 @@ def manage_queries(recall_query):
 
 
 # Neo4j Connection
+@st.cache_resource
+def get_neo4j_driver(uri, user, password):
+    """Return a driver (connection pool) shared by every session of the app for these credentials."""
+    return ProfiledDriver(GraphDatabase.driver(uri, auth=(user, password)))
+
+
 def get_neo4j_session(uri, user, password, database=None):
-    driver = GraphDatabase.driver(uri, auth=(user, password))
+    driver = ProfiledDriver(GraphDatabase.driver(uri, auth=(user, password)))
     session = driver.session(database=database) if database else driver.session()
     return session
 
@@ -486,8 +575,9 @@ def create_pyvis_graph(triples, layout, physics_enabled):
 
     return net
 
-def fetch_nodes_by_label(session, label, with_clause):
-    query = f"""
+def nodes_by_label_query(label, with_clause):
+    """Cypher returning the nodes of `label` found on either end of the recall query's pattern."""
+    return f"""
     {with_clause}
     MATCH (n:{label})
     RETURN n AS node
@@ -496,10 +586,12 @@ def fetch_nodes_by_label(session, label, with_clause):
     MATCH (m:{label})
     RETURN m AS node
     """
-    results = session.run(query)
 
+
+def nodes_to_frame(records):
+    """Turn records with a `node` column into a DataFrame of unique node properties."""
     # Collect unique nodes from both queries
-    nodes = [dict(record["node"]) for record in results]
+    nodes = [dict(record["node"]) for record in records]
 
     # Convert lists to tuples in the dictionaries to make them hashable
     for node in nodes:
@@ -510,6 +602,10 @@ def fetch_nodes_by_label(session, label, with_clause):
     return pd.DataFrame(nodes).drop_duplicates()
 
 
+def fetch_nodes_by_label(session, label, with_clause):
+    return nodes_to_frame(session.run(nodes_by_label_query(label, with_clause)))
+
+
 def export_graph_to_networkx(session):
     """
     Export the entire Neo4j graph to a NetworkX graph.
@@ -536,29 +632,28 @@ def export_graph_to_networkx(session):
     """
 
     # Execute queries
-    with st.spinner("Fetching nodes from database..."):
-        nodes_result = session.run(query_nodes)
-        nodes = [record.data() for record in nodes_result]
-
-        # Add nodes to graph
-        for node in nodes:
-            # Convert labels list to a string representation
-            label = ":".join(node["labels"])
-            # Add node with its properties
-            G.add_node(node["id"], label=label, **node["properties"])
-
-    with st.spinner("Fetching relationships from database..."):
-        rels_result = session.run(query_rels)
-        relationships = [record.data() for record in rels_result]
-
-        # Add edges to graph
-        for rel in relationships:
-            G.add_edge(
-                rel["source"], 
-                rel["target"], 
-                type=rel["type"], 
-                **rel["properties"]
-            )
+    # No Streamlit calls here: exports also run as background jobs outside the script thread
+    nodes_result = session.run(query_nodes)
+    nodes = [record.data() for record in nodes_result]
+
+    # Add nodes to graph
+    for node in nodes:
+        # Convert labels list to a string representation
+        label = ":".join(node["labels"])
+        # Add node with its properties
+        G.add_node(node["id"], label=label, **node["properties"])
+
+    rels_result = session.run(query_rels)
+    relationships = [record.data() for record in rels_result]
+
+    # Add edges to graph
+    for rel in relationships:
+        G.add_edge(
+            rel["source"], 
+            rel["target"], 
+            type=rel["type"], 
+            **rel["properties"]
+        )
 
     return G
 
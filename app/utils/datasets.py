@@ -0,0 +1,165 @@
+"""
+Acquisition-boundary detection: instrument folders collapsed into dataset rows.
+
+Bruker ParaVision experiments, DICOM series and Zarr stores hold thousands of
+small files that only make sense together. `detect_datasets` finds the
+directories that bound such acquisitions in a scan table:
+
+- Bruker ParaVision experiment: a directory holding an `acqp` or `method` file
+- Zarr / OME-Zarr store: a directory named `*.zarr` or holding `.zgroup`,
+  `.zarray` or `zarr.json` (the outermost one when stores nest)
+- DICOM series: a directory where most of the files are DICOM (by extension,
+  or by the `format` column from `utils.metadata` when present)
+
+`collapse_datasets` then replaces everything below each boundary with one
+`Dataset` row carrying aggregate statistics and a manifest of its files, so
+`utils.bulk_load.build_scan_tables` emits one node instead of thousands.
+"""
+from pathlib import PurePosixPath
+
+import numpy as np
+import pandas as pd
+
+from utils.identity import normalize_path
+
+DATASET_TYPE = "Dataset"
+BRUKER_MARKERS = {"acqp", "method"}
+ZARR_MARKERS = {".zgroup", ".zarray", "zarr.json"}
+DICOM_SUFFIXES = (".dcm", ".ima", ".dicom")
+
+# Files listed in a dataset's manifest property before it is truncated
+MAX_MANIFEST_ENTRIES = 5000
+
+# Metadata columns from `utils.metadata` carried onto the dataset (first value found)
+_METADATA_COLUMNS = ["modality", "subject", "dimensions", "voxel_size", "acquisition_date"]
+
+DATASET_COLUMNS = ["Path", "dataset_type", "file_count", "total_size", "disk_usage", "manifest",
+                   "manifest_truncated"]
+
+# Scan columns written as node properties (`utils.bulk_load.build_scan_tables(property_columns=...)`)
+DATASET_PROPERTIES = DATASET_COLUMNS[1:] + _METADATA_COLUMNS
+
+
+def _outermost(candidates):
+    """Keep the candidates that do not lie inside another candidate."""
+    kept = {}
+    for path in sorted(candidates, key=len):
+        if not any(str(parent) in kept for parent in PurePosixPath(path).parents):
+            kept[path] = candidates[path]
+    return kept
+
+
+def find_boundaries(scanned_files, min_dicom_files=2, dicom_share=0.5):
+    """
+    Find the directories that bound instrument datasets.
+
+    Args:
+        scanned_files (pd.DataFrame): Scan rows with `Path` and `Type`.
+        min_dicom_files (int): Fewest DICOM files that make a series directory.
+        dicom_share (float): Share of a directory's files that must be DICOM.
+
+    Returns:
+        dict: Boundary directory -> dataset type, outermost boundaries only.
+    """
+    paths = scanned_files["Path"].map(normalize_path)
+    is_file = (scanned_files["Type"] == "File").to_numpy()
+    names = paths.map(lambda p: p.rsplit("/", 1)[-1])
+    parents = paths.map(lambda p: p.rsplit("/", 1)[0] or "/")
+
+    candidates = {}
+    is_dicom = names.str.lower().str.endswith(DICOM_SUFFIXES)
+    if "format" in scanned_files.columns:
+        is_dicom |= (scanned_files["format"] == "DICOM").fillna(False).to_numpy()
+    files = pd.DataFrame({"parent": parents[is_file], "dicom": is_dicom[is_file]})
+    counts = files.groupby("parent")["dicom"].agg(["sum", "size"])
+    series = counts[(counts["sum"] >= min_dicom_files) & (counts["sum"] >= dicom_share * counts["size"])]
+    candidates.update(dict.fromkeys(series.index, "DICOM series"))
+
+    zarr_dirs = paths[~is_file & names.str.lower().str.endswith(".zarr")]
+    candidates.update(dict.fromkeys(zarr_dirs, "Zarr store"))
+    candidates.update(dict.fromkeys(parents[names.isin(ZARR_MARKERS)], "Zarr store"))
+
+    # Bruker experiments win over the generic rules for the same directory
+    candidates.update(dict.fromkeys(parents[is_file & names.isin(BRUKER_MARKERS)], "Bruker ParaVision experiment"))
+    return _outermost(candidates)
+
+
+def detect_datasets(scanned_files, min_dicom_files=2, dicom_share=0.5, max_manifest=MAX_MANIFEST_ENTRIES):
+    """
+    Detect dataset boundaries and aggregate the files below each one.
+
+    Args:
+        scanned_files (pd.DataFrame): Scan rows with `Path`, `Type`, `Size (Bytes)`
+            and `Disk Usage (Bytes)`, plus any `utils.metadata` columns.
+        min_dicom_files (int): Fewest DICOM files that make a series directory.
+        dicom_share (float): Share of a directory's files that must be DICOM.
+        max_manifest (int): Files listed in each manifest before it is truncated.
+
+    Returns:
+        tuple: (datasets, members) where datasets has one row per boundary
+        (`DATASET_COLUMNS` plus metadata columns) and members is a boolean
+        Series marking the scan rows that lie below a boundary.
+    """
+    boundaries = find_boundaries(scanned_files, min_dicom_files, dicom_share)
+    paths = scanned_files["Path"].map(normalize_path)
+
+    # Everything below a boundary sorts between "<boundary>/" and "<boundary>0"
+    order = np.argsort(paths.to_numpy(dtype=object))
+    sorted_paths = paths.to_numpy(dtype=object)[order]
+    dataset_of = np.full(len(paths), None, dtype=object)
+    for boundary in boundaries:
+        prefix = boundary.rstrip("/") + "/"
+        lo, hi = np.searchsorted(sorted_paths, [prefix, prefix[:-1] + "0"])
+        dataset_of[order[lo:hi]] = boundary
+    members = pd.Series(dataset_of, index=scanned_files.index).notna()
+
+    rows = scanned_files[members.to_numpy()].assign(
+        _dataset=dataset_of[members.to_numpy()], _path=paths[members.to_numpy()]
+    )
+    files = rows[rows["Type"] == "File"].sort_values("_path")
+    files = files.assign(_relative=[p[len(d) + 1:] for p, d in zip(files["_path"], files["_dataset"])])
+    grouped = files.groupby("_dataset")
+
+    datasets = pd.DataFrame({"Path": list(boundaries), "dataset_type": list(boundaries.values())})
+    datasets["file_count"] = datasets["Path"].map(grouped.size()).fillna(0).astype(int)
+    datasets["total_size"] = datasets["Path"].map(grouped["Size (Bytes)"].sum()).fillna(0).astype("int64")
+    datasets["disk_usage"] = datasets["Path"].map(
+        rows.groupby("_dataset")["Disk Usage (Bytes)"].sum()).fillna(0).astype("int64")
+    manifests = grouped["_relative"].agg(lambda relative: list(relative.head(max_manifest)))
+    datasets["manifest"] = [manifests.get(path, []) for path in datasets["Path"]]
+    datasets["manifest_truncated"] = datasets["file_count"] > max_manifest
+    for column in _METADATA_COLUMNS:
+        if column in rows.columns:
+            datasets[column] = datasets["Path"].map(rows.groupby("_dataset")[column].first())
+    return datasets, members
+
+
+def collapse_datasets(scanned_files, min_dicom_files=2, dicom_share=0.5, max_manifest=MAX_MANIFEST_ENTRIES):
+    """
+    Replace every detected dataset with a single `Dataset` row.
+
+    The boundary directory's row becomes the dataset (Type `Dataset`, with the
+    aggregate columns of `detect_datasets`) and the rows below it are dropped.
+
+    Returns:
+        tuple: (collapsed scan rows, datasets)
+    """
+    datasets, members = detect_datasets(scanned_files, min_dicom_files, dicom_share, max_manifest)
+    if datasets.empty:
+        return scanned_files, datasets
+
+    collapsed = scanned_files[~members.to_numpy()].copy()
+    is_boundary = collapsed["Path"].map(normalize_path).isin(set(datasets["Path"]))
+    collapsed.loc[is_boundary, "Type"] = DATASET_TYPE
+
+    collapsed["_boundary"] = collapsed["Path"].map(normalize_path).where(is_boundary)
+    # Metadata columns already on the scan get the dataset's values; the rest are joined on
+    shared = [c for c in _METADATA_COLUMNS if c in collapsed.columns and c in datasets.columns]
+    for column in shared:
+        collapsed.loc[is_boundary, column] = collapsed.loc[is_boundary, "_boundary"].map(
+            datasets.set_index("Path")[column])
+    extra = datasets.drop(columns=shared).rename(columns={"Path": "_boundary"})
+    collapsed = collapsed.merge(extra, on="_boundary", how="left").drop(columns="_boundary")
+    for column in ("file_count", "total_size", "disk_usage"):
+        collapsed[column] = collapsed[column].astype("Int64")
+    return collapsed.reset_index(drop=True), datasets
@@ -0,0 +1,210 @@
+"""
+Table exports written to disk in chunks.
+
+Download buttons used to build their whole payload (`to_csv()`, an in-memory
+XLSX workbook) on every rerun. Exports here are only written when asked for,
+straight to a file under `DEFAULT_EXPORT_DIR`, one chunk of rows at a time:
+
+- CSV and JSON (a records array) are appended chunk by chunk
+- Parquet goes through one `pyarrow.parquet.ParquetWriter`, one row group per chunk
+- XLSX uses XlsxWriter's `constant_memory` mode, which flushes each row to
+  disk as it is written; tables longer than a sheet continue on extra sheets
+
+Files are written under a temporary name and renamed when complete, so a
+half-written export is never served. `clean_exports` removes old ones.
+"""
+import datetime
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+
+DEFAULT_EXPORT_DIR = Path.home() / ".science_data_kit" / "exports"
+DEFAULT_CHUNK_ROWS = 100000
+
+# Exports older than this are removed by `clean_exports`
+EXPORT_TTL = 24 * 3600
+
+# Format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "JSON": ("json", "application/json"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "XLSX": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+XLSX_MAX_ROWS = 1048576
+_SHEET_INVALID = re.compile(r"[\[\]:*?/\\]")
+
+
+def _chunks(frame, chunk_rows):
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+def write_csv(frame, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Write a frame as CSV, one chunk of rows at a time."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if frame.empty:
+            frame.to_csv(f, index=False)
+        for i, chunk in enumerate(_chunks(frame, chunk_rows)):
+            chunk.to_csv(f, index=False, header=i == 0)
+
+
+def write_json(frame, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Write a frame as a JSON array of records (like `to_json(orient="records")`), one chunk at a time."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        first = True
+        for chunk in _chunks(frame, chunk_rows):
+            records = chunk.to_json(orient="records", lines=True).strip()
+            if not records:
+                continue
+            f.write(("" if first else ",") + records.replace("\n", ","))
+            first = False
+        f.write("]")
+
+
+def write_parquet(frame, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Write a frame as Parquet, one row group per chunk."""
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(frame, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def _sheet_name(name, used):
+    base = _SHEET_INVALID.sub("_", str(name)).strip("'")[:31] or "Sheet"
+    candidate, n = base, 2
+    while candidate.lower() in used:
+        suffix = f" ({n})"
+        candidate, n = base[:31 - len(suffix)] + suffix, n + 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def _cell(value):
+    """Return a value XlsxWriter can write: blanks for missing values, text for anything it has no type for."""
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (str, datetime.datetime, datetime.date)):
+        return value
+    if isinstance(value, np.datetime64):
+        return pd.Timestamp(value).to_pydatetime()
+    return str(value)
+
+
+def write_xlsx(sheets, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Write frames as worksheets of one workbook without holding the workbook in memory.
+
+    Args:
+        sheets (dict): Sheet name -> DataFrame. Names are made valid for Excel
+            (31 characters, no `[]:*?/\\`); a frame longer than one sheet
+            continues on sheets named "<name> (2)", "<name> (3)", ...
+        path (str or Path): Output file.
+        chunk_rows (int): Rows converted at a time.
+    """
+    if not XLSXWRITER_AVAILABLE:
+        raise RuntimeError("XLSX export needs XlsxWriter. Install it with `pip install XlsxWriter`.")
+
+    workbook = xlsxwriter.Workbook(str(path), {
+        "constant_memory": True,
+        "remove_timezone": True,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    })
+    used = set()
+    try:
+        for name, frame in sheets.items():
+            header = [str(column) for column in frame.columns]
+            worksheet = workbook.add_worksheet(_sheet_name(name, used))
+            worksheet.write_row(0, 0, header)
+            row = 1
+            for chunk in _chunks(frame, chunk_rows):
+                for values in chunk.itertuples(index=False, name=None):
+                    if row == XLSX_MAX_ROWS:
+                        worksheet = workbook.add_worksheet(_sheet_name(name, used))
+                        worksheet.write_row(0, 0, header)
+                        row = 1
+                    # Rows must be written in order in constant_memory mode
+                    for column, value in enumerate(values):
+                        value = _cell(value)
+                        if value is not None:
+                            worksheet.write(row, column, value)
+                    row += 1
+    finally:
+        workbook.close()
+
+
+_WRITERS = {"CSV": write_csv, "JSON": write_json, "Parquet": write_parquet}
+
+
+def write_export(frames, fmt, file_name, export_dir=DEFAULT_EXPORT_DIR, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Write an export to its own file under `export_dir`.
+
+    Args:
+        frames (pd.DataFrame or dict): The table, or sheet name -> table for XLSX.
+        fmt (str): One of `EXPORT_FORMATS`.
+        file_name (str): Name the file is served under.
+        export_dir (str or Path): Directory holding the exports.
+        chunk_rows (int): Rows written at a time.
+
+    Returns:
+        Path: The finished file.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Expected one of {list(EXPORT_FORMATS)}.")
+    if isinstance(frames, dict) and fmt != "XLSX":
+        if len(frames) != 1:
+            raise ValueError(f"{fmt} exports hold one table; use XLSX for several.")
+        frames = next(iter(frames.values()))
+
+    # One directory per export keeps the served file name
+    path = Path(export_dir) / uuid.uuid4().hex / Path(file_name).name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".tmp")
+    try:
+        if fmt == "XLSX":
+            write_xlsx(frames if isinstance(frames, dict) else {"Sheet1": frames}, partial, chunk_rows)
+        else:
+            _WRITERS[fmt](frames, partial, chunk_rows)
+        partial.replace(path)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return path
+
+
+def clean_exports(export_dir=DEFAULT_EXPORT_DIR, max_age=EXPORT_TTL):
+    """Remove exports older than `max_age` seconds."""
+    root = Path(export_dir)
+    if not root.is_dir():
+        return
+    cutoff = time.time() - max_age
+    for directory in root.iterdir():
+        try:
+            if directory.is_dir() and os.stat(directory).st_mtime < cutoff:
+                for file in directory.iterdir():
+                    file.unlink(missing_ok=True)
+                directory.rmdir()
+        except OSError:
+            continue
@@ -0,0 +1,275 @@
+"""
+Compiled AND/OR filters over entity tables.
+
+A filter is a tree of plain dicts, so it can be kept in session state or a
+spec file:
+
+- predicate: `{"column": "subject", "op": "contains", "value": "mouse"}`
+- group: `{"and": [...]}` or `{"or": [...]}`, nested freely
+
+`FrameFilter` evaluates a tree against one DataFrame as a single boolean mask:
+every predicate is one vectorized comparison (Arrow compute kernels for the
+string operations, NumPy for the numeric ones) and groups combine the masks
+with `&` and `|`. The string and numeric views of a column are cast once and
+reused by every later filter, and the frame itself is never copied; the
+filtered rows are only materialized when asked for.
+
+`filter_to_cypher` translates the same tree into a parameterized `WHERE`
+clause, so entities pulled from Neo4j are filtered in the database.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+STRING_OPERATORS = ["==", "!=", "contains", "starts with", "ends with"]
+NUMERIC_OPERATORS = [">", "<", ">=", "<="]
+OPERATORS = ["==", "!=", ">", "<", ">=", "<=", "contains", "starts with", "ends with"]
+
+_NUMERIC_FUNCTIONS = {">": np.greater, "<": np.less, ">=": np.greater_equal, "<=": np.less_equal}
+_STRING_FUNCTIONS = {
+    "==": lambda values, value: pc.equal(values, value),
+    "!=": lambda values, value: pc.not_equal(values, value),
+    "contains": lambda values, value: pc.match_substring(values, value),
+    "starts with": lambda values, value: pc.starts_with(values, value),
+    "ends with": lambda values, value: pc.ends_with(values, value),
+}
+
+
+def predicate(column, op, value):
+    """Return a predicate node."""
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown filter operation '{op}'. Expected one of {OPERATORS}.")
+    return {"column": column, "op": op, "value": value}
+
+
+def validate_filter(tree, columns=None):
+    """
+    Check a filter tree's shape, operations and numeric values.
+
+    Args:
+        tree (dict): Filter tree.
+        columns (list, optional): Columns the predicates may refer to.
+
+    Raises:
+        ValueError: If a node is malformed.
+    """
+    if "and" in tree or "or" in tree:
+        children = tree.get("and", tree.get("or"))
+        if not isinstance(children, list) or not children:
+            raise ValueError("Filter groups need a non-empty list of predicates.")
+        for child in children:
+            validate_filter(child, columns)
+        return
+    if {"column", "op", "value"} - set(tree):
+        raise ValueError(f"Filter predicate {tree} needs a 'column', an 'op' and a 'value'.")
+    if tree["op"] not in OPERATORS:
+        raise ValueError(f"Unknown filter operation '{tree['op']}'. Expected one of {OPERATORS}.")
+    if columns is not None and tree["column"] not in columns:
+        raise ValueError(f"Filter column '{tree['column']}' is not in the table.")
+    if tree["op"] in NUMERIC_OPERATORS:
+        try:
+            float(tree["value"])
+        except (TypeError, ValueError):
+            raise ValueError(f"'{tree['value']}' is not a number for '{tree['column']} {tree['op']}'.")
+
+
+def filter_from_rows(rows):
+    """
+    Build a filter tree from predicate rows: AND within a group, OR across groups.
+
+    Args:
+        rows (pd.DataFrame): `group`, `column`, `op` and `value` columns; rows
+            with no column or an empty value are skipped.
+
+    Returns:
+        dict or None: `{"or": [{"and": [...]}, ...]}`, or None if no row applies.
+    """
+    active = rows.dropna(subset=["column", "op"])
+    active = active[active["value"].fillna("").astype(str) != ""]
+    groups = [
+        {"and": [predicate(row["column"], row["op"], row["value"]) for row in group.to_dict("records")]}
+        for _, group in active.groupby(active["group"].fillna(1), sort=True)
+    ]
+    return {"or": groups} if groups else None
+
+
+def cypher_name(name):
+    """Quote a label, property or alias name for Cypher, escaping backticks inside it."""
+    return f"`{str(name).replace('`', '``')}`"
+
+
+def cypher_property(alias, name):
+    """Return the Cypher property access `alias.name` with the name quoted."""
+    return f"{alias}.{cypher_name(name)}"
+
+
+def _cypher_values(value):
+    """Return the values a UI-entered string may have been stored as: the string and, if it parses, the number."""
+    values = [str(value)]
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return values
+    values.append(int(number) if number.is_integer() else number)
+    return values
+
+
+def filter_to_cypher(tree, alias="n", params=None):
+    """
+    Translate a filter tree into a parameterized Cypher predicate.
+
+    Predicates compare the bare property (`n.subject STARTS WITH $f0`), never a
+    converted one, so the planner can use range and text indexes: `==`/`!=`
+    become `IN`/`NOT IN` over the string and numeric forms of the value,
+    comparisons use the number, and the string operations map to `CONTAINS`,
+    `STARTS WITH` and `ENDS WITH`.
+
+    Args:
+        tree (dict): Filter tree.
+        alias (str): Node variable in the query.
+        params (dict, optional): Parameters collected so far; filled in place.
+
+    Returns:
+        tuple: (predicate string, params dict)
+    """
+    params = {} if params is None else params
+    for key, joiner in (("and", " AND "), ("or", " OR ")):
+        if key in tree:
+            parts = [filter_to_cypher(child, alias, params)[0] for child in tree[key]]
+            return (f"({joiner.join(parts)})" if len(parts) > 1 else parts[0]), params
+
+    validate_filter(tree)
+    name = f"f{len(params)}"
+    prop = cypher_property(alias, tree["column"])
+    op = tree["op"]
+    if op in ("==", "!="):
+        params[name] = _cypher_values(tree["value"])
+        clause = f"{prop} IN ${name}"
+        return (clause if op == "==" else f"({prop} IS NOT NULL AND NOT {clause})"), params
+    if op in NUMERIC_OPERATORS:
+        params[name] = float(tree["value"])
+        return f"{prop} {op} ${name}", params
+    params[name] = str(tree["value"])
+    keyword = {"contains": "CONTAINS", "starts with": "STARTS WITH", "ends with": "ENDS WITH"}[op]
+    return f"{prop} {keyword} ${name}", params
+
+
+def filter_properties(tree):
+    """Return the columns a filter tree refers to, in first-use order."""
+    for key in ("and", "or"):
+        if key in tree:
+            seen = []
+            for child in tree[key]:
+                seen += [column for column in filter_properties(child) if column not in seen]
+            return seen
+    return [tree["column"]]
+
+
+def describe_filter(tree):
+    """Render a filter tree as a readable expression."""
+    for key in ("and", "or"):
+        if key in tree:
+            parts = [describe_filter(child) for child in tree[key]]
+            joined = f" {key.upper()} ".join(parts)
+            return f"({joined})" if len(parts) > 1 else joined
+    return f"{tree['column']} {tree['op']} {tree['value']!r}"
+
+
+class FrameFilter:
+    """
+    A filter bound to one DataFrame, kept as a boolean mask.
+
+    Args:
+        frame (pd.DataFrame): The table to filter; it is never copied.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.tree = None
+        self.mask = None
+        self._views = {}
+        self._filtered = None
+
+    def string_view(self, column):
+        """Return the column as an Arrow string array, cast once."""
+        key = (column, "string")
+        if key not in self._views:
+            values = self.frame[column]
+            try:
+                array = pa.array(values, from_pandas=True)
+                array = array if pa.types.is_string(array.type) else pc.cast(array, pa.string())
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                # Mixed object columns: fall back to Python's str() once
+                array = pa.array(values.astype(str), type=pa.string())
+            self._views[key] = array
+        return self._views[key]
+
+    def numeric_view(self, column):
+        """Return the column as a float array (NaN where not numeric), cast once."""
+        key = (column, "numeric")
+        if key not in self._views:
+            self._views[key] = pd.to_numeric(self.frame[column], errors="coerce").to_numpy(dtype=float)
+        return self._views[key]
+
+    def evaluate(self, tree):
+        """
+        Evaluate a filter tree to a boolean mask over the frame.
+
+        Args:
+            tree (dict): Filter tree.
+
+        Returns:
+            np.ndarray: One boolean per row.
+        """
+        if "and" in tree:
+            mask = np.ones(len(self.frame), dtype=bool)
+            for child in tree["and"]:
+                mask &= self.evaluate(child)
+            return mask
+        if "or" in tree:
+            mask = np.zeros(len(self.frame), dtype=bool)
+            for child in tree["or"]:
+                mask |= self.evaluate(child)
+            return mask
+
+        column, op, value = tree["column"], tree["op"], tree["value"]
+        if op in NUMERIC_OPERATORS:
+            with np.errstate(invalid="ignore"):
+                return _NUMERIC_FUNCTIONS[op](self.numeric_view(column), float(value))
+        result = _STRING_FUNCTIONS[op](self.string_view(column), str(value))
+        # Nulls never match
+        return pc.fill_null(result, False).to_numpy(zero_copy_only=False)
+
+    def apply(self, tree):
+        """
+        Set the active filter.
+
+        Args:
+            tree (dict): Filter tree; see the module docstring.
+
+        Returns:
+            int: Rows that match.
+        """
+        validate_filter(tree, self.frame.columns)
+        self.mask = self.evaluate(tree)
+        self.tree = tree
+        self._filtered = None
+        return int(self.mask.sum())
+
+    def reset(self):
+        """Drop the active filter; the frame is untouched, so this is free."""
+        self.tree = None
+        self.mask = None
+        self._filtered = None
+
+    def filtered(self):
+        """Return the matching rows (the frame itself when no filter is active)."""
+        if self.mask is None:
+            return self.frame
+        if self._filtered is None:
+            self._filtered = self.frame[self.mask]
+        return self._filtered
+
+    def __len__(self):
+        return len(self.frame) if self.mask is None else int(self.mask.sum())
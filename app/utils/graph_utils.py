@@ -4,6 +4,7 @@ from neo4j.exceptions import Neo4jError
 import pandas as pd
 from typing import List, Dict, Any, Optional, Union
 from collections import Counter
+from utils.query_profile import ProfiledDriver, profile_driver
 
 # Import isatools classes through our compatibility layer
 try:
@@ -56,7 +57,7 @@ class Neo4jConnection:
             try:
                 import streamlit as st
                 if hasattr(st, 'session_state') and 'connected' in st.session_state and st.session_state.connected:
-                    self._driver = st.session_state.session._driver
+                    self._driver = profile_driver(st.session_state.session._driver)
                     self.uri = st.session_state.neo4j_uri
                     self.user = st.session_state.neo4j_user
                     self.password = st.session_state.neo4j_password
@@ -89,7 +90,7 @@ class Neo4jConnection:
         Establishes a connection to the Neo4j database.
         """
         try:
-            self._driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+            self._driver = ProfiledDriver(GraphDatabase.driver(self.uri, auth=(self.user, self.password)))
         except Neo4jError as e:
             raise ConnectionError(f"Failed to connect to Neo4j: {e}")
 
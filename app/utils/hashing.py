@@ -0,0 +1,277 @@
+"""
+Content hashing of scanned files for duplicate detection.
+
+Hashing every byte of a survey is expensive, so candidates are narrowed first:
+
+1. files are bucketed by size, and only sizes shared by two or more files
+   can hold duplicates
+2. those files get a quick hash of their first block, which splits most
+   same-size buckets apart
+3. only files that still collide are hashed in full
+
+Hashes run in a process pool with chunked reads and are cached in SQLite by
+(device, inode, mtime, size), so a rescan only hashes files that changed.
+BLAKE3 or xxHash are used when installed, BLAKE2b otherwise.
+"""
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from utils.bulk_load import EDGE_COLUMNS
+from utils.identity import normalize_path, path_uid
+
+try:
+    import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+HASH_ALGORITHMS = [name for name, available in
+                   (("blake3", BLAKE3_AVAILABLE), ("xxh3_128", XXHASH_AVAILABLE), ("blake2b", True)) if available]
+DEFAULT_ALGORITHM = HASH_ALGORITHMS[0]
+DEFAULT_CACHE_PATH = Path.home() / ".science_data_kit" / "hash_cache.sqlite"
+DEFAULT_WORKERS = max(1, min(8, os.cpu_count() or 1))
+CHUNK_SIZE = 1 << 20
+PARTIAL_SIZE = 64 << 10
+DUPLICATE_RELATIONSHIP = "DUPLICATE_OF"
+
+
+def _hasher(algorithm):
+    if algorithm == "blake3":
+        return blake3.blake3()
+    if algorithm == "xxh3_128":
+        return xxhash.xxh3_128()
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=16)
+    raise ValueError(f"Unknown hash algorithm '{algorithm}'. Available: {HASH_ALGORITHMS}.")
+
+
+def hash_file(path, algorithm=DEFAULT_ALGORITHM, limit=None, chunk_size=CHUNK_SIZE):
+    """
+    Hash a file with chunked reads.
+
+    Args:
+        path (str): File to hash.
+        algorithm (str): One of `HASH_ALGORITHMS`.
+        limit (int, optional): Only hash the first `limit` bytes.
+        chunk_size (int): Bytes per read.
+
+    Returns:
+        str or None: Hex digest, or None if the file could not be read.
+    """
+    hasher = _hasher(algorithm)
+    remaining = limit
+    try:
+        with open(path, "rb", buffering=0) as f:
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
+def _hash_task(args):
+    path, algorithm, limit = args
+    return hash_file(path, algorithm, limit)
+
+
+class HashCache:
+    """Persistent digests keyed by (device, inode, mtime, size, algorithm, partial)."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "dev INTEGER, ino INTEGER, mtime_ns INTEGER, size INTEGER, algorithm TEXT, partial INTEGER, "
+            "digest TEXT, PRIMARY KEY (dev, ino, mtime_ns, size, algorithm, partial))"
+        )
+
+    def get_many(self, keys, algorithm, partial):
+        # One join against a temporary table of the keys instead of one lookup per key
+        connection = self.connection
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (dev INTEGER, ino INTEGER, mtime_ns INTEGER, "
+                           "size INTEGER)")
+        connection.execute("DELETE FROM lookup")
+        connection.executemany("INSERT INTO lookup VALUES (?, ?, ?, ?)", keys)
+        rows = connection.execute(
+            "SELECT h.dev, h.ino, h.mtime_ns, h.size, h.digest FROM lookup l JOIN hashes h "
+            "ON h.dev = l.dev AND h.ino = l.ino AND h.mtime_ns = l.mtime_ns AND h.size = l.size "
+            "AND h.algorithm = ? AND h.partial = ?",
+            (algorithm, int(partial))
+        ).fetchall()
+        connection.execute("DELETE FROM lookup")
+        connection.commit()
+        return {tuple(row[:4]): row[4] for row in rows}
+
+    def put_many(self, items, algorithm, partial):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(*key, algorithm, int(partial), digest) for key, digest in items if digest is not None]
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _hash_paths(paths, algorithm, partial, cache, pool, on_progress=None, cancel_event=None):
+    """Hash `paths` (full or first block), using and filling the cache."""
+    keys = {path: _stat_key(path) for path in paths}
+    cached = cache.get_many([key for key in keys.values() if key], algorithm, partial) if cache else {}
+    digests = {path: cached.get(key) for path, key in keys.items() if key}
+    missing = [path for path, digest in digests.items() if digest is None]
+
+    limit = PARTIAL_SIZE if partial else None
+    batch = max(1, len(missing) // 100)
+    for start in range(0, len(missing), batch * 10):
+        if cancel_event is not None and cancel_event.is_set():
+            raise InterruptedError("Hashing was cancelled.")
+        chunk = missing[start:start + batch * 10]
+        results = pool.map(_hash_task, [(path, algorithm, limit) for path in chunk], chunksize=batch)
+        hashed = list(zip(chunk, results))
+        digests.update(hashed)
+        if cache:
+            cache.put_many([(keys[path], digest) for path, digest in hashed], algorithm, partial)
+        if on_progress:
+            on_progress(len(chunk))
+    return digests
+
+
+def hash_scan(scanned_files, algorithm=DEFAULT_ALGORITHM, workers=DEFAULT_WORKERS, hash_all=False,
+              cache_path=DEFAULT_CACHE_PATH, on_progress=None, cancel_event=None):
+    """
+    Hash the files of a scan that could have duplicates (or all of them).
+
+    Args:
+        scanned_files (pd.DataFrame): Scan rows with `Path`, `Size (Bytes)` and `Type`.
+        algorithm (str): One of `HASH_ALGORITHMS`.
+        workers (int): Hashing processes.
+        hash_all (bool): Hash every file, not just duplicate candidates.
+        cache_path (str, optional): SQLite hash cache; None disables caching.
+        on_progress (callable, optional): Called with the number of files hashed in each batch.
+        cancel_event (threading.Event, optional): Stops hashing when set.
+
+    Returns:
+        pd.DataFrame: `Path`, `content_hash` and `hash_algorithm` for every fully hashed file.
+    """
+    files = scanned_files[(scanned_files["Type"] == "File") & (scanned_files["Size (Bytes)"] > 0)]
+    if hash_all:
+        candidates = files
+    else:
+        sizes = files["Size (Bytes)"]
+        candidates = files[sizes.duplicated(keep=False)]
+
+    cache = HashCache(cache_path) if cache_path else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            if not hash_all:
+                # Same size and same first block: the only files worth reading in full
+                small = candidates["Size (Bytes)"] <= PARTIAL_SIZE
+                large = candidates[~small]
+                partial = _hash_paths(large["Path"].tolist(), algorithm, True, cache, pool,
+                                      on_progress, cancel_event)
+                large = large.assign(_partial=large["Path"].map(partial)).dropna(subset=["_partial"])
+                large = large[large.duplicated(["Size (Bytes)", "_partial"], keep=False)]
+                candidates = pd.concat([candidates[small], large.drop(columns="_partial")])
+            digests = _hash_paths(candidates["Path"].tolist(), algorithm, False, cache, pool,
+                                  on_progress, cancel_event)
+    finally:
+        if cache:
+            cache.close()
+
+    hashes = pd.DataFrame({"Path": list(digests), "content_hash": list(digests.values())}).dropna()
+    hashes["hash_algorithm"] = algorithm
+    return hashes.reset_index(drop=True)
+
+
+def duplicate_groups(hashes, scanned_files=None):
+    """
+    Group hashed files that share a digest.
+
+    Args:
+        hashes (pd.DataFrame): Output of `hash_scan`.
+        scanned_files (pd.DataFrame, optional): Scan rows, to report sizes.
+
+    Returns:
+        pd.DataFrame: `content_hash`, `copies`, `canonical` (first path) and, with
+        scan rows, `size` and `redundant_bytes`; largest waste first.
+    """
+    duplicated = hashes[hashes["content_hash"].duplicated(keep=False)]
+    groups = duplicated.sort_values("Path").groupby("content_hash").agg(
+        copies=("Path", "size"), canonical=("Path", "first")
+    ).reset_index()
+    if scanned_files is not None:
+        sizes = scanned_files.set_index("Path")["Size (Bytes)"]
+        groups["size"] = groups["canonical"].map(sizes)
+        groups["redundant_bytes"] = groups["size"] * (groups["copies"] - 1)
+        groups = groups.sort_values("redundant_bytes", ascending=False)
+    return groups.reset_index(drop=True)
+
+
+def duplicate_edges(hashes, namespace, file_label="File"):
+    """
+    Build `DUPLICATE_OF` edges from every copy to the canonical (first) path of its group.
+
+    Args:
+        hashes (pd.DataFrame): Output of `hash_scan`.
+        namespace (str): Namespace from `utils.identity.scan_namespace`.
+        file_label (str): Label of the file nodes.
+
+    Returns:
+        pd.DataFrame: Edge table (`utils.bulk_load.EDGE_COLUMNS`).
+    """
+    duplicated = hashes[hashes["content_hash"].duplicated(keep=False)].sort_values("Path")
+    canonical = duplicated.groupby("content_hash")["Path"].transform("first")
+    copies = duplicated[duplicated["Path"] != canonical]
+    return pd.DataFrame({
+        "start_uid": [path_uid(namespace, p) for p in copies["Path"]],
+        "start_label": file_label,
+        "end_uid": [path_uid(namespace, p) for p in canonical[copies.index]],
+        "end_label": file_label,
+        "type": DUPLICATE_RELATIONSHIP,
+    }, columns=EDGE_COLUMNS)
+
+
+def hash_tables(hashes, namespace, file_label="File"):
+    """
+    Build node and edge tables that add hashes to File nodes and link their duplicates.
+
+    The nodes carry `filepath` as well, so they line up with the File nodes of
+    `utils.bulk_load.build_scan_tables` for the same scan and namespace.
+
+    Returns:
+        tuple: (nodes, edges) DataFrames.
+    """
+    paths = hashes["Path"].map(normalize_path)
+    nodes = pd.DataFrame({
+        "uid": [path_uid(namespace, p) for p in paths],
+        "label": file_label,
+        "filepath": paths.to_numpy(),
+        "content_hash": hashes["content_hash"].to_numpy(),
+        "hash_algorithm": hashes["hash_algorithm"].to_numpy(),
+    })
+    return nodes, duplicate_edges(hashes.assign(Path=paths), namespace, file_label=file_label)
@@ -0,0 +1,85 @@
+"""
+Deterministic, content-addressed identifiers for graph nodes.
+
+Folder/File and taxonomy nodes are keyed by a hash of where they come from
+rather than by a random uid, so any worker can compute the id of a node (and
+of its parent) without asking the database first, and re-running a load
+MERGEs onto the same nodes instead of creating duplicates.
+"""
+import hashlib
+import socket
+from pathlib import PurePosixPath
+
+# 16 bytes -> 32 hex characters, the same width as a UUID4 hex string
+UID_DIGEST_SIZE = 16
+
+# Separator that cannot appear in a path or a typed-in label
+_SEP = "\x1f"
+
+
+def scan_namespace(host=None):
+    """
+    Return the namespace that scanned paths are hashed under.
+
+    Args:
+        host (str, optional): Host or volume name. Defaults to this machine's hostname.
+
+    Returns:
+        str: Namespace string.
+    """
+    return host.strip() if host and host.strip() else socket.gethostname()
+
+
+def normalize_path(path):
+    """Return a POSIX form of `path` without trailing separators."""
+    normalized = PurePosixPath(str(path).replace("\\", "/")).as_posix()
+    return normalized.rstrip("/") or "/"
+
+
+def _digest(*parts):
+    key = _SEP.join(str(part) for part in parts)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=UID_DIGEST_SIZE).hexdigest()
+
+
+def path_uid(namespace, path):
+    """
+    Compute the uid of a Folder/File node.
+
+    Args:
+        namespace (str): Namespace from `scan_namespace`.
+        path (str): Absolute path of the folder or file.
+
+    Returns:
+        str: Hex uid.
+    """
+    return _digest("path", namespace, normalize_path(path))
+
+
+def taxonomy_uid(keys, values):
+    """
+    Compute the uid of a taxonomy node from its chain of (key, value) levels.
+
+    Args:
+        keys (list): Taxonomy keys from the root down to this node.
+        values (list): Values of those keys, in the same order.
+
+    Returns:
+        str: Hex uid.
+    """
+    if len(keys) != len(values):
+        raise ValueError("keys and values must have the same length.")
+    return _digest("taxonomy", *(f"{k}={v}" for k, v in zip(keys, values)))
+
+
+def entity_uid(label, key_values):
+    """
+    Compute the uid of an entity node from its label and the values of its key columns.
+
+    Args:
+        label (str): Node label.
+        key_values (list): Values of the columns that identify the entity.
+
+    Returns:
+        str: Hex uid.
+    """
+    return _digest("entity", label, *(str(v) for v in key_values))
@@ -0,0 +1,319 @@
+"""
+Built-in background job kinds: filesystem scans, content hashing, metadata
+extraction, table pushes, graph exports and watch mode.
+
+Each task is registered with `utils.jobs.register_task` and runs in a worker
+thread with its `Job` and a dict of live resources (the Neo4j driver and, for
+server-side loads, the Docker container).
+"""
+import os
+import re
+
+import pandas as pd
+
+from utils.archives import expand_archives
+from utils.bulk_load import DEFAULT_BATCH_SIZE, push_tables
+from utils.hashing import DEFAULT_ALGORITHM, DEFAULT_WORKERS, duplicate_groups, hash_scan
+from utils.jobs import register_task
+from utils.metadata import DEFAULT_WORKERS as METADATA_WORKERS, extract_metadata
+from utils.prune import PruneRules, walk_tree
+from utils.scanner import load_ncdu_export, run_ncdu
+from utils.server_import import load_tables_via_csv
+from utils.sharded_scan import sharded_scan
+from utils.watch import DEFAULT_DEBOUNCE, DEFAULT_RESCAN_INTERVAL, Watcher
+
+# ncdu progress lines report the number of items seen so far
+_NCDU_ITEMS = re.compile(r"Total items:\s*([\d,]+)")
+
+
+@register_task("scan")
+def scan_task(job, resources):
+    """
+    Scan one or more directories and store the scan rows as `scanned_files.parquet`.
+
+    A single root with one shard is scanned by one ncdu process; otherwise the
+    roots are split into balanced shards scanned in a process pool.
+
+    Params:
+        root (str): Directory to scan.
+        roots (list, optional): Further directories to scan with it.
+        output_json_path (str): Where ncdu writes its export (single-process scans).
+        extra_args (list, optional): Additional ncdu arguments.
+        shards (int, optional): Number of shards / worker processes.
+        pin_mounts (bool, optional): Keep each shard on one mount.
+        weights (dict, optional): Estimated size of top-level directories, for shard planning.
+        exclude (list, optional): Directories to leave out of the scan.
+        prune (dict, optional): `utils.prune.PruneRules` settings; when set, the tree
+            is walked with the scandir walker, which applies them during the walk.
+        archives (dict, optional): List zip/tar members as virtual rows;
+            `{"compressed": True}` also lists compressed tars.
+    """
+    params = job.params
+    roots = [params["root"]] + list(params.get("roots") or [])
+    shards = int(params.get("shards") or 1)
+    rules = PruneRules.from_dict(params.get("prune"))
+    if rules and params.get("exclude"):
+        # Subtrees excluded on the estimate are just more anchored exclude patterns
+        root = params["root"]
+        rules = PruneRules.from_dict({**rules.to_dict(), "exclude": rules.exclude + [
+            "/" + os.path.relpath(path, root).replace(os.sep, "/") + "/" for path in params["exclude"]
+        ]})
+
+    if len(roots) == 1 and shards == 1 and rules:
+        job.update(message=f"Walking {params['root']} with pruning rules", force=True)
+        scanned_files = walk_tree(
+            params["root"],
+            rules,
+            on_progress=lambda seen: job.update(done=seen),
+            cancel_event=job.cancel_event
+        )
+    elif len(roots) == 1 and shards == 1:
+        def on_output(line):
+            job.log(line)
+            match = _NCDU_ITEMS.search(line)
+            if match:
+                job.update(done=int(match.group(1).replace(",", "")))
+
+        job.update(message=f"Scanning {params['root']}", force=True)
+        run_ncdu(
+            params["root"],
+            params["output_json_path"],
+            extra_args=params.get("extra_args"),
+            on_output=on_output,
+            cancel_event=job.cancel_event
+        )
+        job.update(message="Reading scan results", force=True)
+        scanned_files = load_ncdu_export(params["output_json_path"])
+    else:
+        def on_shard(shard, rows):
+            job.log(f"Shard of {len(shard['paths'])} directories finished: {rows} items")
+            job.update(advance=1, message=f"Scanned {job.done + 1} / {job.total} shards")
+
+        job.update(message=f"Planning shards for {len(roots)} root(s)", force=True)
+        scanned_files = sharded_scan(
+            roots,
+            job.file("shards"),
+            shards=shards,
+            pin_mounts=bool(params.get("pin_mounts")),
+            extra_args=params.get("extra_args"),
+            weights=params.get("weights"),
+            exclude=params.get("exclude"),
+            rules=rules,
+            on_shard=on_shard,
+            on_plan=lambda planned: job.update(done=0, total=len(planned), force=True),
+            cancel_event=job.cancel_event
+        )
+
+    if params.get("archives") is not None:
+        job.update(message="Listing archive members", force=True)
+        scanned_files = expand_archives(
+            scanned_files,
+            compressed=bool(params["archives"].get("compressed")),
+            cancel_event=job.cancel_event
+        )
+
+    scanned_files.to_parquet(job.file("scanned_files.parquet"), index=False)
+    job.result = {"scanned_files": str(job.file("scanned_files.parquet")), "rows": len(scanned_files)}
+    job.update(message=f"Scanned {len(scanned_files)} items", force=True)
+
+
+@register_task("hash")
+def hash_task(job, resources):
+    """
+    Hash the files of the job's `scanned_files.parquet` and store `hashes.parquet`.
+
+    Params:
+        algorithm (str, optional): One of `utils.hashing.HASH_ALGORITHMS`.
+        workers (int, optional): Hashing processes.
+        hash_all (bool, optional): Hash every file, not just duplicate candidates.
+    """
+    params = job.params
+    scanned_files = pd.read_parquet(job.file("scanned_files.parquet"))
+    job.update(done=0, message="Hashing duplicate candidates", force=True)
+    hashes = hash_scan(
+        scanned_files,
+        algorithm=params.get("algorithm") or DEFAULT_ALGORITHM,
+        workers=int(params.get("workers") or DEFAULT_WORKERS),
+        hash_all=bool(params.get("hash_all")),
+        on_progress=lambda count: job.update(advance=count),
+        cancel_event=job.cancel_event
+    )
+    hashes.to_parquet(job.file("hashes.parquet"), index=False)
+    groups = duplicate_groups(hashes, scanned_files)
+    job.result = {
+        "hashes": str(job.file("hashes.parquet")),
+        "hashed": len(hashes),
+        "duplicate_groups": len(groups),
+        "redundant_bytes": int(groups["redundant_bytes"].sum()) if len(groups) else 0,
+    }
+    job.update(message=f"Hashed {len(hashes)} files, {len(groups)} duplicate groups", force=True)
+
+
+@register_task("metadata")
+def metadata_task(job, resources):
+    """
+    Read imaging headers for the files of the job's `scanned_files.parquet` and store `metadata.parquet`.
+
+    Params:
+        formats (list, optional): Extractor names from `utils.metadata.extractor_names`.
+        workers (int, optional): Extraction processes.
+    """
+    params = job.params
+    scanned_files = pd.read_parquet(job.file("scanned_files.parquet"))
+    job.update(done=0, message="Reading file headers", force=True)
+    metadata = extract_metadata(
+        scanned_files,
+        formats=params.get("formats"),
+        workers=int(params.get("workers") or METADATA_WORKERS),
+        on_progress=lambda count: job.update(advance=count),
+        cancel_event=job.cancel_event
+    )
+    metadata.to_parquet(job.file("metadata.parquet"), index=False)
+    job.result = {"metadata": str(job.file("metadata.parquet")), "rows": len(metadata),
+                  "formats": metadata["format"].value_counts().to_dict()}
+    job.update(message=f"Read headers of {len(metadata)} imaging files", force=True)
+
+
+@register_task("push")
+def push_task(job, resources):
+    """
+    Write the job's `nodes.parquet` / `edges.parquet` tables to Neo4j.
+
+    Bolt pushes checkpoint the rows committed after every batch and LOAD CSV
+    pushes the files loaded, so a resumed job carries on from there.
+
+    Params:
+        database (str, optional): Target database.
+        batch_size (int, optional): Rows per Bolt transaction.
+        write_options (dict, optional): Arguments for `load_tables_via_csv`;
+            None for Bolt batches.
+
+    Resources:
+        driver: Neo4j driver.
+        container: Neo4j container (LOAD CSV only).
+    """
+    params = job.params
+    driver = resources.get("driver")
+    if driver is None:
+        raise RuntimeError("A push job needs a Neo4j driver; reconnect and resume it.")
+
+    nodes = pd.read_parquet(job.file("nodes.parquet"))
+    edges = pd.read_parquet(job.file("edges.parquet"))
+    job.update(total=len(nodes) + len(edges), force=True)
+    write_options = params.get("write_options")
+
+    if write_options is None:
+        committed = job.checkpoint.get("rows_committed", 0)
+        job.update(done=committed, message="Pushing batches")
+
+        def on_batch(batch_rows):
+            job.set_checkpoint(rows_committed=job.checkpoint.get("rows_committed", 0) + batch_rows)
+            job.update(advance=batch_rows)
+            job.check_cancelled()
+
+        push_tables(
+            driver, nodes, edges,
+            batch_size=params.get("batch_size", DEFAULT_BATCH_SIZE),
+            database=params.get("database"),
+            on_batch=on_batch,
+            skip_rows=committed
+        )
+    else:
+        container = resources.get("container")
+        if container is None or container.status != "running":
+            raise RuntimeError("Server-side LOAD CSV needs the managed Neo4j container.")
+        job.update(done=job.checkpoint.get("rows_committed", 0), message="Loading CSV files")
+
+        def on_file(entry):
+            job.set_checkpoint(
+                files_loaded=job.checkpoint.get("files_loaded", 0) + 1,
+                rows_committed=job.checkpoint.get("rows_committed", 0) + entry["rows"]
+            )
+            job.update(advance=entry["rows"])
+            job.log(f"Loaded {entry['file']} ({entry['rows']} rows)")
+            job.check_cancelled()
+
+        stats = load_tables_via_csv(
+            driver, container, nodes, edges,
+            database=params.get("database"),
+            on_file=on_file,
+            skip_files=job.checkpoint.get("files_loaded", 0),
+            **write_options
+        )
+        job.result = stats
+
+    job.update(message=f"Pushed {job.checkpoint.get('rows_committed', 0)} rows", force=True)
+
+
+@register_task("export")
+def export_task(job, resources):
+    """
+    Export the whole graph to a pickled NetworkX file.
+
+    Params:
+        file_path (str): Output file.
+        database (str, optional): Database to export.
+
+    Resources:
+        driver: Neo4j driver.
+    """
+    # utils.database needs Streamlit and Docker, so only import it for exports
+    from utils.database import export_graph_to_file
+
+    driver = resources.get("driver")
+    if driver is None:
+        raise RuntimeError("An export job needs a Neo4j driver.")
+
+    job.update(message="Exporting graph", force=True)
+    with driver.session(database=job.params.get("database")) as session:
+        success, message = export_graph_to_file(session, job.params["file_path"])
+    if not success:
+        raise RuntimeError(message)
+    job.result = {"file_path": job.params["file_path"]}
+    job.update(message=message, force=True)
+
+
+@register_task("watch")
+def watch_task(job, resources):
+    """
+    Keep the Folder/File nodes of surveyed roots in sync until the job is cancelled.
+
+    Params:
+        roots (list): Directories to watch.
+        namespace (str, optional): Namespace the roots were surveyed under.
+        database (str, optional): Target database.
+        include_files (bool, optional): Keep File nodes in sync as well as Folders.
+        prune (dict, optional): `utils.prune.PruneRules` settings.
+        debounce (float, optional): Seconds without events before a batch is applied.
+        rescan_interval (float, optional): Seconds between rescans when polling.
+        expected_directories (int, optional): Directories under the roots, from the last scan.
+
+    Resources:
+        driver: Neo4j driver.
+    """
+    params = job.params
+    driver = resources.get("driver")
+    if driver is None:
+        raise RuntimeError("A watch job needs a Neo4j driver; reconnect and resume it.")
+
+    def on_batch(mode, stats):
+        job.update(advance=stats["created"] + stats["deleted"],
+                   message=f"Watching ({mode}): last batch {stats['created']} created, {stats['deleted']} deleted",
+                   force=True)
+
+    watcher = Watcher(
+        driver,
+        params["roots"],
+        namespace=params.get("namespace"),
+        database=params.get("database"),
+        include_files=bool(params.get("include_files", True)),
+        rules=PruneRules.from_dict(params.get("prune")),
+        debounce=float(params.get("debounce") or DEFAULT_DEBOUNCE),
+        rescan_interval=float(params.get("rescan_interval") or DEFAULT_RESCAN_INTERVAL),
+        expected_directories=params.get("expected_directories"),
+        on_batch=on_batch,
+        log=job.log
+    )
+    job.update(message=f"Watching {', '.join(params['roots'])}", force=True)
+    watcher.run(job.cancel_event)
+    job.check_cancelled()
@@ -0,0 +1,401 @@
+"""
+Background jobs that outlive Streamlit reruns.
+
+Scans, pushes and exports are submitted to a process-wide `JobManager` and run
+in worker threads, so closing the tab or rerunning a page neither kills nor
+restarts them. Every job keeps its state in `~/.science_data_kit/jobs/<id>/`:
+
+- `job.json`: kind, status, progress, throughput, ETA, log tail and checkpoint
+- any input or result tables the job reads or writes (as Parquet)
+
+Pages list jobs and attach to them by id. Jobs found on disk in a running
+state that no live process owns are reported as interrupted; jobs with a
+checkpoint (pushes) can then be resumed where their last batch committed.
+
+Job kinds are plain functions registered with `register_task`; the built-in
+kinds live in `utils.job_tasks`.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from utils.query_profile import profiled_action
+
+DEFAULT_JOBS_DIR = Path.home() / ".science_data_kit" / "jobs"
+JOB_STATES = ("queued", "running", "completed", "failed", "cancelled", "interrupted")
+ACTIVE_STATES = ("queued", "running")
+RESUMABLE_STATES = ("failed", "cancelled", "interrupted")
+LOG_TAIL_LINES = 200
+
+# Minimum seconds between progress writes to job.json
+SAVE_INTERVAL = 1.0
+
+_TASKS = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a task when its job has been cancelled."""
+
+
+def register_task(kind):
+    """
+    Register a function as the runner for a job kind.
+
+    The function is called as `task(job, resources)` in a worker thread, where
+    `resources` holds live objects (drivers, containers) that are not persisted.
+    """
+    def decorator(func):
+        _TASKS[kind] = func
+        return func
+    return decorator
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except (OSError, TypeError):
+        return False
+    return True
+
+
+class Job:
+    """
+    State of one background job.
+
+    Tasks report through `update`, `log` and `set_checkpoint`, and call
+    `check_cancelled` between units of work so cancellation takes effect
+    promptly.
+    """
+
+    def __init__(self, kind, params=None, title=None, job_id=None, directory=DEFAULT_JOBS_DIR):
+        self.id = job_id or f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.kind = kind
+        self.title = title or kind
+        self.params = params or {}
+        self.directory = Path(directory) / self.id
+        self.status = "queued"
+        self.total = None
+        self.done = 0
+        self.message = ""
+        self.error = None
+        self.checkpoint = {}
+        self.result = {}
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.pid = os.getpid()
+        self.logs = deque(maxlen=LOG_TAIL_LINES)
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._last_save = 0.
+        # (time, done) when the current run started, so a resumed job's rate
+        # only counts work done by this run
+        self._rate_origin = None
+        # Throughput and ETA last written by the job's owner, for jobs loaded from disk
+        self._stored_rates = (None, None)
+
+    # --- paths -------------------------------------------------------------
+
+    def file(self, name):
+        """Return the path of a file in this job's directory."""
+        return self.directory / name
+
+    # --- reporting ---------------------------------------------------------
+
+    @property
+    def throughput(self):
+        """Units of work per second in the current run, or None before any progress."""
+        if self._rate_origin is None:
+            return self._stored_rates[0]
+        start_time, start_done = self._rate_origin
+        elapsed = (self.finished or time.time()) - start_time
+        if elapsed <= 0 or self.done <= start_done:
+            return None
+        return (self.done - start_done) / elapsed
+
+    @property
+    def eta(self):
+        """Estimated seconds remaining, or None when the total or rate is unknown."""
+        if self._rate_origin is None:
+            return self._stored_rates[1] if self.status == "running" else None
+        rate = self.throughput
+        if self.status != "running" or not self.total or not rate:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    @property
+    def progress(self):
+        """Fraction complete between 0 and 1, or None when the total is unknown."""
+        if not self.total:
+            return 1. if self.status == "completed" else None
+        return min(self.done / self.total, 1.)
+
+    def update(self, done=None, total=None, advance=None, message=None, force=False):
+        """
+        Record progress and persist it (at most once per `SAVE_INTERVAL` unless forced).
+
+        Args:
+            done (int, optional): Units completed so far.
+            total (int, optional): Total units, if known.
+            advance (int, optional): Units completed since the last call.
+            message (str, optional): Short status text.
+            force (bool): Write job.json immediately.
+        """
+        with self._lock:
+            if total is not None:
+                self.total = total
+            if done is not None:
+                self.done = done
+            if advance:
+                self.done += advance
+            if message is not None:
+                self.message = message
+        self._maybe_save(force)
+
+    def log(self, line):
+        """Append a line to the job's log tail."""
+        line = line.rstrip("\n")
+        if line:
+            with self._lock:
+                self.logs.append(line)
+            self._maybe_save()
+
+    def set_checkpoint(self, **values):
+        """Record how far the job has durably got; always written immediately."""
+        with self._lock:
+            self.checkpoint.update(values)
+        self.save()
+
+    def cancel(self):
+        """Ask the job to stop at its next `check_cancelled`."""
+        self._cancel_event.set()
+
+    @property
+    def cancel_event(self):
+        """`threading.Event` set when the job is cancelled, for blocking helpers."""
+        return self._cancel_event
+
+    def check_cancelled(self):
+        """Raise `JobCancelled` if the job has been cancelled."""
+        if self._cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled.")
+
+    # --- persistence -------------------------------------------------------
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "title": self.title,
+                "params": self.params,
+                "status": self.status,
+                "total": self.total,
+                "done": self.done,
+                "throughput": self.throughput,
+                "eta": self.eta,
+                "message": self.message,
+                "error": self.error,
+                "checkpoint": self.checkpoint,
+                "result": self.result,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "pid": self.pid,
+                "logs": list(self.logs),
+            }
+
+    @classmethod
+    def from_dict(cls, data, directory=DEFAULT_JOBS_DIR):
+        job = cls(data["kind"], data.get("params"), data.get("title"), job_id=data["id"], directory=directory)
+        for field in ("status", "total", "done", "message", "error", "created", "started", "finished", "pid"):
+            setattr(job, field, data.get(field, getattr(job, field)))
+        job.checkpoint = data.get("checkpoint") or {}
+        job.result = data.get("result") or {}
+        job.logs.extend(data.get("logs") or [])
+        job._stored_rates = (data.get("throughput"), data.get("eta"))
+        return job
+
+    def save(self):
+        """Write job.json atomically, so readers never see a partial file."""
+        with self._save_lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            data = self.to_dict()
+            temp_path = self.file("job.json.tmp")
+            with open(temp_path, "w") as f:
+                json.dump(data, f, default=str)
+            os.replace(temp_path, self.file("job.json"))
+            self._last_save = time.time()
+
+    def _maybe_save(self, force=False):
+        if force or time.time() - self._last_save >= SAVE_INTERVAL:
+            self.save()
+
+
+class JobManager:
+    """Runs jobs in daemon threads and tracks them in memory and on disk."""
+
+    def __init__(self, directory=DEFAULT_JOBS_DIR):
+        self.directory = Path(directory)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, params=None, title=None, resources=None, inputs=None):
+        """
+        Create a job and start it in a worker thread.
+
+        Args:
+            kind (str): Registered job kind.
+            params (dict, optional): JSON-serialisable parameters, persisted with the job.
+            title (str, optional): Human-readable title.
+            resources (dict, optional): Live objects the task needs; not persisted.
+            inputs (dict, optional): Name -> DataFrame written to the job directory as
+                Parquet before the job starts, so it can be resumed from disk.
+
+        Returns:
+            Job: The submitted job.
+        """
+        if kind not in _TASKS:
+            raise ValueError(f"Unknown job kind '{kind}'. Expected one of {sorted(_TASKS)}.")
+        job = Job(kind, params, title, directory=self.directory)
+        job.directory.mkdir(parents=True, exist_ok=True)
+        for name, frame in (inputs or {}).items():
+            frame.to_parquet(job.file(f"{name}.parquet"), index=False)
+        job.save()
+        self._start(job, resources)
+        return job
+
+    def resume(self, job_id, resources=None):
+        """
+        Restart a failed, cancelled or interrupted job from its checkpoint.
+
+        Returns:
+            Job: The resumed job.
+        """
+        job = self.get(job_id)
+        if job is None:
+            raise ValueError(f"No job with id '{job_id}'.")
+        if job.status not in RESUMABLE_STATES:
+            raise ValueError(f"Job '{job_id}' is {job.status} and cannot be resumed.")
+        resumed = Job(job.kind, job.params, job.title, job_id=job.id, directory=self.directory)
+        resumed.checkpoint = dict(job.checkpoint)
+        resumed.total = job.total
+        resumed.done = job.done
+        resumed.created = job.created
+        resumed.logs.extend(job.logs)
+        resumed.log(f"Resuming from checkpoint {resumed.checkpoint}" if resumed.checkpoint else "Restarting")
+        resumed.save()
+        self._start(resumed, resources)
+        return resumed
+
+    def _start(self, job, resources):
+        with self._lock:
+            self._jobs[job.id] = job
+        thread = threading.Thread(target=self._run, args=(job, resources or {}), name=f"job-{job.id}", daemon=True)
+        thread.start()
+
+    def _run(self, job, resources):
+        job.status = "running"
+        job.started = time.time()
+        job.error = None
+        job._rate_origin = (job.started, job.done)
+        job.save()
+        try:
+            with profiled_action(f"Job: {job.title}"):
+                _TASKS[job.kind](job, resources)
+            job.status = "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+        except InterruptedError as e:
+            job.status = "cancelled"
+            job.log(str(e))
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.log(f"Error: {e}")
+        finally:
+            job.finished = time.time()
+            job.save()
+
+    def get(self, job_id):
+        """Return a job by id, from memory or from disk, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        return self._load(self.directory / job_id / "job.json")
+
+    def _load(self, path):
+        try:
+            with open(path, "r") as f:
+                job = Job.from_dict(json.load(f), directory=self.directory)
+        except (OSError, ValueError, KeyError):
+            return None
+        # A job left running by a process that has gone away will never finish
+        if job.status in ACTIVE_STATES and not _pid_alive(job.pid):
+            job.status = "interrupted"
+        return job
+
+    def list_jobs(self, kinds=None, limit=None):
+        """
+        List jobs, newest first, including those from earlier sessions.
+
+        Args:
+            kinds (list, optional): Only return jobs of these kinds.
+            limit (int, optional): Maximum number of jobs.
+
+        Returns:
+            list: Jobs.
+        """
+        with self._lock:
+            jobs = dict(self._jobs)
+        if self.directory.exists():
+            for path in self.directory.glob("*/job.json"):
+                job_id = path.parent.name
+                if job_id not in jobs:
+                    job = self._load(path)
+                    if job is not None:
+                        jobs[job_id] = job
+        selected = [job for job in jobs.values() if not kinds or job.kind in kinds]
+        selected.sort(key=lambda job: job.created, reverse=True)
+        return selected[:limit] if limit else selected
+
+    def cancel(self, job_id):
+        """Cancel a job running in this process. Returns True if it was running here."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return False
+        job.cancel()
+        return True
+
+    def delete(self, job_id):
+        """Forget a finished job and remove its directory."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status in ACTIVE_STATES:
+                raise ValueError(f"Job '{job_id}' is still {job.status}; cancel it first.")
+            self._jobs.pop(job_id, None)
+        shutil.rmtree(self.directory / job_id, ignore_errors=True)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-wide `JobManager`, shared by every session and rerun."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            import utils.job_tasks  # noqa: F401  registers the built-in job kinds
+            _manager = JobManager()
+        return _manager
@@ -0,0 +1,351 @@
+"""
+Memory accounting and spilling for the tables kept in session state.
+
+Every browser session keeps its own scan, entity and taxonomy tables in
+Streamlit's session state, so a few concurrent users on a large project can
+exhaust the server. This module:
+
+1. measures the deep size of each session entry (`session_usage`); a table
+   shared by several keys, like `entities_df` loaded from `scanned_files`, is
+   counted once
+2. spills cold tables to Parquet under `DEFAULT_SPILL_DIR`, leaving a
+   `SpilledFrame` placeholder in session state (`spill_frame`)
+3. restores spilled tables when a page asks for them (`restore_frames`), which
+   also marks them as recently used
+4. enforces a per-session and a process-wide budget by spilling the least
+   recently used tables first (`enforce_budget`)
+
+Only the tables in `SPILLABLE_KEYS` are ever spilled; pages restore the ones
+they read before reading them.
+"""
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+DEFAULT_SPILL_DIR = Path.home() / ".science_data_kit" / "spill"
+DEFAULT_SESSION_BYTES = 2 << 30
+DEFAULT_GLOBAL_BYTES = 8 << 30
+
+# Sessions not seen for this long no longer count toward the global budget, and their spill files are removed
+SESSION_TTL = 6 * 3600
+
+# Session entries that may be spilled, and the derived entries that reference them and are dropped with them
+SPILLABLE_KEYS = ("scanned_files", "entities_df", "file_hashes", "taxonomy")
+DEPENDENTS = {"entities_df": ("entity_filter", "entity_search_index", "taxonomy_cache")}
+
+# Small state of a dropped dependent that outlives the spill: dependent -> (attribute, key restored under).
+# The restored entry is (table, value), so a page can tell it belongs to the table it reads.
+KEPT_ON_SPILL = {"entity_filter": ("tree", "entity_filter_tree")}
+
+LAST_USED_KEY = "memory_last_used"
+
+# Process-wide accounting: session id -> (bytes, last seen)
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# Deep sizes of tables, remembered per object and shape so reruns do not rescan object columns
+_FRAME_SIZES = {}
+
+
+class SpilledFrame:
+    """
+    Placeholder left in session state for a table written to disk.
+
+    Args:
+        path (Path): Parquet file holding the table.
+        rows (int): Rows in the table.
+        columns (list): Column names.
+        nbytes (int): In-memory size when it was spilled.
+        kept (dict, optional): Session entries to set again on restore (`KEPT_ON_SPILL`).
+    """
+
+    def __init__(self, path, rows, columns, nbytes, kept=None):
+        self.path = Path(path)
+        self.rows = rows
+        self.columns = list(columns)
+        self.nbytes = nbytes
+        self.kept = dict(kept or {})
+
+    @property
+    def empty(self):
+        return self.rows == 0 or not self.columns
+
+    def __len__(self):
+        return self.rows
+
+    def __repr__(self):
+        return f"SpilledFrame({self.rows:,} rows, {len(self.columns)} columns, {self.path.name})"
+
+    def load(self):
+        """Read the table back and delete the spill file."""
+        frame = pd.read_parquet(self.path)
+        self.path.unlink(missing_ok=True)
+        return frame
+
+
+def deep_size(obj, seen=None):
+    """
+    Estimate the memory held by an object, including what it references.
+
+    DataFrames, Series and arrays report their buffers (object columns
+    included); containers and this package's own objects (filters, search
+    indexes) are walked; anything else counts its shallow size.
+
+    Args:
+        obj: Object to measure.
+        seen (set, optional): Ids already counted; shared objects count once.
+
+    Returns:
+        int: Bytes.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return _frame_size(obj)
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, (pa.Array, pa.ChunkedArray, pa.Table)):
+        return int(obj.nbytes)
+    if isinstance(obj, SpilledFrame):
+        return sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(deep_size(item, seen) for item in obj)
+    if type(obj).__module__.startswith("utils.") and hasattr(obj, "__dict__"):
+        return sys.getsizeof(obj) + deep_size(vars(obj), seen)
+    try:
+        return sys.getsizeof(obj)
+    except TypeError:
+        return 0
+
+
+def _frame_size(frame):
+    cached = _FRAME_SIZES.get(id(frame))
+    if cached is not None and cached[0]() is frame and cached[1] == frame.shape:
+        return cached[2]
+    size = int(frame.memory_usage(deep=True, index=True).sum())
+    key = id(frame)
+    _FRAME_SIZES[key] = (weakref.ref(frame, lambda _: _FRAME_SIZES.pop(key, None)), frame.shape, size)
+    return size
+
+
+def session_usage(state):
+    """
+    Measure every entry of a session state.
+
+    Tables are measured first, so an object shared with a filter or index is
+    charged to the table key.
+
+    Args:
+        state (Mapping): Session state (or any dict).
+
+    Returns:
+        pd.DataFrame: `key`, `type`, `bytes` and `spilled` per entry, largest first.
+    """
+    keys = sorted(state.keys(), key=lambda key: not isinstance(state[key], pd.DataFrame))
+    seen, rows = set(), []
+    for key in keys:
+        value = state[key]
+        rows.append({
+            "key": key,
+            "type": type(value).__name__,
+            "bytes": deep_size(value, seen),
+            "spilled": isinstance(value, SpilledFrame),
+        })
+    usage = pd.DataFrame(rows, columns=["key", "type", "bytes", "spilled"])
+    return usage.sort_values("bytes", ascending=False, ignore_index=True)
+
+
+def touch(state, keys):
+    """Mark session entries as used now."""
+    last_used = dict(state.get(LAST_USED_KEY) or {})
+    now = time.time()
+    for key in keys:
+        last_used[key] = now
+    state[LAST_USED_KEY] = last_used
+
+
+def spill_frame(state, key, spill_dir=DEFAULT_SPILL_DIR, session_id="default"):
+    """
+    Write one session table to Parquet and replace it with a `SpilledFrame`.
+
+    Every key holding the same table gets the same placeholder, and the
+    `DEPENDENTS` of each are dropped so the table is really released (all but
+    their `KEPT_ON_SPILL` state, which the placeholder carries).
+
+    Args:
+        state (Mapping): Session state.
+        key (str): Entry to spill; must hold a DataFrame.
+        spill_dir (str or Path): Root of the spill files.
+        session_id (str): Session the files belong to.
+
+    Returns:
+        int: Bytes released (0 if the table cannot be stored as Parquet).
+    """
+    frame = state.get(key)
+    if not isinstance(frame, pd.DataFrame):
+        return 0
+    path = Path(spill_dir) / session_id / f"{key}-{uuid.uuid4().hex[:8]}.parquet"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        frame.to_parquet(path)
+    except (pa.ArrowException, ValueError, TypeError, OSError):
+        # Mixed object columns and the like stay in memory
+        path.unlink(missing_ok=True)
+        return 0
+
+    nbytes = deep_size(frame)
+    placeholder = SpilledFrame(path, len(frame), frame.columns, nbytes)
+    for other in list(state.keys()):
+        if other in state and state[other] is frame:
+            state[other] = placeholder
+            for dependent in DEPENDENTS.get(other, ()):
+                if dependent in state:
+                    if dependent in KEPT_ON_SPILL:
+                        attribute, kept_key = KEPT_ON_SPILL[dependent]
+                        value = getattr(state[dependent], attribute, None)
+                        if value is not None:
+                            placeholder.kept[kept_key] = value
+                    del state[dependent]
+    return nbytes
+
+
+def restore_frames(state, keys):
+    """
+    Bring spilled tables back into memory and mark them as used.
+
+    State kept from the table's dependents is set again as (table, value).
+
+    Args:
+        state (Mapping): Session state.
+        keys (list): Entries the caller is about to read.
+
+    Returns:
+        list: Keys that were restored.
+    """
+    restored = []
+    for key in keys:
+        placeholder = state.get(key)
+        if isinstance(placeholder, SpilledFrame):
+            frame = placeholder.load()
+            # Keys that shared the table share it again
+            for other in list(state.keys()):
+                if state[other] is placeholder:
+                    state[other] = frame
+                    restored.append(other)
+            for kept_key, value in placeholder.kept.items():
+                state[kept_key] = (frame, value)
+    touch(state, keys)
+    return restored
+
+
+def record_usage(session_id, nbytes):
+    """Record a session's total and return the process-wide total over live sessions."""
+    now = time.time()
+    with _SESSIONS_LOCK:
+        _SESSIONS[session_id] = (nbytes, now)
+        for stale in [sid for sid, (_, seen) in _SESSIONS.items() if now - seen > SESSION_TTL]:
+            del _SESSIONS[stale]
+        return sum(size for size, _ in _SESSIONS.values())
+
+
+def global_usage():
+    """Return (bytes, live sessions) across this server process."""
+    with _SESSIONS_LOCK:
+        return sum(size for size, _ in _SESSIONS.values()), len(_SESSIONS)
+
+
+def enforce_budget(state, session_id="default", session_bytes=DEFAULT_SESSION_BYTES,
+                   global_bytes=DEFAULT_GLOBAL_BYTES, protected=(), spill_dir=DEFAULT_SPILL_DIR):
+    """
+    Spill the least recently used tables until the session fits both budgets.
+
+    A session can only spill its own tables, so when the server as a whole is
+    over `global_bytes` each session sheds its share on its next rerun.
+
+    Args:
+        state (Mapping): Session state.
+        session_id (str): Id of the session, for global accounting and spill files.
+        session_bytes (int): Budget for this session.
+        global_bytes (int): Budget for all sessions of this process.
+        protected (iterable): Keys in use by the current page, never spilled.
+        spill_dir (str or Path): Root of the spill files.
+
+    Returns:
+        tuple: (spilled keys, session bytes after spilling)
+    """
+    session_dir = Path(spill_dir) / session_id
+    if session_dir.is_dir():
+        # Keeps `clean_spill_dir` away from the files of live sessions
+        os.utime(session_dir)
+    usage = session_usage(state)
+    total = int(usage["bytes"].sum())
+    server_total = record_usage(session_id, total)
+    excess = max(total - session_bytes, server_total - global_bytes, 0)
+    if not excess:
+        return [], total
+
+    last_used = state.get(LAST_USED_KEY) or {}
+    candidates = usage[usage["key"].isin(SPILLABLE_KEYS) & ~usage["spilled"] & ~usage["key"].isin(list(protected))]
+    candidates = sorted(candidates["key"], key=lambda key: last_used.get(key, 0))
+    spilled = []
+    for key in candidates:
+        if excess <= 0:
+            break
+        freed = spill_frame(state, key, spill_dir, session_id)
+        if freed:
+            spilled.append(key)
+            excess -= freed
+            total -= freed
+    record_usage(session_id, total)
+    return spilled, total
+
+
+def clean_spill_dir(spill_dir=DEFAULT_SPILL_DIR, max_age=SESSION_TTL):
+    """Remove the spill files of sessions idle for longer than `max_age` seconds."""
+    root = Path(spill_dir)
+    if not root.is_dir():
+        return
+    cutoff = time.time() - max_age
+    for session_dir in root.iterdir():
+        try:
+            if session_dir.is_dir() and os.stat(session_dir).st_mtime < cutoff:
+                shutil.rmtree(session_dir, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def renamed_view(frame, columns, renames=None):
+    """
+    Select columns of a frame under new names without copying their data.
+
+    Args:
+        frame (pd.DataFrame): Source table.
+        columns (list): Output column names.
+        renames (dict, optional): Output name -> source column, for renamed columns.
+
+    Returns:
+        pd.DataFrame: A frame sharing the source columns' buffers.
+    """
+    renames = renames or {}
+    data = {}
+    for name in dict.fromkeys(columns):
+        source = renames.get(name, name)
+        if source in frame.columns:
+            data[name] = frame[source]
+    return pd.DataFrame(data, index=frame.index, copy=False)
@@ -0,0 +1,472 @@
+"""
+Header-only metadata extraction for imaging files found by a scan.
+
+Extractors read just the headers of the formats a preclinical imaging share
+is full of, never the pixel data:
+
+- DICOM: `pydicom` stops before the pixel data (needs the optional `pydicom`)
+- NIfTI-1/-2 (`.nii`, `.nii.gz`, `.hdr`): the fixed-size header, unpacked with `struct`
+- TIFF / BigTIFF / OME-TIFF: the first IFD and the IFD chain, with seeks
+- Bruker ParaVision: the small JCAMP-DX parameter files (`method`, `visu_pars`)
+  plus the study's `subject` file
+
+Every extractor returns the same typed columns (`METADATA_COLUMNS`) keyed by
+the scan row's `Path`, so they can be joined onto the scan and mapped to
+node properties like any other column. New formats are added with
+`register_extractor`; extraction runs in a process pool, which on Linux
+inherits extractors registered before the pool starts.
+"""
+import gzip
+import os
+import re
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import PurePath
+
+import pandas as pd
+
+try:
+    import pydicom
+    PYDICOM_AVAILABLE = True
+except ImportError:
+    PYDICOM_AVAILABLE = False
+
+METADATA_COLUMNS = ["Path", "format", "modality", "subject", "dimensions", "voxel_size", "acquisition_date"]
+DEFAULT_WORKERS = max(1, min(8, os.cpu_count() or 1))
+
+# IFDs followed when counting the pages of a TIFF
+MAX_TIFF_PAGES = 10000
+
+# name, match(path) -> bool, extract(path) -> dict or None; tried in order
+_EXTRACTORS = []
+
+
+def register_extractor(name, match):
+    """
+    Register a header extractor.
+
+    Args:
+        name (str): Format name, stored in the `format` column.
+        match (callable): Cheap test on the path (usually its name) for files to try.
+
+    The decorated function takes a path and returns a dict with any of the
+    `METADATA_COLUMNS`, or None if the file is not in its format.
+    """
+    def decorator(func):
+        _EXTRACTORS.append((name, match, func))
+        return func
+    return decorator
+
+
+def extractor_names():
+    """Names of the registered extractors, in the order they are tried."""
+    return [name for name, _, _ in _EXTRACTORS]
+
+
+def _join(values, precision=None):
+    values = [round(float(v), precision) if precision is not None else int(v) for v in values]
+    return "x".join(f"{v:g}" if precision is not None else str(v) for v in values)
+
+
+def _suffixes(path):
+    return "".join(PurePath(path).suffixes[-2:]).lower()
+
+
+# --- DICOM -------------------------------------------------------------------
+
+_DICOM_TAGS = ["Modality", "PatientID", "Rows", "Columns", "NumberOfFrames", "PixelSpacing", "SliceThickness",
+               "AcquisitionDate", "AcquisitionTime", "StudyDate", "StudyTime", "AcquisitionDateTime"]
+_BRUKER_FILES = {"method", "visu_pars", "acqp", "reco", "subject", "fid", "2dseq", "ser", "rawdata.job0"}
+
+
+def _is_dicom_name(path):
+    name = PurePath(path).name
+    suffix = PurePath(name).suffix.lower()
+    # Scanners often write DICOM files without an extension
+    return suffix in (".dcm", ".ima", ".dicom") or (not suffix and name not in _BRUKER_FILES)
+
+
+def _dicom_datetime(date, time=""):
+    text = (str(date) + str(time or "").split(".")[0]).strip()
+    for fmt, length in (("%Y%m%d%H%M%S", 14), ("%Y%m%d%H%M", 12), ("%Y%m%d", 8)):
+        try:
+            return datetime.strptime(text[:length], fmt)
+        except ValueError:
+            continue
+    return None
+
+
+@register_extractor("DICOM", _is_dicom_name)
+def extract_dicom(path):
+    """Read the DICOM header up to, not including, the pixel data."""
+    with open(path, "rb") as f:
+        preamble = f.read(132)
+    if preamble[128:132] != b"DICM" and PurePath(path).suffix.lower() not in (".dcm", ".ima", ".dicom"):
+        return None
+    if not PYDICOM_AVAILABLE:
+        return {"modality": None}
+
+    ds = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=_DICOM_TAGS, force=True)
+    dims = [ds.get("Columns"), ds.get("Rows")]
+    frames = ds.get("NumberOfFrames")
+    if frames and int(frames) > 1:
+        dims.append(frames)
+    spacing = list(ds.get("PixelSpacing") or [])
+    if spacing and ds.get("SliceThickness"):
+        spacing.append(ds.get("SliceThickness"))
+
+    acquired = None
+    if ds.get("AcquisitionDateTime"):
+        acquired = _dicom_datetime(ds.get("AcquisitionDateTime"))
+    if acquired is None and (ds.get("AcquisitionDate") or ds.get("StudyDate")):
+        acquired = _dicom_datetime(ds.get("AcquisitionDate") or ds.get("StudyDate"),
+                                   ds.get("AcquisitionTime") or ds.get("StudyTime"))
+    return {
+        "modality": ds.get("Modality"),
+        "subject": ds.get("PatientID"),
+        "dimensions": _join(dims) if all(d is not None for d in dims) else None,
+        "voxel_size": _join(spacing, 6) if spacing else None,
+        "acquisition_date": acquired,
+    }
+
+
+# --- NIfTI -------------------------------------------------------------------
+
+# xyzt_units spatial code -> millimetres per unit
+_NIFTI_UNITS = {1: 1000., 2: 1., 3: 0.001}
+
+
+def _open_header(path):
+    # Reading the head of a .gz only decompresses as far as it reads
+    return gzip.open(path, "rb") if str(path).lower().endswith(".gz") else open(path, "rb")
+
+
+@register_extractor("NIfTI", lambda path: _suffixes(path).endswith((".nii", ".nii.gz", ".hdr")))
+def extract_nifti(path):
+    """Unpack the fixed-size NIfTI-1 (348 byte) or NIfTI-2 (540 byte) header."""
+    with _open_header(path) as f:
+        header = f.read(540)
+    for order in ("<", ">"):
+        size = struct.unpack(order + "i", header[:4])[0]
+        if size in (348, 540):
+            break
+    else:
+        return None
+
+    if size == 348:
+        dim = struct.unpack(order + "8h", header[40:56])
+        pixdim = struct.unpack(order + "8f", header[76:108])
+        units = header[123] & 0x07
+    else:
+        dim = struct.unpack(order + "8q", header[16:80])
+        pixdim = struct.unpack(order + "8d", header[104:168])
+        units = struct.unpack(order + "i", header[500:504])[0] & 0x07
+
+    ndim = max(0, min(int(dim[0]), 7))
+    scale = _NIFTI_UNITS.get(units, 1.)
+    spatial = min(ndim, 3)
+    return {
+        "dimensions": _join(dim[1:ndim + 1]) if ndim else None,
+        "voxel_size": _join([p * scale for p in pixdim[1:spatial + 1]], 6) if spatial else None,
+    }
+
+
+# --- TIFF --------------------------------------------------------------------
+
+_TIFF_TYPES = {1: "B", 2: "s", 3: "H", 4: "I", 5: "II", 6: "b", 7: "B", 8: "h", 9: "i", 10: "ii", 11: "f",
+               12: "d", 16: "Q", 17: "q", 18: "Q"}
+_TIFF_TAGS = {256: "width", 257: "height", 270: "description", 282: "x_resolution", 296: "resolution_unit",
+              306: "datetime"}
+# ResolutionUnit -> millimetres per unit
+_TIFF_UNITS = {2: 25.4, 3: 10.}
+
+
+def _tiff_value(f, order, type_id, count, inline, offset_format):
+    item = _TIFF_TYPES.get(type_id)
+    if item is None:
+        return None
+    size = count if type_id == 2 else struct.calcsize(order + item) * count
+    if size > len(inline):
+        f.seek(struct.unpack(order + offset_format, inline)[0])
+        data = f.read(size)
+    else:
+        data = inline[:size]
+    if type_id == 2:
+        return data.split(b"\0")[0].decode("latin-1")
+    values = struct.unpack(order + item * count, data)
+    if type_id in (5, 10):
+        values = [n / d if d else 0. for n, d in zip(values[::2], values[1::2])]
+    return values[0] if count == 1 else list(values)
+
+
+def read_tiff_header(path, max_pages=MAX_TIFF_PAGES):
+    """
+    Read the tags of the first IFD and count the IFDs, without reading image data.
+
+    Returns:
+        dict or None: Tags from `_TIFF_TAGS` plus `pages`, or None if not a TIFF.
+    """
+    with open(path, "rb") as f:
+        head = f.read(16)
+        order = {b"II": "<", b"MM": ">"}.get(head[:2])
+        if order is None:
+            return None
+        version = struct.unpack(order + "H", head[2:4])[0]
+        if version == 42:
+            count_format, entry_size, offset_format = "H", 12, "I"
+            offset = struct.unpack(order + "I", head[4:8])[0]
+        elif version == 43:
+            count_format, entry_size, offset_format = "Q", 20, "Q"
+            offset = struct.unpack(order + "Q", head[8:16])[0]
+        else:
+            return None
+        count_size = struct.calcsize(count_format)
+        offset_size = struct.calcsize(offset_format)
+
+        tags, pages, seen = {}, 0, set()
+        while offset and offset not in seen and pages < max_pages:
+            seen.add(offset)
+            f.seek(offset)
+            entries = struct.unpack(order + count_format, f.read(count_size))[0]
+            if pages == 0:
+                block = f.read(entries * entry_size)
+                for i in range(entries):
+                    entry = block[i * entry_size:(i + 1) * entry_size]
+                    tag, type_id = struct.unpack(order + "HH", entry[:4])
+                    if tag in _TIFF_TAGS:
+                        count = struct.unpack(order + offset_format, entry[4:4 + offset_size])[0]
+                        tags[_TIFF_TAGS[tag]] = _tiff_value(f, order, type_id, count, entry[4 + offset_size:],
+                                                            offset_format)
+                f.seek(offset + count_size + entries * entry_size)
+            else:
+                f.seek(entries * entry_size, os.SEEK_CUR)
+            offset = struct.unpack(order + offset_format, f.read(offset_size))[0]
+            pages += 1
+    tags["pages"] = pages
+    return tags
+
+
+_OME_ATTRIBUTE = re.compile(r'\b(Size[XYZCT]|PhysicalSize[XYZ]|PhysicalSize[XYZ]Unit|AcquisitionDate)="([^"]*)"')
+_OME_DATE = re.compile(r"<AcquisitionDate>([^<]+)</AcquisitionDate>")
+_OME_UNITS = {"m": 1000., "cm": 10., "mm": 1., "µm": 0.001, "um": 0.001, "nm": 1e-6}
+
+
+@register_extractor("TIFF", lambda path: _suffixes(path).endswith((".tif", ".tiff", ".btf", ".tf8")))
+def extract_tiff(path):
+    """Read TIFF tags, with OME-XML or ImageJ descriptions when present."""
+    tags = read_tiff_header(path)
+    if tags is None:
+        return None
+    result = {"format": "TIFF"}
+    description = tags.get("description") or ""
+
+    if "<OME" in description:
+        result["format"] = "OME-TIFF"
+        attrs = dict(_OME_ATTRIBUTE.findall(description))
+        dims = [attrs.get(k) for k in ("SizeX", "SizeY", "SizeZ")]
+        dims += [attrs[k] for k in ("SizeC", "SizeT") if int(attrs.get(k, 1)) > 1]
+        if all(dims):
+            result["dimensions"] = _join(dims)
+        sizes = [float(attrs[k]) * _OME_UNITS.get(attrs.get(k + "Unit", "µm"), 0.001)
+                 for k in ("PhysicalSizeX", "PhysicalSizeY", "PhysicalSizeZ") if k in attrs]
+        if sizes:
+            result["voxel_size"] = _join(sizes, 9)
+        date = _OME_DATE.search(description)
+        if date:
+            result["acquisition_date"] = date.group(1)
+        return result
+
+    dims = [tags.get("width"), tags.get("height")]
+    if None not in dims:
+        if tags["pages"] > 1:
+            dims.append(tags["pages"])
+        result["dimensions"] = _join(dims)
+    if tags.get("x_resolution"):
+        # ImageJ keeps the resolution unit in its description, the z spacing too
+        imagej = dict(line.split("=", 1) for line in description.splitlines() if "=" in line)
+        scale = _OME_UNITS.get(imagej.get("unit", "").replace("micron", "um"),
+                               _TIFF_UNITS.get(tags.get("resolution_unit"), 0))
+        if scale:
+            sizes = [scale / tags["x_resolution"]] * 2
+            if "spacing" in imagej:
+                sizes.append(float(imagej["spacing"]) * scale)
+            result["voxel_size"] = _join(sizes, 9)
+    if tags.get("datetime"):
+        try:
+            result["acquisition_date"] = datetime.strptime(tags["datetime"][:19], "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            pass
+    return result
+
+
+# --- Bruker ParaVision -------------------------------------------------------
+
+_JCAMP_PARAM = re.compile(r"^##\$?([^=]+)=(.*)$")
+_JCAMP_DATE = re.compile(r"<([^>]+)>")
+
+
+def read_jcamp(path):
+    """
+    Read a ParaVision JCAMP-DX parameter file into a dict of raw string values.
+
+    Array values (`( 3 )` followed by the values on the next lines) are kept
+    as their values; `$$` comment lines are skipped.
+    """
+    params, key = {}, None
+    with open(path, "r", encoding="latin-1") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("$$"):
+                continue
+            match = _JCAMP_PARAM.match(line)
+            if match:
+                key, value = match.group(1).strip(), match.group(2).strip()
+                params[key] = "" if re.fullmatch(r"\(\s*[\d, ]+\s*\)", value) else value
+            elif key is not None:
+                params[key] = (params[key] + " " + line.strip()).strip()
+    return params
+
+
+def _jcamp_numbers(value):
+    return [float(v) for v in re.findall(r"-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?", value or "")]
+
+
+def _jcamp_date(value):
+    match = _JCAMP_DATE.search(value or "")
+    text = match.group(1) if match else (value or "")
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%H:%M:%S %d %b %Y"):
+        try:
+            return datetime.strptime(" ".join(text.split(",")[0].split()), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _bruker_subject(path):
+    # method lives in <study>/<expno>/, visu_pars in <study>/<expno>/pdata/<procno>/
+    for parent in PurePath(path).parents[:4]:
+        candidate = os.path.join(parent, "subject")
+        if os.path.isfile(candidate):
+            return read_jcamp(candidate)
+    return {}
+
+
+@register_extractor("Bruker ParaVision", lambda path: PurePath(path).name in ("method", "visu_pars"))
+def extract_bruker(path):
+    """Read an experiment's `method` or a reconstruction's `visu_pars` parameter file."""
+    params = read_jcamp(path)
+    if not params:
+        return None
+    subject = _bruker_subject(path)
+    if PurePath(path).name == "visu_pars":
+        size = _jcamp_numbers(params.get("VisuCoreSize"))
+        extent = _jcamp_numbers(params.get("VisuCoreExtent"))
+        frames = _jcamp_numbers(params.get("VisuCoreFrameCount"))
+        dims = size + [f for f in frames if f > 1]
+        voxel = [e / s for e, s in zip(extent, size) if s]
+        acquired = _jcamp_date(params.get("VisuAcqDate")) or _jcamp_date(subject.get("SUBJECT_date"))
+        subject_id = params.get("VisuSubjectId") or subject.get("SUBJECT_id")
+    else:
+        dims = _jcamp_numbers(params.get("PVM_Matrix"))
+        voxel = _jcamp_numbers(params.get("PVM_SpatResol"))
+        slices = _jcamp_numbers(params.get("PVM_SPackArrNSlices"))
+        if len(dims) == 2 and slices:
+            dims.append(sum(slices))
+            voxel += _jcamp_numbers(params.get("PVM_SliceThick"))[:1]
+        acquired = _jcamp_date(subject.get("SUBJECT_date"))
+        subject_id = subject.get("SUBJECT_id")
+    return {
+        "modality": "MR",
+        "subject": subject_id.strip("<>") if subject_id else None,
+        "dimensions": _join(dims) if dims else None,
+        "voxel_size": _join(voxel, 6) if voxel else None,
+        "acquisition_date": acquired,
+    }
+
+
+# --- Extraction ----------------------------------------------------------------
+
+def extract_file(path, formats=None):
+    """
+    Run the first matching extractor that recognises `path`.
+
+    Args:
+        path (str): File to read.
+        formats (list, optional): Extractor names to try; defaults to all.
+
+    Returns:
+        dict or None: Metadata with `Path` and `format`, or None if no extractor applied.
+    """
+    for name, match, extract in _EXTRACTORS:
+        if (formats and name not in formats) or not match(path):
+            continue
+        try:
+            result = extract(path)
+        except Exception:
+            # A malformed or unreadable header must not stop a survey of millions of files
+            continue
+        if result is not None:
+            return {"format": name, **result, "Path": path}
+    return None
+
+
+def _extract_chunk(args):
+    paths, formats = args
+    return [row for row in (extract_file(path, formats) for path in paths) if row is not None]
+
+
+def _typed(rows):
+    frame = pd.DataFrame(rows)
+    for column in METADATA_COLUMNS:
+        if column not in frame.columns:
+            frame[column] = None
+    extra = [c for c in frame.columns if c not in METADATA_COLUMNS]
+    frame = frame[METADATA_COLUMNS + extra]
+    for column in ("format", "modality", "subject", "dimensions", "voxel_size"):
+        frame[column] = frame[column].astype("string")
+    # Extractors return datetimes or ISO strings; convert one by one so formats can differ
+    frame["acquisition_date"] = pd.to_datetime(
+        frame["acquisition_date"].map(lambda v: pd.to_datetime(v, errors="coerce", utc=True)), utc=True
+    )
+    return frame
+
+
+def extract_metadata(scanned_files, formats=None, workers=DEFAULT_WORKERS, chunk_size=500,
+                     on_progress=None, cancel_event=None):
+    """
+    Extract header metadata for the files of a scan in a process pool.
+
+    Args:
+        scanned_files (pd.DataFrame): Scan rows with `Path` and `Type`.
+        formats (list, optional): Extractor names to use; defaults to all.
+        workers (int): Extraction processes.
+        chunk_size (int): Files per task.
+        on_progress (callable, optional): Called with the number of files examined in each chunk.
+        cancel_event (threading.Event, optional): Stops extraction when set.
+
+    Returns:
+        pd.DataFrame: One row per recognised file, `METADATA_COLUMNS` first;
+        `acquisition_date` is a UTC datetime and the rest are strings.
+    """
+    files = scanned_files.loc[scanned_files["Type"] == "File", "Path"]
+    candidates = [path for path in files if any(
+        match(path) for name, match, _ in _EXTRACTORS if not formats or name in formats)]
+    chunks = [(candidates[i:i + chunk_size], formats) for i in range(0, len(candidates), chunk_size)]
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (paths, _), chunk_rows in zip(chunks, pool.map(_extract_chunk, chunks)):
+            if cancel_event is not None and cancel_event.is_set():
+                pool.shutdown(cancel_futures=True)
+                raise InterruptedError("Metadata extraction was cancelled.")
+            rows.extend(chunk_rows)
+            if on_progress:
+                on_progress(len(paths))
+    return _typed(rows)
+
+
+def join_metadata(scanned_files, metadata):
+    """Add the metadata columns to the scan rows they were extracted from, replacing earlier ones."""
+    stale = [c for c in metadata.columns if c != "Path" and c in scanned_files.columns]
+    return scanned_files.drop(columns=stale).merge(metadata, on="Path", how="left")
@@ -0,0 +1,223 @@
+"""
+Label rules that turn scanned paths into entities.
+
+A rule matches a path with a regular expression, a path template or a glob
+and gives the matching rows a label; named groups in the expression become
+columns, so `sub-(?P<subject>[^/]+)` yields a `subject` column. Templates are
+the shorthand for the same thing: `/data/{study}/{subject}/day{session}`
+yields `study`, `subject` and `session` columns. Rules are tried in order and
+the first match wins.
+
+Rules are compiled once (`compile_rules`) and matched column-wise with pandas
+string methods; large scans are split into chunks matched in a process pool.
+`preview_label_rules` reports match rates on a sample before the full pass.
+"""
+import fnmatch
+import os
+import re
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+LABEL_COLUMN = "label"
+DEFAULT_WORKERS = max(1, min(8, os.cpu_count() or 1))
+
+# Rows per process-pool chunk; smaller scans are matched in-process
+DEFAULT_CHUNK_SIZE = 250000
+
+# Rows matched by `preview_label_rules`
+DEFAULT_SAMPLE_SIZE = 10000
+
+# `{name}` or `{name:regex}` in a path template
+_TEMPLATE_FIELD = re.compile(r"\{(\w+)(?::((?:[^{}]|\{\d*,?\d*\})+))?\}")
+
+CompiledRule = namedtuple("CompiledRule", ["label", "pattern", "type"])
+
+
+def template_pattern(template):
+    """
+    Translate a path template into a regular expression.
+
+    `{name}` matches one path component into a `name` column and `{name:regex}`
+    matches `regex` instead; `*` matches within a component and `**` across
+    components (a trailing `/**` also matches the directory itself). A template
+    starting with `/` is anchored at the start of the path, otherwise at any
+    component boundary; it always runs to the end of the path.
+
+    Args:
+        template (str): Path template, e.g. `/data/{study}/{subject}/day{session:\\d+}`.
+
+    Returns:
+        str: Regular expression with one named group per field.
+    """
+    parts, position = [], 0
+    for field in _TEMPLATE_FIELD.finditer(template):
+        parts.append(_template_literal(template[position:field.start()]))
+        parts.append(f"(?P<{field.group(1)}>{field.group(2) or '[^/]+'})")
+        position = field.end()
+    parts.append(_template_literal(template[position:]))
+    body = "".join(parts)
+    anchor = "^" if template.startswith("/") else "(?:^|/)"
+    return anchor + body + "$"
+
+
+def _template_literal(text):
+    text = re.escape(text)
+    # re.escape turns "/**" into "/\*\*" and "*" into "\*"
+    text = text.replace("/\\*\\*", "(?:/.*)?").replace("\\*\\*", ".*")
+    return text.replace("\\*", "[^/]*")
+
+
+def rule_pattern(rule):
+    """
+    Return the compiled regular expression for a rule.
+
+    Args:
+        rule (dict): `{"label": ..., "pattern": <regex>}`, `{"label": ..., "template": <template>}`
+            or `{"label": ..., "glob": <glob>}`, optionally with `"type": "Directory" | "File"`.
+
+    Returns:
+        re.Pattern: Compiled expression, searched anywhere in the path.
+    """
+    try:
+        if rule.get("pattern"):
+            return re.compile(rule["pattern"])
+        if rule.get("template"):
+            return re.compile(template_pattern(rule["template"]))
+        if rule.get("glob"):
+            return re.compile(fnmatch.translate(rule["glob"]))
+    except re.error as e:
+        raise ValueError(f"Label rule for '{rule.get('label')}' does not compile: {e}")
+    raise ValueError(f"Label rule for '{rule.get('label')}' needs a 'pattern', a 'template' or a 'glob'.")
+
+
+def compile_rules(rules):
+    """
+    Compile label rules once for repeated matching.
+
+    Args:
+        rules (list): Rule dicts, see `rule_pattern`; already compiled rules pass through.
+
+    Returns:
+        list: `CompiledRule` tuples in rule order.
+    """
+    compiled = []
+    for rule in rules:
+        if isinstance(rule, CompiledRule):
+            compiled.append(rule)
+            continue
+        if not rule.get("label"):
+            raise ValueError("Every label rule needs a 'label'.")
+        compiled.append(CompiledRule(rule["label"], rule_pattern(rule), rule.get("type") or None))
+    return compiled
+
+
+def _match_rules(paths, types, compiled):
+    """Return (labels, extracted group columns, per-rule (count, example)) for one chunk of paths."""
+    labels = pd.Series(None, index=paths.index, dtype=object)
+    extracted, counts = [], []
+    for rule in compiled:
+        candidates = labels.isna()
+        if rule.type:
+            candidates &= types == rule.type
+        candidate_paths = paths[candidates]
+        if candidate_paths.empty:
+            counts.append((0, None))
+            continue
+
+        with warnings.catch_warnings():
+            # pandas warns that match groups are ignored; only the match matters here
+            warnings.simplefilter("ignore", UserWarning)
+            matched = candidate_paths.str.contains(rule.pattern)
+        hits = matched[matched].index
+        counts.append((len(hits), candidate_paths[hits[0]] if len(hits) else None))
+        if rule.pattern.groupindex:
+            groups = candidate_paths[matched].str.extract(rule.pattern, expand=True)
+            extracted.append(groups[[name for name in groups.columns if isinstance(name, str)]])
+        labels[hits] = rule.label
+
+    # Rules that share a group name fill the same column
+    groups = pd.concat(extracted) if extracted else pd.DataFrame(index=labels.index[:0])
+    return labels[labels.notna()], groups, counts
+
+
+def _entities(scanned_files, labels, groups):
+    entities = scanned_files.loc[labels.index]
+    # Extracted groups replace scan columns of the same name
+    entities = entities.drop(columns=[c for c in groups.columns if c in entities.columns])
+    entities = entities.assign(**{LABEL_COLUMN: labels})
+    return entities.join(groups) if len(groups.columns) else entities
+
+
+def _match_chunk(args):
+    paths, types, compiled = args
+    return _match_rules(paths, types, compiled)
+
+
+def apply_label_rules(scanned_files, rules, path_column="Path", workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Label scan rows with the first rule each path matches.
+
+    Args:
+        scanned_files (pd.DataFrame): Scan rows with `Path` and `Type` columns.
+        rules (list): Rule dicts (see `rule_pattern`) or `compile_rules` output.
+        path_column (str): Column holding the paths.
+        workers (int): Matching processes; scans longer than `chunk_size` rows
+            are split across them.
+        chunk_size (int): Rows per process-pool chunk.
+
+    Returns:
+        pd.DataFrame: Matching rows only, with a `label` column and one column
+        per named group.
+    """
+    compiled = compile_rules(rules)
+    paths = scanned_files[path_column].astype(str)
+    types = scanned_files["Type"] if "Type" in scanned_files.columns else pd.Series(None, index=paths.index)
+
+    if workers > 1 and len(paths) > chunk_size:
+        chunks = [(paths.iloc[i:i + chunk_size], types.iloc[i:i + chunk_size], compiled)
+                  for i in range(0, len(paths), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_match_chunk, chunks))
+        labels = pd.concat([labels for labels, _, _ in results])
+        groups = pd.concat([groups for _, groups, _ in results])
+    else:
+        labels, groups, _ = _match_rules(paths, types, compiled)
+    return _entities(scanned_files, labels, groups)
+
+
+def preview_label_rules(scanned_files, rules, path_column="Path", sample_size=DEFAULT_SAMPLE_SIZE, seed=0):
+    """
+    Report how often each rule matches on a sample of the scan.
+
+    Args:
+        scanned_files (pd.DataFrame): Scan rows with `Path` and `Type` columns.
+        rules (list): Rule dicts (see `rule_pattern`) or `compile_rules` output.
+        path_column (str): Column holding the paths.
+        sample_size (int): Rows sampled; the whole scan when it is smaller.
+        seed (int): Sampling seed, so previews are stable across reruns.
+
+    Returns:
+        tuple: (summary, sample entities) where summary has one row per rule
+        (`label`, `matched`, `match_rate`, `example`, `columns`) and sample
+        entities is `apply_label_rules` on the sample.
+    """
+    compiled = compile_rules(rules)
+    sample = scanned_files
+    if len(scanned_files) > sample_size:
+        sample = scanned_files.sample(sample_size, random_state=seed)
+
+    paths = sample[path_column].astype(str)
+    types = sample["Type"] if "Type" in sample.columns else pd.Series(None, index=paths.index)
+    labels, groups, counts = _match_rules(paths, types, compiled)
+
+    summary = pd.DataFrame({
+        "label": [rule.label for rule in compiled],
+        "matched": [count for count, _ in counts],
+        "match_rate": [count / len(sample) if len(sample) else 0.0 for count, _ in counts],
+        "example": [example for _, example in counts],
+        "columns": [", ".join(rule.pattern.groupindex) for rule in compiled],
+    })
+    return summary, _entities(sample, labels, groups)
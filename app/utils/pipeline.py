@@ -0,0 +1,529 @@
+"""
+Headless scan -> map -> push pipeline driven by a YAML spec.
+
+This runs the same engines as the Survey and Map pages (`utils.scanner`,
+`utils.path_rules`, `utils.bulk_load`) without Streamlit, for scheduled
+surveys on machines with no browser. CPU-bound steps (parsing, uid hashing)
+and Bolt writes are spread over a process pool, and each stage reports its
+row count, duration and throughput as one JSON line.
+
+Example spec::
+
+    scan:
+      roots: [/data/instrument_a, /data/instrument_b]
+      namespace: storage01        # defaults to this host's name
+      include_files: true
+      shards: 8                   # optional: balanced shards over a process pool
+      pin_mounts: true            # keep each shard on one mount
+      prune:                      # applied while walking
+        exclude: [".snapshot/", ".zfs/", "__pycache__/"]
+        skip_markers: [conda-meta]
+        max_depth: 8
+        one_file_system: true
+        min_size: 1
+      hash:                       # optional: content hashes + DUPLICATE_OF (needs include_files)
+        algorithm: blake3         # defaults to the fastest installed
+        hash_all: false           # only files that share their size are hashed by default
+      archives:                   # optional: zip/tar members as virtual rows
+        compressed: false         # also list .tar.gz etc. (decompresses them)
+      metadata:                   # optional: imaging header columns joined onto the scan rows
+        formats: [DICOM, NIfTI]   # defaults to every extractor
+      datasets:                   # optional: collapse Bruker/DICOM/Zarr folders into Dataset nodes
+        min_dicom_files: 2
+    labels:                       # first matching rule wins
+      - label: Subject
+        pattern: "/sub-(?P<subject>[^/]+)$"
+        type: Directory
+        match_columns: [subject]  # columns that identify an entity of this label
+      - label: Session
+        pattern: "/sub-(?P<subject>[^/]+)/ses-(?P<session>[^/]+)$"
+        type: Directory
+        match_columns: [subject, session]
+    properties:                   # column -> Neo4j property name
+      Path: filepath
+      subject: subject_id
+    relationship: STORED_IN       # entity -> the Folder/File it was found at
+    taxonomy:
+      keys: [label, subject]
+    target:
+      uri: bolt://localhost:7687
+      user: neo4j
+      password_env: NEO4J_PASSWORD
+      database: neo4j
+    watch:                        # used by `run_pipeline.py --watch` after the push
+      debounce: 2                 # seconds without events before a batch is written
+      rescan_interval: 300        # seconds between rescans when inotify is unavailable
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from utils.archives import ARCHIVE_PROPERTIES, expand_archives
+from utils.bulk_load import (
+    DEFAULT_BATCH_SIZE, EDGE_COLUMNS, build_entity_tables, build_scan_tables, build_taxonomy_tables,
+    edge_statements, ensure_uid_constraints, node_statements, to_parameter_rows
+)
+from utils.datasets import DATASET_PROPERTIES, collapse_datasets
+from utils.hashing import DEFAULT_ALGORITHM, hash_scan, hash_tables
+from utils.identity import entity_uid, path_uid, scan_namespace
+from utils.metadata import extract_metadata, join_metadata
+from utils.path_rules import LABEL_COLUMN, apply_label_rules
+from utils.prune import PruneRules, walk_tree
+from utils.scanner import load_ncdu_export, run_ncdu
+from utils.sharded_scan import sharded_scan
+from utils.watch import DEFAULT_DEBOUNCE, DEFAULT_RESCAN_INTERVAL, Watcher
+
+SPEC_SECTIONS = (
+    "scan", "labels", "properties", "match_columns", "relationship", "taxonomy", "target", "workers", "batch_size",
+    "watch"
+)
+DEFAULT_WORKERS = max(1, min(8, os.cpu_count() or 1))
+DEFAULT_ENTITY_RELATIONSHIP = "STORED_IN"
+DEFAULT_TAXONOMY_LINK = "BELONGS_TO"
+
+
+def load_pipeline_spec(path):
+    """
+    Read and validate a pipeline spec.
+
+    Args:
+        path (str): YAML file.
+
+    Returns:
+        dict: The spec.
+    """
+    with open(path, "r") as f:
+        spec = yaml.safe_load(f) or {}
+    if not isinstance(spec, dict):
+        raise ValueError(f"{path} must contain a mapping.")
+
+    unknown = set(spec) - set(SPEC_SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown pipeline sections: {sorted(unknown)}. Expected {SPEC_SECTIONS}.")
+    scan = spec.get("scan") or {}
+    if not (scan.get("roots") or scan.get("root") or scan.get("exports") or scan.get("export")):
+        raise ValueError("The scan section needs 'root(s)' to scan or 'export(s)' to load.")
+    rule_match_columns(spec)
+    taxonomy = spec.get("taxonomy") or {}
+    if taxonomy and not taxonomy.get("keys"):
+        raise ValueError("The taxonomy section needs 'keys'.")
+    return spec
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _stage_options(scan, key):
+    """Return the options of an optional scan stage, or None when it is off (`hash: {}` is on with defaults)."""
+    value = scan.get(key)
+    if value is None or value is False:
+        return None
+    return value if isinstance(value, dict) else {}
+
+
+def rule_match_columns(spec):
+    """
+    Return label -> the columns that identify an entity of that label.
+
+    Each label rule names its own `match_columns`; a top-level `match_columns`
+    is the default for rules that do not.
+
+    Args:
+        spec (dict): Pipeline spec.
+
+    Returns:
+        dict: Label -> list of columns.
+    """
+    default = _as_list(spec.get("match_columns"))
+    columns = {}
+    for rule in spec.get("labels") or []:
+        label = rule.get("label")
+        rule_columns = _as_list(rule.get("match_columns")) or default
+        if not rule_columns:
+            raise ValueError(f"Label rule for '{label}' needs 'match_columns' to identify its entities.")
+        if columns.setdefault(label, rule_columns) != rule_columns:
+            raise ValueError(f"Label rules for '{label}' name different 'match_columns'.")
+    return columns
+
+
+class StatsWriter:
+    """Write one JSON line per pipeline stage: rows, seconds and rows per second."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.stages = []
+
+    def emit(self, stage, rows, seconds, **extra):
+        record = {
+            "stage": stage,
+            "rows": int(rows),
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+            **extra,
+        }
+        self.stages.append(record)
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
+        return record
+
+
+# --- scan -------------------------------------------------------------------
+
+def _scan_root(root, export_path, extra_args, rules):
+    rules = PruneRules.from_dict(rules)
+    if rules:
+        return walk_tree(root, rules)
+    run_ncdu(root, export_path, extra_args=extra_args)
+    return load_ncdu_export(export_path)
+
+
+def scan_roots(roots, output_dir, extra_args=None, workers=DEFAULT_WORKERS, rules=None):
+    """
+    Scan several roots with one process each, in parallel.
+
+    Args:
+        roots (list): Directories to scan.
+        output_dir (Path): Where the ncdu exports are written.
+        extra_args (list, optional): Additional ncdu arguments.
+        workers (int): Maximum concurrent scans.
+        rules (PruneRules, optional): Pruning rules; roots are then walked with
+            `utils.prune.walk_tree` instead of ncdu.
+
+    Returns:
+        pd.DataFrame: Scan rows of all roots.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rules = rules.to_dict() if rules else None
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(roots)))) as pool:
+        futures = [
+            pool.submit(_scan_root, root, output_dir / f"ncdu_{i}.json", extra_args, rules)
+            for i, root in enumerate(roots)
+        ]
+        frames = [future.result() for future in futures]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _scan_tables_chunk(chunk, namespace, include_files, property_columns):
+    return build_scan_tables(chunk, namespace, include_files=include_files, property_columns=property_columns)
+
+
+def build_scan_tables_parallel(scanned_files, namespace, include_files=False, workers=DEFAULT_WORKERS,
+                               property_columns=None):
+    """`build_scan_tables` with the uid hashing split over a process pool."""
+    if workers <= 1 or len(scanned_files) < 100000:
+        return build_scan_tables(scanned_files, namespace, include_files=include_files,
+                                 property_columns=property_columns)
+    chunk_size = -(-len(scanned_files) // workers)
+    chunks = [scanned_files.iloc[i:i + chunk_size] for i in range(0, len(scanned_files), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_scan_tables_chunk, chunks, [namespace] * len(chunks), [include_files] * len(chunks),
+                                [property_columns] * len(chunks)))
+    # Parents shared by several chunks appear once per chunk, as a plain Folder in
+    # chunks that do not hold the parent's own row (e.g. an archive's members)
+    nodes = pd.concat([nodes for nodes, _ in results], ignore_index=True)
+    nodes = nodes.iloc[(nodes["label"] == "Folder").argsort(kind="stable")].drop_duplicates("uid")
+    edges = pd.concat([edges for _, edges in results], ignore_index=True)
+    edges["end_label"] = edges["end_uid"].map(nodes.set_index("uid")["label"]).fillna(edges["end_label"])
+    edges = edges.drop_duplicates()
+    return nodes.reset_index(drop=True), edges.reset_index(drop=True)
+
+
+# --- map --------------------------------------------------------------------
+
+def build_mapped_tables(scanned_files, spec, namespace, workers=1):
+    """
+    Apply the spec's label rules, property mappings and taxonomy to scan rows.
+
+    Entities point at the Folder/File node they were found at (File nodes only
+    exist with `scan.include_files`), and taxonomy leaves point at their entities.
+    Each label is identified by its rule's `match_columns`; rows with no value
+    in one of them cannot be identified and are dropped.
+    Large scans are matched against the label rules in `workers` processes.
+
+    Returns:
+        tuple: (entities, nodes, edges)
+    """
+    rules = spec.get("labels") or []
+    if not rules:
+        return pd.DataFrame(), pd.DataFrame(columns=["uid", "label"]), pd.DataFrame(columns=EDGE_COLUMNS)
+
+    entities = apply_label_rules(scanned_files, rules, workers=workers)
+    properties = spec.get("properties") or {}
+    match_columns = rule_match_columns(spec)
+    required = list(dict.fromkeys(col for columns in match_columns.values() for col in columns))
+    missing = [col for col in required + list(properties) if col not in entities.columns]
+    if missing:
+        raise ValueError(f"Columns {missing} are not produced by the scan or the label rules.")
+
+    # Identify each label by its own match columns
+    uids = pd.Series(None, index=entities.index, dtype=object)
+    label_frames = []
+    for label, columns in match_columns.items():
+        rows = entities[(entities[LABEL_COLUMN] == label) & entities[columns].notna().all(axis=1)]
+        if rows.empty:
+            continue
+        uids[rows.index] = [entity_uid(label, values) for values in rows[columns].to_numpy().tolist()]
+        label_nodes, _ = build_entity_tables(rows, LABEL_COLUMN, list(properties), columns, properties)
+        label_frames.append(label_nodes)
+    entities = entities[uids.notna()]
+    entity_uids = uids[entities.index].tolist()
+    nodes = (pd.concat(label_frames, ignore_index=True) if label_frames
+             else pd.DataFrame(columns=["uid", "label"]))
+    edge_frames = [pd.DataFrame({
+        "start_uid": entity_uids,
+        "start_label": entities[LABEL_COLUMN].to_numpy(),
+        "end_uid": [path_uid(namespace, p) for p in entities["Path"]],
+        "end_label": entities["Type"].map(
+            {"Directory": "Folder", "File": "File", "Dataset": "Dataset", "Archive": "Archive"}).to_numpy(),
+        "type": spec.get("relationship", DEFAULT_ENTITY_RELATIONSHIP),
+    }, columns=EDGE_COLUMNS)]
+    node_frames = [nodes]
+
+    taxonomy = spec.get("taxonomy") or {}
+    if taxonomy:
+        keys = _as_list(taxonomy["keys"])
+        complete = entities[keys].notna().all(axis=1).to_numpy()
+        tax_nodes, tax_edges, leaf_uids = build_taxonomy_tables(
+            entities[complete], keys, relationship_type=taxonomy.get("relationship", "OF")
+        )
+        node_frames.append(tax_nodes)
+        edge_frames.append(tax_edges)
+        edge_frames.append(pd.DataFrame({
+            "start_uid": leaf_uids.to_numpy(),
+            "start_label": keys[-1],
+            "end_uid": pd.Series(entity_uids, dtype=object).to_numpy()[complete],
+            "end_label": entities[LABEL_COLUMN].to_numpy()[complete],
+            "type": taxonomy.get("link", DEFAULT_TAXONOMY_LINK),
+        }, columns=EDGE_COLUMNS))
+
+    nodes = pd.concat(node_frames, ignore_index=True).drop_duplicates("uid")
+    edges = pd.concat(edge_frames, ignore_index=True).drop_duplicates()
+    return entities, nodes.reset_index(drop=True), edges.reset_index(drop=True)
+
+
+# --- push -------------------------------------------------------------------
+
+_worker_driver = None
+
+
+def _target_auth(target):
+    password = target.get("password")
+    if password is None:
+        password = os.environ.get(target.get("password_env", "NEO4J_PASSWORD"))
+    if password is None:
+        raise ValueError("Set target.password or the environment variable named by target.password_env.")
+    return target.get("user", "neo4j"), password
+
+
+def _open_driver(target):
+    from neo4j import GraphDatabase
+    return GraphDatabase.driver(target.get("uri", "bolt://localhost:7687"), auth=_target_auth(target))
+
+
+def _init_push_worker(target):
+    global _worker_driver
+    _worker_driver = _open_driver(target)
+
+
+def _write_batch(query, rows, database):
+    with _worker_driver.session(database=database) as session:
+        session.execute_write(lambda tx: tx.run(query, rows=rows).consume())
+    return len(rows)
+
+
+def push_tables_parallel(target, nodes, edges, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS, on_batch=None):
+    """
+    Write node and edge tables with a pool of processes, each with its own driver.
+
+    Batches can go in any order because uids are computed client side; all
+    nodes are written before any edge so that edge MATCHes find their ends.
+
+    Args:
+        target (dict): The spec's target section.
+        nodes (pd.DataFrame): Node table.
+        edges (pd.DataFrame): Edge table.
+        batch_size (int): Rows per transaction.
+        workers (int): Writer processes.
+        on_batch (callable, optional): Called with the number of rows written after each batch.
+
+    Returns:
+        int: Rows written.
+    """
+    database = target.get("database")
+    driver = _open_driver(target)
+    try:
+        with driver.session(database=database) as session:
+            ensure_uid_constraints(session, nodes["label"].unique())
+    finally:
+        driver.close()
+
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_push_worker, initargs=(target,)) as pool:
+        for statements in (node_statements(nodes), edge_statements(edges)):
+            futures = []
+            for query, frame in statements:
+                rows = to_parameter_rows(frame)
+                futures += [pool.submit(_write_batch, query, rows[i:i + batch_size], database)
+                            for i in range(0, len(rows), batch_size)]
+            for future in as_completed(futures):
+                count = future.result()
+                written += count
+                if on_batch:
+                    on_batch(count)
+    return written
+
+
+# --- run --------------------------------------------------------------------
+
+def run_pipeline(spec, stats=None, dry_run=False, output_dir=None):
+    """
+    Run a pipeline spec end to end.
+
+    Args:
+        spec (dict): Spec from `load_pipeline_spec`.
+        stats (StatsWriter, optional): Where stage statistics go. Defaults to stdout.
+        dry_run (bool): Build the tables and write them to `output_dir` as Parquet
+            instead of pushing them.
+        output_dir (str, optional): Directory for ncdu exports and dry-run tables.
+
+    Returns:
+        list: Stage statistics.
+    """
+    stats = stats or StatsWriter()
+    scan = spec.get("scan") or {}
+    workers = int(spec.get("workers", DEFAULT_WORKERS))
+    batch_size = int(spec.get("batch_size", DEFAULT_BATCH_SIZE))
+    namespace = scan_namespace(scan.get("namespace"))
+    output_dir = Path(output_dir or tempfile.mkdtemp(prefix="sdk_pipeline_"))
+    pipeline_start = time.perf_counter()
+
+    start = time.perf_counter()
+    rules = PruneRules.from_dict(scan.get("prune"))
+    exports = _as_list(scan.get("exports") or scan.get("export"))
+    if exports:
+        scanned_files = pd.concat([load_ncdu_export(path) for path in exports], ignore_index=True)
+    elif scan.get("shards"):
+        scanned_files = sharded_scan(
+            _as_list(scan.get("roots") or scan.get("root")), output_dir / "shards",
+            shards=int(scan["shards"]), pin_mounts=bool(scan.get("pin_mounts", False)),
+            extra_args=scan.get("ncdu_args"), store_path=output_dir / "scanned_files.parquet", rules=rules
+        )
+    else:
+        scanned_files = scan_roots(
+            _as_list(scan.get("roots") or scan.get("root")), output_dir,
+            extra_args=scan.get("ncdu_args"), workers=workers, rules=rules
+        )
+    stats.emit("scan", len(scanned_files), time.perf_counter() - start, shards=scan.get("shards"))
+
+    archive_options = _stage_options(scan, "archives")
+    if archive_options is not None:
+        start = time.perf_counter()
+        rows = len(scanned_files)
+        scanned_files = expand_archives(scanned_files, compressed=bool(archive_options.get("compressed", False)),
+                                        workers=workers)
+        stats.emit("archives", len(scanned_files) - rows, time.perf_counter() - start)
+
+    metadata_options = _stage_options(scan, "metadata")
+    if metadata_options is not None:
+        start = time.perf_counter()
+        metadata = extract_metadata(scanned_files, formats=metadata_options.get("formats"), workers=workers)
+        scanned_files = join_metadata(scanned_files, metadata)
+        stats.emit("metadata", len(metadata), time.perf_counter() - start,
+                   formats=metadata["format"].value_counts().to_dict())
+
+    dataset_options = _stage_options(scan, "datasets")
+    if dataset_options is not None:
+        start = time.perf_counter()
+        scanned_files, datasets = collapse_datasets(scanned_files, **dataset_options)
+        stats.emit("datasets", len(datasets), time.perf_counter() - start, rows=len(scanned_files))
+
+    hash_nodes = hash_edges = None
+    hash_options = _stage_options(scan, "hash")
+    if hash_options is not None and scan.get("include_files", False):
+        start = time.perf_counter()
+        hashes = hash_scan(scanned_files, algorithm=hash_options.get("algorithm", DEFAULT_ALGORITHM),
+                           workers=workers, hash_all=bool(hash_options.get("hash_all", False)))
+        hash_nodes, hash_edges = hash_tables(hashes, namespace)
+        stats.emit("hash", len(hashes), time.perf_counter() - start, duplicates=len(hash_edges))
+
+    start = time.perf_counter()
+    scan_nodes, scan_edges = build_scan_tables_parallel(
+        scanned_files, namespace, include_files=bool(scan.get("include_files", False)), workers=workers,
+        property_columns=DATASET_PROPERTIES + ARCHIVE_PROPERTIES
+    )
+    entities, mapped_nodes, mapped_edges = build_mapped_tables(scanned_files, spec, namespace, workers=workers)
+    nodes = pd.concat([scan_nodes, mapped_nodes], ignore_index=True).drop_duplicates("uid")
+    edges = pd.concat([scan_edges, mapped_edges], ignore_index=True)
+    if hash_nodes is not None:
+        nodes = pd.concat([nodes, hash_nodes], ignore_index=True).drop_duplicates("uid", keep="last")
+        edges = pd.concat([edges, hash_edges], ignore_index=True)
+    stats.emit("map", len(nodes) + len(edges), time.perf_counter() - start,
+               entities=len(entities), nodes=len(nodes), edges=len(edges))
+
+    start = time.perf_counter()
+    if dry_run:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        nodes.to_parquet(output_dir / "nodes.parquet", index=False)
+        edges.to_parquet(output_dir / "edges.parquet", index=False)
+        stats.emit("write_tables", len(nodes) + len(edges), time.perf_counter() - start, directory=str(output_dir))
+    else:
+        target = spec.get("target") or {}
+        written = push_tables_parallel(target, nodes, edges, batch_size=batch_size, workers=workers)
+        stats.emit("push", written, time.perf_counter() - start, database=target.get("database"), workers=workers)
+
+    stats.emit("total", len(scanned_files), time.perf_counter() - pipeline_start)
+    return stats.stages
+
+
+def watch_pipeline(spec, stats=None, stop_event=None):
+    """
+    Keep the spec's roots in sync with its target until `stop_event` is set (or forever).
+
+    Only Folder/File nodes are updated; label rules and the taxonomy are
+    applied by the next full run.
+
+    Args:
+        spec (dict): Spec from `load_pipeline_spec`.
+        stats (StatsWriter, optional): Where per-batch statistics go. Defaults to stdout.
+        stop_event (threading.Event, optional): Stops watching when set.
+    """
+    stats = stats or StatsWriter()
+    scan = spec.get("scan") or {}
+    watch = spec.get("watch") or {}
+    target = spec.get("target") or {}
+    last = [time.perf_counter()]
+
+    def on_batch(mode, batch):
+        now = time.perf_counter()
+        stats.emit("watch", batch["created"] + batch["deleted"], now - last[0], mode=mode, **batch)
+        last[0] = now
+
+    driver = _open_driver(target)
+    try:
+        watcher = Watcher(
+            driver,
+            _as_list(scan.get("roots") or scan.get("root")),
+            namespace=scan.get("namespace"),
+            database=target.get("database"),
+            include_files=bool(scan.get("include_files", False)),
+            rules=PruneRules.from_dict(scan.get("prune")),
+            debounce=float(watch.get("debounce", DEFAULT_DEBOUNCE)),
+            rescan_interval=float(watch.get("rescan_interval", DEFAULT_RESCAN_INTERVAL)),
+            on_batch=on_batch,
+            log=lambda message: print(message, file=sys.stderr)
+        )
+        watcher.run(stop_event or threading.Event())
+    finally:
+        driver.close()
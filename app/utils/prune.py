@@ -0,0 +1,213 @@
+"""
+Scan pruning rules and a filesystem walker that applies them as it goes.
+
+Instrument shares are full of snapshot directories, caches and software
+environments that dominate the inode count but do not belong in the data
+catalogue. `PruneRules` describes what to leave out:
+
+- `exclude`: gitignore-style patterns, matched against paths relative to the
+  scan root (`/` anchors a pattern, a trailing `/` matches directories only,
+  `**` spans directories and `!` re-includes)
+- `skip_markers`: file names that mark a directory as not worth scanning
+  (e.g. `conda-meta` for conda environments, `CACHEDIR.TAG`)
+- `max_depth`: do not descend below this depth (the root is depth 0)
+- `one_file_system`: do not cross mount boundaries
+- `min_size`: leave out files smaller than this many bytes
+
+`walk_tree` applies the rules during the walk, so an excluded directory is
+never listed and nothing below it is ever stat'ed. Its output has the same
+columns as an ncdu scan.
+"""
+import os
+import re
+
+import pandas as pd
+
+from utils.identity import normalize_path
+from utils.scanner import SCAN_COLUMNS
+
+DEFAULT_EXCLUDES = [".snapshot/", ".zfs/", "__pycache__/"]
+DEFAULT_SKIP_MARKERS = ["conda-meta", "pyvenv.cfg", "CACHEDIR.TAG"]
+
+# Entries walked between progress callbacks and cancellation checks
+_PROGRESS_EVERY = 10000
+
+
+def _glob_to_regex(glob):
+    parts = []
+    i = 0
+    while i < len(glob):
+        if glob.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif glob[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif glob[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif glob[i] == "[" and "]" in glob[i + 1:]:
+            end = glob.index("]", i + 1)
+            parts.append("[" + glob[i + 1:end].replace("!", "^", 1) + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(glob[i]))
+            i += 1
+    return "".join(parts)
+
+
+class IgnorePatterns:
+    """gitignore-style patterns; the last pattern that matches a path decides."""
+
+    def __init__(self, patterns):
+        self.patterns = []
+        for line in patterns or []:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            line = line[1:] if negate else line
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            body = _glob_to_regex(line.lstrip("/"))
+            regex = re.compile(f"^{body}$" if anchored else f"^(?:.*/)?{body}$")
+            self.patterns.append((regex, negate, dir_only))
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def ignored(self, relative_path, is_dir):
+        """Return True if `relative_path` (POSIX, relative to the scan root) is excluded."""
+        ignored = False
+        for regex, negate, dir_only in self.patterns:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                ignored = not negate
+        return ignored
+
+
+class PruneRules:
+    """What a scan leaves out; see the module docstring."""
+
+    def __init__(self, exclude=None, skip_markers=None, max_depth=None, one_file_system=False, min_size=0):
+        self.exclude = list(exclude or [])
+        self.skip_markers = list(skip_markers or [])
+        self.max_depth = int(max_depth) if max_depth is not None else None
+        self.one_file_system = bool(one_file_system)
+        self.min_size = int(min_size or 0)
+        self.patterns = IgnorePatterns(self.exclude)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build rules from a spec/params dict; None gives rules that prune nothing."""
+        data = data or {}
+        return cls(
+            exclude=data.get("exclude"),
+            skip_markers=data.get("skip_markers"),
+            max_depth=data.get("max_depth"),
+            one_file_system=data.get("one_file_system", False),
+            min_size=data.get("min_size", 0),
+        )
+
+    def to_dict(self):
+        return {
+            "exclude": self.exclude,
+            "skip_markers": self.skip_markers,
+            "max_depth": self.max_depth,
+            "one_file_system": self.one_file_system,
+            "min_size": self.min_size,
+        }
+
+    def __bool__(self):
+        return bool(self.exclude or self.skip_markers or self.max_depth is not None
+                    or self.one_file_system or self.min_size)
+
+    def prunes_file(self, relative_path, size):
+        """Return True if the file at `relative_path` should be left out."""
+        if self.patterns and self.patterns.ignored(relative_path, False):
+            return True
+        return size < self.min_size
+
+    def prunes_directory(self, path, relative_path):
+        """Return True if the directory at `path` should be neither listed nor recorded."""
+        if self.patterns and self.patterns.ignored(relative_path, True):
+            return True
+        return any(os.path.lexists(os.path.join(path, marker)) for marker in self.skip_markers)
+
+
+def walk_tree(root, rules=None, on_progress=None, cancel_event=None, rules_root=None):
+    """
+    Walk `root` with `os.scandir`, applying pruning rules during the walk.
+
+    Args:
+        root (str): Directory to scan.
+        rules (PruneRules, optional): What to leave out.
+        on_progress (callable, optional): Called with the number of entries seen so far.
+        cancel_event (threading.Event, optional): Stops the walk when set.
+        rules_root (str, optional): Directory that patterns and depths are relative
+            to, when `root` is one part (e.g. a shard) of a larger scan.
+
+    Returns:
+        pd.DataFrame: Scan rows (`utils.scanner.SCAN_COLUMNS`), parents before children.
+    """
+    rules = rules or PruneRules()
+    root = normalize_path(os.path.abspath(root))
+    root_stat = os.stat(root)
+    rows = [(root, root_stat.st_size, getattr(root_stat, "st_blocks", 0) * 512, "Directory")]
+    seen = 0
+
+    # Depth-first with an explicit stack, so deep trees do not hit the recursion limit
+    relative = os.path.relpath(root, rules_root) if rules_root else "."
+    relative = "" if relative == "." else relative.replace(os.sep, "/")
+    stack = [(root, relative, len(relative.split("/")) if relative else 0)]
+    while stack:
+        path, relative, depth = stack.pop()
+        if rules.max_depth is not None and depth >= rules.max_depth:
+            continue
+        try:
+            with os.scandir(path) as iterator:
+                entries = sorted(iterator, key=lambda e: e.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            seen += 1
+            if seen % _PROGRESS_EVERY == 0:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise InterruptedError(f"Scan of {root} was cancelled.")
+                if on_progress:
+                    on_progress(seen)
+
+            entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if is_dir and rules.prunes_directory(entry.path, entry_relative):
+                    continue
+                if not is_dir and rules.patterns and rules.patterns.ignored(entry_relative, False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+
+            if is_dir:
+                if rules.one_file_system and stat.st_dev != root_stat.st_dev:
+                    continue
+                subdirs.append((entry.path, entry_relative, depth + 1, stat))
+            elif not rules.prunes_file(entry_relative, stat.st_size):
+                rows.append((entry.path, stat.st_size, getattr(stat, "st_blocks", 0) * 512, "File"))
+
+        # Subdirectories are recorded when their parent is listed, so they precede their contents
+        for subdir_path, subdir_relative, subdir_depth, stat in reversed(subdirs):
+            stack.append((subdir_path, subdir_relative, subdir_depth))
+        for subdir_path, _, _, stat in subdirs:
+            rows.append((subdir_path, stat.st_size, getattr(stat, "st_blocks", 0) * 512, "Directory"))
+
+    if on_progress:
+        on_progress(seen)
+    return pd.DataFrame(rows, columns=SCAN_COLUMNS)
@@ -0,0 +1,399 @@
+"""
+Guard rails for ad-hoc Cypher.
+
+Recall queries typed in the sidebar, the `with_clause` they inject into label
+pulls and Cypher generated by an LLM all run against the live database.
+`QueryGovernor` puts each of them through the same checks:
+
+1. `EXPLAIN` the query first; the plan gives the planner's row estimates, the
+   query type (read or write) and the operators it would use, so cartesian
+   products and full node scans are caught before anything runs
+   (`inspect_plan`)
+2. cap the rows it can return by injecting or lowering a `LIMIT`
+   (`limit_query`)
+3. run it in a worker thread as a transaction with a server-side timeout,
+   tagged with an id in its transaction metadata, so `cancel` can terminate it
+   from another session with `TERMINATE TRANSACTIONS`
+
+`QueryGovernor.run` waits for the worker and calls a `poll` callback while it
+does; if the callback raises (a Streamlit rerun does, when the user clicks
+anything), the query is terminated on the server before the exception
+propagates.
+"""
+import re
+import threading
+import time
+import uuid
+
+from neo4j import EagerResult, Query
+from neo4j.exceptions import Neo4jError
+
+from utils.query_profile import profile_driver, profiled_action
+
+DEFAULT_MAX_ROWS = 10000
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_MAX_ESTIMATED_ROWS = 10_000_000
+
+# Seconds between `poll` calls while a query runs
+POLL_INTERVAL = 0.25
+
+# Transaction metadata key carrying the governor's query id
+METADATA_KEY = "sdk_query_id"
+
+# Plan operators reported to the user; Neo4j 5 suffixes them with the runtime ("AllNodesScan@neo4j")
+CARTESIAN_OPERATORS = {"CartesianProduct"}
+SCAN_OPERATORS = {"AllNodesScan", "NodeByLabelScan"}
+
+_COMMENTS_AND_STRINGS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|//[^\n]*|/\*.*?\*/", re.DOTALL)
+_RETURN = re.compile(r"\bRETURN\b", re.IGNORECASE)
+_UNION = re.compile(r"\bUNION\b", re.IGNORECASE)
+_UPDATING = re.compile(r"\b(MATCH|MERGE|CREATE|SET|DELETE|REMOVE|WITH|UNWIND|CALL|FOREACH|LOAD)\b", re.IGNORECASE)
+_LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+_TRAILING_LIMIT = re.compile(r"\bLIMIT\s+(\d+)\s*$", re.IGNORECASE)
+_PLAN_PREFIX = re.compile(r"^\s*(EXPLAIN|PROFILE)\b", re.IGNORECASE)
+_TRANSACTION_ID = re.compile(r"^[\w-]+$")
+
+
+class QueryRejected(ValueError):
+    """Raised when a query's plan exceeds the governor's limits."""
+
+
+class QueryLimits:
+    """
+    Limits applied to governed queries.
+
+    Args:
+        max_rows (int): Rows a query may return; 0 leaves its LIMIT alone.
+        timeout (float): Seconds before the server aborts the transaction.
+        max_estimated_rows (float): Largest row estimate allowed at any step of the plan.
+        block_cartesian (bool): Reject plans with a cartesian product.
+        read_only (bool): Reject queries that would write.
+    """
+
+    def __init__(self, max_rows=DEFAULT_MAX_ROWS, timeout=DEFAULT_TIMEOUT,
+                 max_estimated_rows=DEFAULT_MAX_ESTIMATED_ROWS, block_cartesian=True, read_only=True):
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.max_estimated_rows = max_estimated_rows
+        self.block_cartesian = block_cartesian
+        self.read_only = read_only
+
+
+def _blank(match):
+    # Keep offsets so positions found in the blanked text apply to the original
+    return " " * len(match.group(0))
+
+
+def limit_query(query, limit):
+    """
+    Cap the rows a query returns.
+
+    A query whose last clause is `RETURN` gets `LIMIT limit` appended, or its
+    trailing LIMIT lowered; a `UNION`, or a LIMIT given as a parameter or
+    expression (`LIMIT $k`), is wrapped in `CALL { ... }` so the cap applies
+    to the rows it returns. Queries that do not end in `RETURN` are
+    returned unchanged.
+
+    Args:
+        query (str): Cypher query.
+        limit (int): Most rows returned; 0 or None disables the cap.
+
+    Returns:
+        str: The capped query.
+    """
+    text = query.strip().rstrip(";").rstrip()
+    code = _COMMENTS_AND_STRINGS.sub(_blank, text)
+    returns = list(_RETURN.finditer(code))
+    if not limit or not returns:
+        return text
+
+    tail = code[returns[-1].end():]
+    if _UPDATING.search(tail) or tail.count("}") > tail.count("{"):
+        # The last RETURN belongs to a subquery or is followed by more clauses
+        return text
+    existing = _TRAILING_LIMIT.search(code)
+    if _UNION.search(code) or (_LIMIT.search(tail) and not existing):
+        # A LIMIT given as a parameter or expression cannot be compared, so cap the rows outside it
+        return f"CALL {{\n{text}\n}}\nRETURN *\nLIMIT {limit}"
+    if existing:
+        if int(existing.group(1)) <= limit:
+            return text
+        return f"{text[:existing.start()]}LIMIT {limit}"
+    return f"{text}\nLIMIT {limit}"
+
+
+def _operators(plan):
+    yield plan
+    for child in plan.get("children") or []:
+        yield from _operators(child)
+
+
+def inspect_plan(plan, query_type=None):
+    """
+    Summarize an EXPLAIN plan.
+
+    Args:
+        plan (dict): `ResultSummary.plan` of an EXPLAIN query.
+        query_type (str, optional): `ResultSummary.query_type` ("r", "rw", "w" or "s").
+
+    Returns:
+        dict: `estimated_rows` (rows the query returns), `peak_rows` (largest
+        estimate at any step), `operators` (set of operator names),
+        `query_type` and a list of human-readable `warnings`.
+    """
+    operators, peak = set(), 0.0
+    for step in _operators(plan or {}):
+        operators.add(str(step.get("operatorType", "")).split("@")[0])
+        peak = max(peak, float((step.get("args") or step.get("arguments") or {}).get("EstimatedRows", 0) or 0))
+    root = (plan or {}).get("args") or (plan or {}).get("arguments") or {}
+
+    warnings = []
+    if operators & CARTESIAN_OPERATORS:
+        warnings.append("The plan joins unconnected patterns (cartesian product).")
+    for operator in sorted(operators & SCAN_OPERATORS):
+        scope = "every node" if operator == "AllNodesScan" else "every node of a label"
+        warnings.append(f"The plan scans {scope} ({operator}); an indexed property lookup would be cheaper.")
+    return {
+        "estimated_rows": float(root.get("EstimatedRows", 0) or 0),
+        "peak_rows": peak,
+        "operators": operators,
+        "query_type": query_type,
+        "warnings": warnings,
+    }
+
+
+def check_plan(report, limits):
+    """
+    Raise `QueryRejected` if a plan report breaks the limits.
+
+    Args:
+        report (dict): Output of `inspect_plan`.
+        limits (QueryLimits): Limits to enforce.
+    """
+    if limits.read_only and report["query_type"] not in (None, "r"):
+        raise QueryRejected("Only read queries can run here; this query would write to the database.")
+    if limits.block_cartesian and report["operators"] & CARTESIAN_OPERATORS:
+        raise QueryRejected("The query joins unconnected patterns (cartesian product). "
+                            "Connect the patterns with a relationship or a WHERE condition.")
+    if limits.max_estimated_rows and report["peak_rows"] > limits.max_estimated_rows:
+        raise QueryRejected(f"The planner estimates {report['peak_rows']:,.0f} rows at one step, over the "
+                            f"limit of {limits.max_estimated_rows:,.0f}. Narrow the MATCH or add a filter.")
+
+
+class GovernedQuery:
+    """
+    A query running in a worker thread.
+
+    `status` moves from "running" to "completed", "failed", "timed out" or
+    "cancelled"; `records` fill in as they stream.
+
+    Args:
+        query (str): The query as it runs (after `limit_query`).
+        params (dict): Query parameters.
+        report (dict): Plan report from `inspect_plan`.
+        action (str, optional): Page or action that issued the query.
+        row_cap (int, optional): Cap `limit_query` added or lowered, None when it left the query as written.
+    """
+
+    def __init__(self, query, params, report, action=None, row_cap=None):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.row_cap = row_cap
+        self.params = params or {}
+        self.report = report
+        self.action = action
+        self.status = "running"
+        self.records = []
+        self.keys = []
+        self.summary = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self._done = threading.Event()
+        self._cancelled = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def truncated(self):
+        """Whether the row cap may have cut the result short (a LIMIT the query already had is not the cap)."""
+        return self.row_cap is not None and len(self.records) >= self.row_cap
+
+    def wait(self, timeout=None):
+        """Wait for the query to finish; returns whether it has."""
+        return self._done.wait(timeout)
+
+    def _finish(self, status, error=None):
+        self.status = "cancelled" if self._cancelled.is_set() else status
+        self.error = error
+        self.finished = time.time()
+        self._done.set()
+
+
+class QueryGovernor:
+    """
+    Runs ad-hoc Cypher within limits, cancellably.
+
+    Args:
+        driver (neo4j.Driver): Driver the queries run on; each query opens its own session.
+        database (str, optional): Database name, or None for the default.
+        limits (QueryLimits, optional): Limits; defaults apply when omitted.
+    """
+
+    def __init__(self, driver, database=None, limits=None):
+        self.driver = profile_driver(driver)
+        self.database = database
+        self.limits = limits or QueryLimits()
+
+    def _session(self):
+        return self.driver.session(database=self.database) if self.database else self.driver.session()
+
+    def explain(self, query, params=None):
+        """Return the `inspect_plan` report of a query without running it."""
+        with self._session() as session:
+            summary = session.run(f"EXPLAIN {_PLAN_PREFIX.sub('', query, count=1)}", params or {}).consume()
+        return inspect_plan(summary.plan, summary.query_type)
+
+    def submit(self, query, params=None, action=None):
+        """
+        Check a query and start it in a worker thread.
+
+        Args:
+            query (str): Cypher query.
+            params (dict, optional): Query parameters.
+            action (str, optional): Page or action issuing the query.
+
+        Returns:
+            GovernedQuery: Handle of the running query.
+
+        Raises:
+            QueryRejected: If the plan breaks the limits.
+        """
+        report = self.explain(query, params)
+        check_plan(report, self.limits)
+        capped = limit_query(query, self.limits.max_rows)
+        # Without a cap `limit_query` only normalizes the text, so a difference means the cap applies
+        row_cap = self.limits.max_rows if capped != limit_query(query, None) else None
+        handle = GovernedQuery(capped, params, report, action, row_cap)
+        thread = threading.Thread(target=self._execute, args=(handle,), name=f"query-{handle.id[:8]}", daemon=True)
+        thread.start()
+        return handle
+
+    def _execute(self, handle):
+        query = Query(handle.query, metadata={METADATA_KEY: handle.id}, timeout=self.limits.timeout or None)
+        try:
+            with profiled_action(handle.action or "Query governor"), self._session() as session:
+                if handle._cancelled.is_set():
+                    # Cancelled before the transaction started
+                    handle._finish("cancelled")
+                    return
+                result = session.run(query, handle.params)
+                handle.keys = list(result.keys())
+                for record in result:
+                    if handle._cancelled.is_set():
+                        # Closing the session discards the rest of the stream
+                        break
+                    handle.records.append(record)
+                else:
+                    handle.summary = result.consume()
+            handle._finish("completed")
+        except Neo4jError as e:
+            code = e.code or ""
+            if "TimedOut" in code:
+                handle._finish("timed out", f"The query ran longer than {self.limits.timeout:g}s and was stopped.")
+            else:
+                handle._finish("failed", e.message or str(e))
+        except Exception as e:
+            handle._finish("failed", str(e))
+
+    def cancel(self, handle):
+        """
+        Stop a running query: stop reading its rows and terminate its transaction on the server.
+
+        Returns:
+            bool: Whether a server transaction was terminated.
+        """
+        handle._cancelled.set()
+        if handle.done:
+            return False
+        try:
+            with self._session() as session:
+                ids = [
+                    record["transactionId"] for record in session.run(
+                        "SHOW TRANSACTIONS YIELD transactionId, metaData "
+                        f"WHERE metaData.{METADATA_KEY} = $id RETURN transactionId",
+                        id=handle.id,
+                    )
+                ]
+                ids = [transaction_id for transaction_id in ids if _TRANSACTION_ID.match(transaction_id)]
+                if ids:
+                    # TERMINATE TRANSACTIONS takes literal ids on Neo4j 4.4
+                    session.run("TERMINATE TRANSACTIONS " + ", ".join(f"'{i}'" for i in ids)).consume()
+        except Neo4jError:
+            return False
+        return bool(ids)
+
+    def run(self, query, params=None, action=None, poll=None):
+        """
+        Run a query within the limits and wait for it.
+
+        Args:
+            query (str): Cypher query.
+            params (dict, optional): Query parameters.
+            action (str, optional): Page or action issuing the query.
+            poll (callable, optional): Called with the handle every `POLL_INTERVAL`
+                seconds while the query runs. If it raises, the query is
+                cancelled and the exception propagates.
+
+        Returns:
+            GovernedQuery: The finished query; check `status` and `error`.
+
+        Raises:
+            QueryRejected: If the plan breaks the limits.
+        """
+        handle = self.submit(query, params, action)
+        try:
+            while not handle.wait(POLL_INTERVAL):
+                if poll:
+                    poll(handle)
+        except BaseException:
+            self.cancel(handle)
+            raise
+        return handle
+
+
+class GovernedDriver:
+    """
+    Driver proxy whose `execute_query` goes through a `QueryGovernor`.
+
+    Hands governed execution to libraries that take a driver, such as
+    neo4j-graphrag's Text2Cypher retriever; everything else is delegated to
+    the wrapped driver.
+
+    Args:
+        governor (QueryGovernor): Governor the queries run through.
+        action (str, optional): Page or action reported for the queries.
+    """
+
+    def __init__(self, governor, action=None):
+        self.governor = governor
+        self.action = action
+        self.poll = None
+
+    def __getattr__(self, name):
+        return getattr(self.governor.driver, name)
+
+    def execute_query(self, query_, parameters_=None, *args, **kwargs):
+        text = query_.text if isinstance(query_, Query) else query_
+        params = dict(parameters_ or {})
+        params.update({key: value for key, value in kwargs.items() if not key.endswith("_")})
+        handle = self.governor.run(text, params, action=self.action, poll=self.poll)
+        if handle.status != "completed":
+            raise RuntimeError(handle.error or f"Query {handle.status}.")
+        return EagerResult(handle.records, handle.summary, handle.keys)
@@ -0,0 +1,448 @@
+"""
+Query timings for every Neo4j call the app makes.
+
+Drivers are wrapped in `ProfiledDriver`; the sessions (and managed
+transactions) it hands out time each query from `run` until its result is
+used up, count the rows and record them with the page or action that issued
+the query in a process-wide `QueryProfiler`:
+
+- statistics are kept per action and query fingerprint (the query with its
+  literals and whitespace normalized), for a "top offenders" ranking
+- once a fingerprint has run longer than `slow_seconds`, a sample of its later
+  runs is sent as `PROFILE <query>`; the same rows come back, plus the plan
+  with its db hits, so nothing is executed twice
+- slow queries are written to a rotating log under `DEFAULT_LOG_DIR`
+
+The action is taken from `profiled_action` when one is active, then from the
+provider set with `set_action_provider` (the Streamlit page), then from the
+thread name.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+import pandas as pd
+from neo4j import EagerResult, Query
+
+DEFAULT_LOG_DIR = Path.home() / ".science_data_kit" / "logs"
+SLOW_QUERY_LOG = "slow_queries.log"
+LOG_MAX_BYTES = 5 << 20
+LOG_BACKUPS = 5
+
+DEFAULT_SLOW_SECONDS = 1.0
+
+# Share of runs of a slow fingerprint sent with PROFILE, and the least time between two profiles of it
+PROFILE_SAMPLE_RATE = 0.2
+PROFILE_INTERVAL = 600
+
+# Fingerprints kept; the least recently run are forgotten first
+MAX_ENTRIES = 500
+
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+# Queries PROFILE cannot prefix: already explained/profiled, or committing in batches of their own
+_NOT_PROFILABLE = re.compile(r"^\s*(EXPLAIN|PROFILE|CYPHER|USE)\b|\bIN\s+TRANSACTIONS\b|\bPERIODIC\s+COMMIT\b",
+                             re.IGNORECASE)
+
+_action = contextvars.ContextVar("query_action", default=None)
+_action_provider = None
+
+
+def fingerprint(query):
+    """Return a query with literals replaced by `?` and whitespace collapsed."""
+    return _WHITESPACE.sub(" ", _LITERALS.sub("?", query)).strip()
+
+
+@contextlib.contextmanager
+def profiled_action(action):
+    """Attribute the queries run inside the block (in this thread) to `action`."""
+    token = _action.set(action)
+    try:
+        yield
+    finally:
+        _action.reset(token)
+
+
+def set_action_provider(provider):
+    """Set a callable returning the current page or action, used when no `profiled_action` is active."""
+    global _action_provider
+    _action_provider = provider
+
+
+def current_action():
+    """Return the page or action queries are attributed to right now."""
+    action = _action.get()
+    if action is None and _action_provider is not None:
+        try:
+            action = _action_provider()
+        except Exception:
+            action = None
+    return action or threading.current_thread().name
+
+
+def plan_db_hits(profile):
+    """Total db hits of a profiled plan (`ResultSummary.profile`)."""
+    if not profile:
+        return None
+    return int(profile.get("dbHits", 0) or 0) + sum(plan_db_hits(child) or 0 for child in profile.get("children") or [])
+
+
+def format_plan(profile, depth=0):
+    """Render a profiled plan as indented lines of operator, rows and db hits."""
+    if not profile:
+        return []
+    operator = str(profile.get("operatorType", "?")).split("@")[0]
+    lines = [f"{'  ' * depth}{operator}  rows={profile.get('rows', '?')}  db_hits={profile.get('dbHits', '?')}"]
+    for child in profile.get("children") or []:
+        lines.extend(format_plan(child, depth + 1))
+    return lines
+
+
+class QueryProfiler:
+    """
+    Process-wide query statistics, PROFILE sampling and slow-query log.
+
+    Args:
+        slow_seconds (float): Wall time from which a query counts as slow.
+        log_dir (str or Path): Directory of the rotating slow-query log.
+    """
+
+    def __init__(self, slow_seconds=DEFAULT_SLOW_SECONDS, log_dir=DEFAULT_LOG_DIR):
+        self.slow_seconds = slow_seconds
+        self.log_path = Path(log_dir) / SLOW_QUERY_LOG
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._logger = None
+
+    def _log(self):
+        if self._logger is None:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            logger = logging.getLogger("science_data_kit.slow_queries")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            # Streamlit re-imports pages, not utils, but guard against a second handler anyway
+            if not any(getattr(handler, "baseFilename", None) == str(self.log_path) for handler in logger.handlers):
+                handler = RotatingFileHandler(self.log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def should_profile(self, query):
+        """Whether this run of `query` should be sent with PROFILE."""
+        if _NOT_PROFILABLE.search(query):
+            return False
+        key = (current_action(), fingerprint(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None or entry["max_seconds"] < self.slow_seconds
+                    or entry["query_type"] not in ("r", "rw", "w")
+                    or time.time() - entry["profiled_at"] < PROFILE_INTERVAL
+                    or random.random() >= PROFILE_SAMPLE_RATE):
+                return False
+            # Claimed now so concurrent runs do not all profile
+            entry["profiled_at"] = time.time()
+        return True
+
+    def record(self, query, seconds, rows, action=None, summary=None, error=None):
+        """
+        Record one query run.
+
+        Args:
+            query (str): Query text as run (a PROFILE prefix is ignored for grouping).
+            seconds (float): Wall time from `run` until the result was used up.
+            rows (int): Rows returned.
+            action (str, optional): Page or action; `current_action()` by default.
+            summary (neo4j.ResultSummary, optional): Summary of the run, for the query type and profile.
+            error (str, optional): Error the query failed with.
+        """
+        action = action or current_action()
+        text = re.sub(r"^\s*PROFILE\s+", "", query, count=1, flags=re.IGNORECASE)
+        key = (action, fingerprint(text))
+        profile = getattr(summary, "profile", None)
+        db_hits = plan_db_hits(profile)
+
+        with self._lock:
+            entry = self._entries.pop(key, None) or {
+                "action": action, "query": key[1], "calls": 0, "errors": 0, "total_seconds": 0.0,
+                "max_seconds": 0.0, "rows": 0, "db_hits": None, "plan": None, "query_type": None,
+                "profiled_at": 0.0, "last_run": 0.0,
+            }
+            entry["calls"] += 1
+            entry["errors"] += bool(error)
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["rows"] += rows
+            entry["last_run"] = time.time()
+            if getattr(summary, "query_type", None):
+                entry["query_type"] = summary.query_type
+            if profile:
+                entry["db_hits"], entry["plan"] = db_hits, profile
+            self._entries[key] = entry
+            while len(self._entries) > MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+        if seconds >= self.slow_seconds or error:
+            self._log().info(json.dumps({
+                "action": action,
+                "seconds": round(seconds, 3),
+                "rows": rows,
+                "db_hits": db_hits,
+                "error": error,
+                "query": _WHITESPACE.sub(" ", text).strip(),
+                "plan": format_plan(profile) or None,
+            }))
+
+    def top(self, n=10):
+        """
+        Return the fingerprints with the most total time.
+
+        Returns:
+            pd.DataFrame: One row per action and query, slowest total first.
+        """
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        columns = ["action", "query", "calls", "errors", "total_seconds", "mean_seconds", "max_seconds",
+                   "rows", "db_hits", "plan"]
+        for entry in entries:
+            entry["mean_seconds"] = entry["total_seconds"] / entry["calls"]
+        frame = pd.DataFrame(entries, columns=columns)
+        return frame.sort_values("total_seconds", ascending=False, ignore_index=True).head(n)
+
+    def reset(self):
+        """Forget all statistics (the log file is kept)."""
+        with self._lock:
+            self._entries.clear()
+
+
+_PROFILER = None
+_PROFILER_LOCK = threading.Lock()
+
+
+def get_profiler():
+    """Return the process-wide `QueryProfiler`."""
+    global _PROFILER
+    with _PROFILER_LOCK:
+        if _PROFILER is None:
+            _PROFILER = QueryProfiler()
+        return _PROFILER
+
+
+def _query_text(query):
+    return query.text if isinstance(query, Query) else str(query)
+
+
+class ProfiledResult:
+    """
+    A `neo4j.Result` that records its query once it has been used up.
+
+    Iterating, `single`, `data`, `value`, `values` and `consume` finish it;
+    anything else is delegated to the wrapped result.
+    """
+
+    def __init__(self, result, query, action, started):
+        self._result = result
+        self._query = query
+        self._action = action
+        self._started = started
+        self._rows = 0
+        self._summary = None
+        self._recorded = False
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+    def __iter__(self):
+        try:
+            for record in self._result:
+                self._rows += 1
+                yield record
+        except Exception as e:
+            self._finish(error=str(e))
+            raise
+        self._finish()
+
+    def _finish(self, summary=None, error=None):
+        if self._recorded:
+            return summary
+        self._recorded = True
+        if summary is None and error is None:
+            try:
+                summary = self._result.consume()
+            except Exception as e:
+                error = str(e)
+        self._summary = summary
+        get_profiler().record(self._query, time.time() - self._started, self._rows, self._action, summary, error)
+        return summary
+
+    def _collect(self, method, *args, **kwargs):
+        try:
+            value = getattr(self._result, method)(*args, **kwargs)
+        except Exception as e:
+            self._finish(error=str(e))
+            raise
+        return value
+
+    def single(self, *args, **kwargs):
+        record = self._collect("single", *args, **kwargs)
+        self._rows += record is not None
+        self._finish()
+        return record
+
+    def data(self, *keys):
+        data = self._collect("data", *keys)
+        self._rows += len(data)
+        self._finish()
+        return data
+
+    def value(self, *args, **kwargs):
+        values = self._collect("value", *args, **kwargs)
+        self._rows += len(values)
+        self._finish()
+        return values
+
+    def values(self, *keys):
+        values = self._collect("values", *keys)
+        self._rows += len(values)
+        self._finish()
+        return values
+
+    def consume(self):
+        summary = self._collect("consume")
+        return self._finish(summary)
+
+
+def _profiled_run(target, owner, query, parameters, kwargs):
+    """Run a query on a session or transaction, sending it with PROFILE when sampled."""
+    owner._finish_last()
+    text = _query_text(query)
+    if get_profiler().should_profile(text):
+        text = f"PROFILE {text}"
+        query = Query(text, metadata=query.metadata, timeout=query.timeout) if isinstance(query, Query) else text
+    action = current_action()
+    started = time.time()
+    try:
+        result = target.run(query, parameters, **kwargs)
+    except Exception as e:
+        get_profiler().record(text, time.time() - started, 0, action, error=str(e))
+        raise
+    owner._last = ProfiledResult(result, text, action, started)
+    return owner._last
+
+
+class _ProfiledTransaction:
+    """Managed transaction whose `run` is profiled like a session's."""
+
+    def __init__(self, transaction):
+        self._transaction = transaction
+        self._last = None
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+    def _finish_last(self):
+        if self._last is not None:
+            self._last._finish()
+            self._last = None
+
+    def run(self, query, parameters=None, **kwargs):
+        return _profiled_run(self._transaction, self, query, parameters, kwargs)
+
+
+class ProfiledSession:
+    """
+    A `neo4j.Session` whose queries are recorded by the `QueryProfiler`.
+
+    A result left unconsumed is recorded when the next query runs or the
+    session closes, as the driver itself discards it then.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self._last = None
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _finish_last(self):
+        if self._last is not None:
+            self._last._finish()
+            self._last = None
+
+    def run(self, query, parameters=None, **kwargs):
+        return _profiled_run(self._session, self, query, parameters, kwargs)
+
+    def _managed(self, method, transaction_function, *args, **kwargs):
+        self._finish_last()
+
+        def profiled(tx, *a, **k):
+            transaction = _ProfiledTransaction(tx)
+            value = transaction_function(transaction, *a, **k)
+            transaction._finish_last()
+            return value
+        return getattr(self._session, method)(profiled, *args, **kwargs)
+
+    def execute_read(self, transaction_function, *args, **kwargs):
+        return self._managed("execute_read", transaction_function, *args, **kwargs)
+
+    def execute_write(self, transaction_function, *args, **kwargs):
+        return self._managed("execute_write", transaction_function, *args, **kwargs)
+
+    def close(self):
+        self._finish_last()
+        self._session.close()
+
+
+class ProfiledDriver:
+    """
+    A `neo4j.Driver` whose sessions and `execute_query` calls are profiled.
+
+    Args:
+        driver (neo4j.Driver): Driver to wrap.
+    """
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._driver.close()
+
+    def session(self, **config):
+        return ProfiledSession(self._driver.session(**config))
+
+    def execute_query(self, query_, parameters_=None, *args, **kwargs):
+        text = _query_text(query_)
+        action = current_action()
+        started = time.time()
+        try:
+            records, summary, keys = self._driver.execute_query(query_, parameters_, *args, **kwargs)
+        except Exception as e:
+            get_profiler().record(text, time.time() - started, 0, action, error=str(e))
+            raise
+        get_profiler().record(text, time.time() - started, len(records), action, summary)
+        return EagerResult(records, summary, keys)
+
+
+def profile_driver(driver):
+    """Wrap a driver in `ProfiledDriver` unless it already is one."""
+    return driver if driver is None or isinstance(driver, ProfiledDriver) else ProfiledDriver(driver)
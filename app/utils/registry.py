@@ -1,5 +1,5 @@
 from neomodel import (
-    StructuredNode, StringProperty, UniqueIdProperty,
+    StructuredNode, StringProperty,
     RelationshipTo,
     db)
 import sys
@@ -58,8 +58,8 @@ Folder = register_model(
     "Folder",
     StructuredNode,
     attributes={
-        "uid": UniqueIdProperty(),
-        "filepath": StringProperty(unique_index=True),
+        "uid": StringProperty(unique_index=True),  # utils.identity.path_uid
+        "filepath": StringProperty(index=True),
     },
     relationships={
         "is_in": "Folder"  # Reference itself in a self-referential relationship
@@ -70,8 +70,8 @@ File = register_model(
     "File",
     StructuredNode,
     attributes={
-        "uid": UniqueIdProperty(),
-        "filepath": StringProperty(unique_index=True),
+        "uid": StringProperty(unique_index=True),  # utils.identity.path_uid
+        "filepath": StringProperty(index=True),
     },
     relationships={
         "is_in": "Folder"  # Reference itself in a self-referential relationship
@@ -0,0 +1,303 @@
+"""
+Fuzzy entity resolution ahead of `utils.models.merge_nodes_with_existing`.
+
+Merging only matches exactly equal values, so `Mouse_07` and `mouse07` become
+two nodes. `resolve_entities` finds such near-duplicates among the incoming
+entities and against the existing nodes of the target label without comparing
+all pairs:
+
+1. the existing keys are fetched once (`fetch_existing_keys`) and every key is
+   normalized (case, punctuation, leading zeros), so `Mouse_07`, `mouse-7`
+   and `MOUSE07` land in the same block and link outright
+2. the remaining keys are blocked by character n-grams with prefix filtering:
+   only pairs that share one of the rarest n-grams of each key can reach the
+   threshold, so the candidate pairs stay close to linear in the number of keys;
+   keys whose numbers differ (`mouse07` and `mouse08`) are never paired
+3. candidate pairs are scored by n-gram Jaccard similarity, computed for all
+   pairs at once with merges and a group-by, and pairs above the threshold
+   are joined into clusters
+
+Each cluster gets a canonical key (the existing node's, else the most common
+incoming one) and is shown for confirmation; `apply_resolution` then rewrites
+the match columns of confirmed clusters to their canonical keys.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_NGRAM = 3
+
+# Keys sharing a blocking n-gram before the n-gram is ignored
+DEFAULT_MAX_BLOCK = 1000
+
+# Candidate pairs generated per blocking pass of `candidate_pairs`
+DEFAULT_MAX_PAIRS = 1000000
+
+# Separates the match column values of a composite key
+KEY_SEPARATOR = " | "
+
+CLUSTER_COLUMNS = ["cluster", "canonical", "members", "existing", "score", "rows", "merge", "canonical_values"]
+
+
+def normalize_keys(values):
+    """
+    Normalize entity keys for blocking: lowercase, alphanumerics only, no leading zeros.
+
+    Args:
+        values (pd.Series): Key values.
+
+    Returns:
+        pd.Series: Normalized keys (`Mouse_07` -> `mouse7`).
+    """
+    keys = values.astype(str).str.lower().str.replace(r"[^0-9a-z]+", "", regex=True)
+    return keys.str.replace(r"(?<![0-9])0+(?=[0-9])", "", regex=True)
+
+
+def _composite(frame, columns):
+    """Join the match columns of each row into one display key and one normalized key."""
+    display = frame[columns[0]].astype(str)
+    normalized = normalize_keys(frame[columns[0]])
+    for column in columns[1:]:
+        display = display + KEY_SEPARATOR + frame[column].astype(str)
+        normalized = normalized + "|" + normalize_keys(frame[column])
+    return display, normalized
+
+
+def fetch_existing_keys(session, label, properties):
+    """
+    Fetch the distinct values of the match properties of one label.
+
+    Args:
+        session: Neo4j session.
+        label (str): Target node label.
+        properties (list): Target property names, in match column order.
+
+    Returns:
+        pd.DataFrame: One row per distinct key, one column per property.
+    """
+    returns = ", ".join(f"n.`{prop}` AS `{prop}`" for prop in properties)
+    present = " AND ".join(f"n.`{prop}` IS NOT NULL" for prop in properties)
+    result = session.run(f"MATCH (n:`{label}`) WHERE {present} RETURN DISTINCT {returns}")
+    return pd.DataFrame([record.data() for record in result], columns=properties)
+
+
+def _ngrams(keys, n):
+    """Explode normalized keys into (key id, n-gram) rows, each n-gram tagged with the key's digits."""
+    padded = "^" + keys + "$"
+    digits = keys.str.replace(r"[^0-9|]+", "", regex=True)
+    grams = pd.Series([{key[i:i + n] + "#" + tag for i in range(max(1, len(key) - n + 1))}
+                       for key, tag in zip(padded, digits)], index=keys.index)
+    exploded = grams.explode()
+    return pd.DataFrame({"key": exploded.index.to_numpy(), "gram": exploded.to_numpy()}), grams.map(len)
+
+
+def candidate_pairs(keys, incoming, threshold=DEFAULT_THRESHOLD, ngram=DEFAULT_NGRAM, max_block=DEFAULT_MAX_BLOCK,
+                    max_pairs=DEFAULT_MAX_PAIRS):
+    """
+    Score the key pairs whose n-gram Jaccard similarity can reach the threshold.
+
+    Blocking uses prefix filtering: with n-grams ranked rarest first, two keys
+    with Jaccard similarity of at least `threshold` share one of the first
+    `size - ceil(threshold * size) + 1` n-grams of each key, so only pairs
+    sharing such a (mostly rare) n-gram are scored.
+
+    Args:
+        keys (pd.Series): Distinct normalized keys, indexed 0..n-1.
+        incoming (np.ndarray): True for the keys of incoming entities; pairs of
+            two existing keys are not scored.
+        threshold (float): Lowest similarity kept.
+        ngram (int): N-gram length.
+        max_block (int): Prefix n-grams shared by more keys are ignored, which
+            bounds the work on very uniform keys at the cost of recall.
+        max_pairs (int): Candidate pairs generated per blocking pass.
+
+    Returns:
+        pd.DataFrame: `a`, `b` (key ids, a < b) and `score` (n-gram Jaccard).
+    """
+    grams, sizes = _ngrams(keys, ngram)
+    # Integer gram codes keep the merges below off string hashing
+    codes, uniques = pd.factorize(grams["gram"])
+    grams = pd.DataFrame({"key": grams["key"].to_numpy(dtype=np.int64), "gram": codes.astype(np.int64)})
+    frequency = np.bincount(codes, minlength=len(uniques))[codes]
+    grams = grams.assign(frequency=frequency).sort_values(["key", "frequency", "gram"], kind="stable")
+    position = grams.groupby("key").cumcount().to_numpy()
+    size = sizes.to_numpy()[grams["key"].to_numpy()]
+    prefix_length = size - np.ceil(threshold * size - 1e-9).astype(int) + 1
+    prefixes = grams[(position < prefix_length) & (grams["frequency"].to_numpy() <= max_block)][["key", "gram"]]
+    left = prefixes[incoming[prefixes["key"].to_numpy()]]
+    # Pairs each incoming prefix gram generates, to cut the blocking into bounded passes
+    cost = np.cumsum(np.bincount(prefixes["gram"].to_numpy(), minlength=len(uniques))[left["gram"].to_numpy()])
+    # Every (key, gram) as one sorted integer, for the verification lookups
+    memberships = np.sort(grams["key"].to_numpy() * len(uniques) + grams["gram"].to_numpy())
+    grams = grams[["key", "gram"]]
+
+    scored = []
+    # Blocking runs in passes of about `max_pairs` pairs so the pair tables stay bounded in memory
+    bounds = np.searchsorted(cost, np.arange(max_pairs, cost[-1] + max_pairs, max_pairs), side="right") if len(cost) else []
+    start = 0
+    for end in bounds:
+        end = max(end, start + 1)
+        chunk, start = left.iloc[start:end], end
+        if chunk.empty:
+            continue
+        pairs = chunk.merge(prefixes, on="gram", suffixes=("_a", "_b"))
+        pairs = pairs[pairs["key_a"] != pairs["key_b"]]
+        # Order each pair so incoming-incoming pairs found from both sides are scored once
+        pairs = pd.DataFrame({
+            "a": np.minimum(pairs["key_a"].to_numpy(), pairs["key_b"].to_numpy()),
+            "b": np.maximum(pairs["key_a"].to_numpy(), pairs["key_b"].to_numpy()),
+        }).drop_duplicates()
+        if pairs.empty:
+            continue
+
+        # Verify on the full n-gram sets: count the grams of `a` that `b` also has
+        expanded = pairs.merge(grams.rename(columns={"key": "a"}), on="a")
+        lookup = expanded["b"].to_numpy() * len(uniques) + expanded["gram"].to_numpy()
+        found = np.searchsorted(memberships, lookup)
+        expanded["hit"] = memberships[np.minimum(found, len(memberships) - 1)] == lookup
+        shared = expanded.groupby(["a", "b"])["hit"].sum().rename("shared").reset_index()
+        size_a = sizes.to_numpy()[shared["a"].to_numpy()]
+        size_b = sizes.to_numpy()[shared["b"].to_numpy()]
+        shared["score"] = shared["shared"] / (size_a + size_b - shared["shared"])
+        scored.append(shared.loc[shared["score"] >= threshold, ["a", "b", "score"]])
+    if not scored:
+        return pd.DataFrame(columns=["a", "b", "score"]).astype({"a": int, "b": int, "score": float})
+    return pd.concat(scored).drop_duplicates(["a", "b"]).reset_index(drop=True)
+
+
+def _components(count, a, b):
+    """Label connected components of an undirected graph given as edge arrays (union-find)."""
+    parent = np.arange(count)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(a, b):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    return np.array([find(i) for i in range(count)])
+
+
+def resolve_entities(entities, match_columns, existing=None, threshold=DEFAULT_THRESHOLD, ngram=DEFAULT_NGRAM,
+                     max_block=DEFAULT_MAX_BLOCK):
+    """
+    Cluster near-duplicate entity keys, among themselves and against existing nodes.
+
+    Args:
+        entities (pd.DataFrame): Incoming entities.
+        match_columns (list): Columns that identify an entity.
+        existing (pd.DataFrame, optional): Existing keys with the same columns
+            (see `fetch_existing_keys`, renamed to the match columns).
+        threshold (float): Lowest n-gram Jaccard similarity that links two keys.
+        ngram (int): N-gram length.
+        max_block (int): Blocking n-grams shared by more keys are ignored.
+
+    Returns:
+        pd.DataFrame: One row per cluster with more than one key
+        (`CLUSTER_COLUMNS`): the canonical key, the incoming keys that would be
+        rewritten to it, whether it is an existing node, the lowest link score,
+        the incoming rows affected, a `merge` flag to confirm and the canonical
+        key's original per-column values (`canonical_values`, a tuple).
+    """
+    if not match_columns:
+        raise ValueError("Select at least one match column to resolve entities on.")
+    rows = entities.dropna(subset=match_columns)
+    if rows.empty:
+        # Nothing incoming to rewrite
+        return pd.DataFrame(columns=CLUSTER_COLUMNS)
+    display, normalized = _composite(rows, match_columns)
+    incoming_keys = pd.DataFrame({"display": display, "normalized": normalized,
+                                  "values": list(rows[match_columns].itertuples(index=False, name=None))})
+    counts = incoming_keys.groupby("display").size()
+    incoming_keys = incoming_keys.drop_duplicates("display").assign(existing=False)
+    incoming_keys["rows"] = incoming_keys["display"].map(counts).to_numpy()
+
+    frames = [incoming_keys]
+    if existing is not None and not existing.empty:
+        existing = existing.dropna(subset=match_columns)
+        existing_display, existing_normalized = _composite(existing, match_columns)
+        frames.insert(0, pd.DataFrame({
+            "display": existing_display, "normalized": existing_normalized,
+            "values": list(existing[match_columns].itertuples(index=False, name=None)),
+            "existing": True, "rows": 0,
+        }).drop_duplicates("display"))
+    keys = pd.concat(frames, ignore_index=True)
+    # An incoming key that already exists verbatim is the existing node
+    keys = keys.drop_duplicates("display").reset_index(drop=True)
+    keys["rows"] = keys["display"].map(counts).fillna(0).astype(int)
+
+    # Equal normalized keys link outright; distinct normalized keys are scored on n-grams
+    distinct = keys["normalized"].drop_duplicates()
+    norm_ids = pd.Series(np.arange(len(distinct)), index=distinct.to_numpy())
+    keys["norm_id"] = keys["normalized"].map(norm_ids).to_numpy()
+    norm_incoming = keys.groupby("norm_id")["existing"].all().sort_index().to_numpy() == False  # noqa: E712
+    pairs = candidate_pairs(pd.Series(distinct.to_numpy()), norm_incoming, threshold, ngram, max_block)
+    component = _components(len(distinct), pairs["a"].to_numpy(), pairs["b"].to_numpy())
+    keys["cluster"] = component[keys["norm_id"].to_numpy()]
+
+    # Lowest score on the links that formed each cluster (1.0 for normalized-equal keys only)
+    pairs = pairs.assign(cluster=component[pairs["a"].to_numpy()])
+    link_scores = pairs.groupby("cluster")["score"].min()
+
+    # Canonical key: the (first) existing node, else the most common incoming key
+    ranked = keys.sort_values(["cluster", "existing", "rows"], ascending=[True, False, False], kind="stable")
+    canonical = ranked.drop_duplicates("cluster").set_index("cluster")
+    keys["canonical"] = keys["cluster"].map(canonical["display"])
+    rewritten = keys[~keys["existing"] & (keys["display"] != keys["canonical"])]
+
+    grouped = rewritten.groupby("cluster")
+    clusters = pd.DataFrame({
+        "canonical": grouped["canonical"].first(),
+        "members": grouped["display"].agg(list),
+        "rows": grouped["rows"].sum().astype(int),
+    })
+    clusters["existing"] = canonical["existing"].reindex(clusters.index).astype(bool)
+    clusters["score"] = link_scores.reindex(clusters.index).fillna(1.0).astype(float)
+    clusters["merge"] = True
+    clusters["canonical_values"] = canonical["values"].reindex(clusters.index)
+    clusters = clusters.rename_axis("cluster").reset_index()[CLUSTER_COLUMNS]
+    return clusters.sort_values("score", kind="stable").reset_index(drop=True)
+
+
+def apply_resolution(entities, match_columns, clusters):
+    """
+    Rewrite the match columns of entities in confirmed clusters to the canonical key.
+
+    Args:
+        entities (pd.DataFrame): Incoming entities.
+        match_columns (list): Columns that identify an entity.
+        clusters (pd.DataFrame): `resolve_entities` output; only rows with `merge` set apply.
+
+    Returns:
+        pd.DataFrame: A copy of the entities with resolved keys.
+    """
+    confirmed = clusters[clusters["merge"].astype(bool)]
+    mapping = {member: values for values, members in zip(confirmed["canonical_values"], confirmed["members"])
+               for member in members}
+    resolved = entities.copy()
+    if not mapping:
+        return resolved
+    # Only rows with a complete key can be cluster members
+    complete = resolved[match_columns].notna().all(axis=1).to_numpy()
+    display, _ = _composite(resolved[complete], match_columns)
+    target = display.map(mapping)
+    rewrite = np.flatnonzero(complete)[target.notna().to_numpy()]
+    canonical = target.dropna().to_list()
+    for i, column in enumerate(match_columns):
+        # Write the canonical values themselves, then restore the column's dtype, so
+        # rewritten and untouched rows compare equal when merged
+        dtype = resolved[column].dtype
+        values = resolved[column].astype(object).to_numpy(copy=True)
+        values[rewrite] = [key[i] for key in canonical]
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtype = "category"
+        try:
+            column_values = pd.Series(values, index=resolved.index, dtype=object).astype(dtype)
+        except (TypeError, ValueError):
+            column_values = pd.Series(values, index=resolved.index, dtype=object)
+        resolved[column] = column_values
+    return resolved
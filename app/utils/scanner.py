@@ -0,0 +1,105 @@
+"""
+Filesystem scanning with ncdu, without any Streamlit dependency.
+
+`run_ncdu` drives the ncdu process and `load_ncdu_export` turns its JSON export
+into the scan DataFrame used by the Survey and Map pages (`Path`,
+`Size (Bytes)`, `Disk Usage (Bytes)`, `Type`).
+"""
+import json
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+SCAN_COLUMNS = ["Path", "Size (Bytes)", "Disk Usage (Bytes)", "Type"]
+
+
+def run_ncdu(root, output_json_path, extra_args=None, on_output=None, cancel_event=None, poll_interval=0.5):
+    """
+    Run ncdu over `root` and write its JSON export to `output_json_path`.
+
+    Args:
+        root (str): Directory to scan.
+        output_json_path (str): Where ncdu writes its export.
+        extra_args (list, optional): Additional ncdu arguments (e.g. excludes).
+        on_output (callable, optional): Called with each line ncdu prints.
+        cancel_event (threading.Event, optional): Terminates the scan when set.
+        poll_interval (float): Seconds between cancellation checks.
+
+    Returns:
+        Path: The export path.
+    """
+    output_json_path = Path(output_json_path)
+    command = ["ncdu", *(extra_args or []), "-o", str(output_json_path), str(root)]
+
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1) as process:
+        def _pump():
+            for line in process.stdout:
+                if on_output:
+                    on_output(line)
+
+        reader = threading.Thread(target=_pump, daemon=True)
+        reader.start()
+        while process.poll() is None:
+            if cancel_event is not None and cancel_event.is_set():
+                process.terminate()
+                process.wait()
+                raise InterruptedError(f"Scan of {root} was cancelled.")
+            time.sleep(poll_interval)
+        reader.join()
+
+    if not output_json_path.exists():
+        raise RuntimeError(f"ncdu did not write {output_json_path} (exit code {process.returncode}).")
+    return output_json_path
+
+
+def parse_ncdu_export(data):
+    """
+    Flatten an ncdu JSON export into scan rows.
+
+    In the export a directory is a list whose first item describes the directory
+    and whose remaining items are its children; a file is a plain dict. The tree
+    is walked with an explicit stack so deep trees do not hit the recursion limit.
+
+    Args:
+        data (list): Parsed ncdu export (`[major, minor, metadata, root]`).
+
+    Returns:
+        pd.DataFrame: One row per directory or file, parents before children.
+    """
+    rows = []
+    stack = [(data[3], "")]
+    while stack:
+        node, parent_path = stack.pop()
+        if isinstance(node, list):
+            info, children = node[0], node[1:]
+        else:
+            info, children = node, None
+        path = f"{parent_path}/{info['name']}" if parent_path else info["name"]
+        rows.append({
+            "Path": path,
+            "Size (Bytes)": info.get("asize", 0),
+            "Disk Usage (Bytes)": info.get("dsize", 0),
+            "Type": "Directory" if children is not None else "File",
+        })
+        if children:
+            stack.extend((child, path) for child in reversed(children))
+    return pd.DataFrame(rows, columns=SCAN_COLUMNS)
+
+
+def load_ncdu_export(source):
+    """
+    Load an ncdu JSON export from a path or an open file.
+
+    Args:
+        source: Path to the export, or a file-like object.
+
+    Returns:
+        pd.DataFrame: Scan rows.
+    """
+    if hasattr(source, "read"):
+        return parse_ncdu_export(json.load(source))
+    with open(source, "r") as f:
+        return parse_ncdu_export(json.load(f))
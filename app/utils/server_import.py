@@ -0,0 +1,238 @@
+"""
+Server-side ingestion of node/edge tables with LOAD CSV.
+
+The tables from `utils.bulk_load` are written as CSV (optionally gzipped) into
+the import directory of the managed Neo4j container, and Neo4j reads them with
+`LOAD CSV ... CALL { } IN TRANSACTIONS` or `apoc.periodic.iterate`. Rows never
+cross the Bolt driver one by one and the server decides how to batch them.
+
+Containers started by this app mount a host directory at `/import`; for older
+containers without the mount, the files are copied in with `put_archive`.
+"""
+import re
+import shutil
+import tarfile
+import tempfile
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+from utils.bulk_load import ensure_uid_constraints
+
+DEFAULT_IMPORT_DIR = Path.home() / ".science_data_kit" / "neo4j_import"
+CONTAINER_IMPORT_MOUNT = "/import"
+CONTAINER_DEFAULT_IMPORT_DIR = "/var/lib/neo4j/import"
+DEFAULT_ROWS_PER_TRANSACTION = 10000
+LOAD_METHODS = ("transactions", "apoc")
+
+# pandas inferred dtype -> Cypher conversion applied to the CSV string
+_CONVERSIONS = {
+    "integer": "toInteger",
+    "floating": "toFloat",
+    "mixed-integer-float": "toFloat",
+    "decimal": "toFloat",
+    "boolean": "toBoolean",
+}
+
+
+def mounted_import_dir(container):
+    """Return the host directory mounted at the container's `/import`, or None."""
+    for mount in container.attrs.get("Mounts", []):
+        if mount.get("Destination") == CONTAINER_IMPORT_MOUNT:
+            return Path(mount["Source"])
+    return None
+
+
+def safe_file_name(name):
+    """Return a label or relationship type as a string safe to use in a file name."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(name))
+
+
+def _conversion(series):
+    return _CONVERSIONS.get(pd.api.types.infer_dtype(series, skipna=True))
+
+
+def write_import_tables(nodes, edges, directory, prefix, compress=False):
+    """
+    Write node and edge tables as one CSV per label / relationship type.
+
+    Args:
+        nodes (pd.DataFrame): Node table from `utils.bulk_load`.
+        edges (pd.DataFrame): Edge table from `utils.bulk_load`.
+        directory (Path): Directory to write into.
+        prefix (str): Prefix for the file names.
+        compress (bool): Gzip the files.
+
+    Returns:
+        list: Manifest entries describing each file, nodes first.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    extension = ".csv.gz" if compress else ".csv"
+    compression = "gzip" if compress else None
+    manifest = []
+
+    for label, group in nodes.groupby("label", sort=False):
+        frame = group.drop(columns="label")
+        file_name = f"{prefix}_nodes_{safe_file_name(label)}{extension}"
+        frame.to_csv(directory / file_name, index=False, compression=compression)
+        manifest.append({
+            "kind": "nodes",
+            "file": file_name,
+            "label": label,
+            "columns": {col: _conversion(frame[col]) for col in frame.columns if col != "uid"},
+            "rows": len(frame),
+        })
+
+    for (start_label, end_label, rel_type), group in edges.groupby(
+            ["start_label", "end_label", "type"], sort=False):
+        file_name = f"{prefix}_edges_{safe_file_name(start_label)}_{safe_file_name(rel_type)}_{safe_file_name(end_label)}{extension}"
+        group[["start_uid", "end_uid"]].to_csv(directory / file_name, index=False, compression=compression)
+        manifest.append({
+            "kind": "edges",
+            "file": file_name,
+            "start_label": start_label,
+            "end_label": end_label,
+            "type": rel_type,
+            "rows": len(group),
+        })
+
+    return manifest
+
+
+def stage_files(container, directory, manifest):
+    """
+    Copy the manifest's files into a container that has no `/import` mount.
+
+    The files are streamed as a tar archive from disk rather than built in memory.
+    """
+    with tempfile.TemporaryFile() as archive:
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for entry in manifest:
+                info = tar.gettarinfo(str(Path(directory) / entry["file"]), arcname=entry["file"])
+                info.mode = 0o644
+                with open(Path(directory) / entry["file"], "rb") as f:
+                    tar.addfile(info, f)
+        archive.seek(0)
+        if not container.put_archive(CONTAINER_DEFAULT_IMPORT_DIR, archive):
+            raise RuntimeError(f"Could not copy import files into container '{container.name}'.")
+
+
+def _inner_statement(entry):
+    if entry["kind"] == "nodes":
+        assignments = []
+        for col, conversion in entry["columns"].items():
+            value = f"row.`{col}`"
+            assignments.append(f"n.`{col}` = {conversion}({value})" if conversion else f"n.`{col}` = {value}")
+        set_clause = f" SET {', '.join(assignments)}" if assignments else ""
+        return f"MERGE (n:`{entry['label']}` {{uid: row.uid}}){set_clause}"
+    return (
+        f"MATCH (a:`{entry['start_label']}` {{uid: row.start_uid}}) "
+        f"MATCH (b:`{entry['end_label']}` {{uid: row.end_uid}}) "
+        f"MERGE (a)-[:`{entry['type']}`]->(b)"
+    )
+
+
+def load_csv_query(entry, rows_per_transaction=DEFAULT_ROWS_PER_TRANSACTION, method="transactions"):
+    """
+    Build the query that loads one manifest entry inside Neo4j.
+
+    Args:
+        entry (dict): Manifest entry from `write_import_tables`.
+        rows_per_transaction (int): Rows committed per inner transaction.
+        method (str): "transactions" for `CALL { } IN TRANSACTIONS`, "apoc" for `apoc.periodic.iterate`.
+
+    Returns:
+        tuple: (query, parameters)
+    """
+    if method not in LOAD_METHODS:
+        raise ValueError(f"Unknown load method '{method}'. Expected one of {LOAD_METHODS}.")
+
+    url = f"file:///{entry['file']}"
+    inner = _inner_statement(entry)
+    if method == "apoc":
+        query = """
+        CALL apoc.periodic.iterate(
+            'LOAD CSV WITH HEADERS FROM $url AS row RETURN row',
+            $inner,
+            {batchSize: $batch_size, parallel: false, params: {url: $url}}
+        )
+        """
+        return query, {"url": url, "inner": inner, "batch_size": int(rows_per_transaction)}
+
+    query = f"""
+    LOAD CSV WITH HEADERS FROM $url AS row
+    CALL {{
+        WITH row
+        {inner}
+    }} IN TRANSACTIONS OF {int(rows_per_transaction)} ROWS
+    """
+    return query, {"url": url}
+
+
+def load_tables_via_csv(driver, container, nodes, edges, database=None, compress=True,
+                        rows_per_transaction=DEFAULT_ROWS_PER_TRANSACTION, method="transactions",
+                        keep_files=False, on_file=None, skip_files=0):
+    """
+    Load node and edge tables into Neo4j through the container's import directory.
+
+    Args:
+        driver: Neo4j driver connected to the managed container.
+        container: Docker container running Neo4j.
+        nodes (pd.DataFrame): Node table from `utils.bulk_load`.
+        edges (pd.DataFrame): Edge table from `utils.bulk_load`.
+        database (str, optional): Target database. Defaults to the server default.
+        compress (bool): Gzip the CSV files.
+        rows_per_transaction (int): Rows committed per inner transaction.
+        method (str): "transactions" or "apoc".
+        keep_files (bool): Leave the CSV files in the import directory afterwards.
+        on_file (callable, optional): Called with each manifest entry once it has been loaded.
+        skip_files (int): Manifest entries already loaded by an earlier run; the
+            files are written in a fixed order, so a load can be resumed by count.
+
+    Returns:
+        dict: Rows committed, plus nodes/relationships created and properties set
+        (the last three stay 0 with the "apoc" method, which does not report them).
+    """
+    prefix = f"sdk_{uuid.uuid4().hex[:12]}"
+    import_dir = mounted_import_dir(container)
+    staging_dir = import_dir if import_dir is not None else DEFAULT_IMPORT_DIR / prefix
+
+    manifest = write_import_tables(nodes, edges, staging_dir, prefix, compress=compress)
+    stats = {"rows_committed": 0, "nodes_created": 0, "relationships_created": 0, "properties_set": 0}
+    try:
+        if import_dir is None:
+            stage_files(container, staging_dir, manifest)
+
+        # CALL { } IN TRANSACTIONS only runs in an auto-commit transaction, hence session.run
+        with driver.session(database=database) as session:
+            ensure_uid_constraints(session, nodes["label"].unique())
+            for entry in manifest[skip_files:]:
+                query, parameters = load_csv_query(entry, rows_per_transaction, method)
+                result = session.run(query, parameters)
+                if method == "apoc":
+                    # apoc.periodic.iterate writes in its own transactions and reports a summary row
+                    record = result.single()
+                    if record["failedOperations"]:
+                        raise RuntimeError(f"Loading {entry['file']} failed: {record['errorMessages']}")
+                    stats["rows_committed"] += record["committedOperations"]
+                else:
+                    counters = result.consume().counters
+                    stats["rows_committed"] += entry["rows"]
+                    stats["nodes_created"] += counters.nodes_created
+                    stats["relationships_created"] += counters.relationships_created
+                    stats["properties_set"] += counters.properties_set
+                if on_file:
+                    on_file(entry)
+    finally:
+        if not keep_files:
+            for entry in manifest:
+                (staging_dir / entry["file"]).unlink(missing_ok=True)
+            if import_dir is None:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                container.exec_run(
+                    ["sh", "-c", f"rm -f {CONTAINER_DEFAULT_IMPORT_DIR}/{prefix}_*"]
+                )
+
+    return stats
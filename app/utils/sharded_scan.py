@@ -0,0 +1,213 @@
+"""
+Sharded filesystem scans across a process pool.
+
+One ncdu process walks one tree serially, so large multi-volume surveys are
+split into shards: the top-level directories of every root are weighed by a
+quick bounded pre-pass, packed into shards of similar weight, and each shard
+is scanned by its own worker process. Shards can be kept to one mount each
+so workers on different volumes do not compete for the same disks.
+
+The per-shard exports are merged into one scan table. Roots and the files
+directly inside them are stat'ed by the coordinator, and every path is
+absolute, so `utils.bulk_load.build_scan_tables` derives the same parent links
+as for a single scan.
+"""
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import pandas as pd
+
+from utils.identity import normalize_path
+from utils.prune import PruneRules, walk_tree
+from utils.scanner import SCAN_COLUMNS, load_ncdu_export, run_ncdu
+
+DEFAULT_SHARDS = max(1, min(8, os.cpu_count() or 1))
+
+# Entries counted per top-level directory before the pre-pass stops looking
+DEFAULT_PREPASS_LIMIT = 20000
+
+
+def count_entries(path, limit=DEFAULT_PREPASS_LIMIT):
+    """
+    Count the entries below `path`, stopping at `limit`.
+
+    Used as a cheap weight for shard planning; the walk stays on one device
+    and does not follow symlinks, like ncdu's defaults.
+    """
+    try:
+        device = os.stat(path, follow_symlinks=False).st_dev
+    except OSError:
+        return 1
+    count = 0
+    stack = [path]
+    while stack and count < limit:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    count += 1
+                    try:
+                        if entry.is_dir(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_dev == device:
+                            stack.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return max(count, 1)
+
+
+def _stat_row(path, is_dir):
+    try:
+        stat = os.stat(path, follow_symlinks=False)
+        size, usage = stat.st_size, getattr(stat, "st_blocks", 0) * 512
+    except OSError:
+        size, usage = 0, 0
+    return {"Path": normalize_path(path), "Size (Bytes)": size, "Disk Usage (Bytes)": usage,
+            "Type": "Directory" if is_dir else "File"}
+
+
+def plan_shards(roots, shards=DEFAULT_SHARDS, pin_mounts=False, weight=count_entries, exclude=None, rules=None):
+    """
+    Split roots into shards of top-level directories with balanced weights.
+
+    Args:
+        roots (list): Directories to scan.
+        shards (int): Number of shards (per mount when `pin_mounts` is set).
+        pin_mounts (bool): Never put directories from different devices in one shard.
+        weight (callable): Weight of a directory; defaults to a bounded entry count.
+        exclude (list, optional): Top-level directories to leave out of the scan.
+        rules (PruneRules, optional): Pruning rules, applied to the top level here.
+
+    Returns:
+        tuple: (shards, rows) where shards is a list of
+        `{"paths": [...], "roots": [...], "weight": w, "device": d}` (`roots[i]`
+        is the scan root `paths[i]` came from) and rows is a DataFrame of
+        the roots and the files directly inside them, which no shard covers.
+    """
+    exclude = {os.path.abspath(path) for path in exclude or []}
+    rules = rules or PruneRules()
+    rows = []
+    items = []
+    for root in roots:
+        root = os.path.abspath(root)
+        rows.append(_stat_row(root, True))
+        if rules.max_depth == 0:
+            continue
+        root_device = os.stat(root).st_dev
+        with os.scandir(root) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if entry.path in exclude:
+                    continue
+                if is_dir:
+                    if rules.prunes_directory(entry.path, entry.name) or (
+                            rules.one_file_system and stat.st_dev != root_device):
+                        continue
+                    items.append({"path": entry.path, "root": root, "weight": weight(entry.path),
+                                  "device": stat.st_dev})
+                elif not rules.prunes_file(entry.name, stat.st_size):
+                    rows.append(_stat_row(entry.path, False))
+
+    groups = {}
+    for item in items:
+        groups.setdefault(item["device"] if pin_mounts else None, []).append(item)
+
+    planned = []
+    for device, group in groups.items():
+        bins = [{"paths": [], "roots": [], "weight": 0, "device": device}
+                for _ in range(max(1, min(shards, len(group))))]
+        # Longest-processing-time first: heaviest directory into the lightest shard
+        for item in sorted(group, key=lambda i: i["weight"], reverse=True):
+            lightest = min(bins, key=lambda b: b["weight"])
+            lightest["paths"].append(item["path"])
+            lightest["roots"].append(item["root"])
+            lightest["weight"] += item["weight"]
+        planned.extend(bins)
+
+    return planned, pd.DataFrame(rows, columns=SCAN_COLUMNS)
+
+
+def _scan_shard(paths, roots, export_dir, shard_index, extra_args, rules, cancel_event):
+    rules = PruneRules.from_dict(rules)
+    frames = []
+    for i, (path, root) in enumerate(zip(paths, roots)):
+        if rules:
+            # ncdu cannot apply the rules while it walks; the scandir walker can
+            frames.append(walk_tree(path, rules, cancel_event=cancel_event, rules_root=root))
+            continue
+        export_path = Path(export_dir) / f"shard_{shard_index}_{i}.json"
+        run_ncdu(path, export_path, extra_args=extra_args, cancel_event=cancel_event)
+        frames.append(load_ncdu_export(export_path))
+        export_path.unlink(missing_ok=True)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SCAN_COLUMNS)
+
+
+def sharded_scan(roots, export_dir, shards=DEFAULT_SHARDS, pin_mounts=False, extra_args=None,
+                 on_shard=None, on_plan=None, cancel_event=None, store_path=None, weights=None, exclude=None,
+                 rules=None):
+    """
+    Scan one or more roots as balanced shards in a process pool and merge the results.
+
+    Args:
+        roots (list): Directories to scan.
+        export_dir (Path): Scratch directory for the per-shard ncdu exports.
+        shards (int): Number of shards and worker processes (per mount when pinned).
+        pin_mounts (bool): Keep each shard, and so each worker, on one mount.
+        extra_args (list, optional): Additional ncdu arguments.
+        on_shard (callable, optional): Called with (shard, rows) as each shard finishes.
+        on_plan (callable, optional): Called with the list of planned shards before scanning.
+        cancel_event (threading.Event, optional): Stops the scan when set.
+        store_path (str, optional): Also write the merged scan to this Parquet file.
+        weights (dict, optional): Known directory weights (e.g. from `utils.tree_estimate`);
+            other directories are weighed by the bounded pre-pass.
+        exclude (list, optional): Top-level directories to leave out of the scan.
+        rules (PruneRules, optional): Pruning rules applied while walking.
+
+    Returns:
+        pd.DataFrame: Merged scan rows, parents before children.
+    """
+    weights = weights or {}
+    planned, rows = plan_shards(
+        roots, shards=shards, pin_mounts=pin_mounts, exclude=exclude, rules=rules,
+        weight=lambda path: weights.get(path) or count_entries(path)
+    )
+    planned = [shard for shard in planned if shard["paths"]]
+    if on_plan:
+        on_plan(planned)
+    Path(export_dir).mkdir(parents=True, exist_ok=True)
+
+    frames = [rows]
+    with multiprocessing.Manager() as manager:
+        # Worker processes cannot see a threading.Event, so they poll a managed one
+        worker_cancel = manager.Event()
+        with ProcessPoolExecutor(max_workers=max(1, len(planned))) as pool:
+            futures = {
+                pool.submit(_scan_shard, shard["paths"], shard["roots"], export_dir, i, extra_args,
+                            rules.to_dict() if rules else None, worker_cancel): shard
+                for i, shard in enumerate(planned)
+            }
+            pending = set(futures)
+            while pending:
+                # Short waits keep cancellation responsive while shards run
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    frame = future.result()
+                    frames.append(frame)
+                    if on_shard:
+                        on_shard(futures[future], len(frame))
+                if pending and cancel_event is not None and cancel_event.is_set():
+                    worker_cancel.set()
+                    for future in pending:
+                        future.cancel()
+                    raise InterruptedError("Sharded scan was cancelled.")
+
+    merged = pd.concat(frames, ignore_index=True).drop_duplicates("Path").reset_index(drop=True)
+    if store_path:
+        merged.to_parquet(store_path, index=False)
+    return merged
+
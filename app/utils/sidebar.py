@@ -8,7 +8,7 @@ from utils.database import (
     get_neo4j_status, get_neo4j_hostname,
     start_neo4j_container, stop_neo4j_container,
     fetch_databases, get_neo4j_session,
-    export_graph_to_file, import_graph_from_file
+    get_neo4j_container, import_graph_from_file
 )
 from utils.jupyter_server import ( 
     initialize_jupyter_session,
@@ -18,7 +18,18 @@ from utils.neodash_server import (
     initialize_neodash_session,
     start_neodash_container, stop_neodash_container
 )
-from utils.database import manage_queries, extract_schema
+from utils.database import manage_queries, extract_schema, get_neo4j_driver
+from utils.server_import import DEFAULT_ROWS_PER_TRANSACTION
+from utils.jobs import ACTIVE_STATES, RESUMABLE_STATES, get_job_manager
+from utils.memory import (DEFAULT_GLOBAL_BYTES, DEFAULT_SESSION_BYTES, SPILLABLE_KEYS,
+                          clean_spill_dir, enforce_budget, global_usage, restore_frames,
+                          session_usage, spill_frame)
+from utils.exports import EXPORT_FORMATS, clean_exports, write_export
+from utils.query_governor import (DEFAULT_MAX_ESTIMATED_ROWS, DEFAULT_MAX_ROWS, DEFAULT_TIMEOUT,
+                                  QueryGovernor, QueryLimits, QueryRejected)
+from utils.query_profile import format_plan, get_profiler, set_action_provider
+from neo4j.exceptions import Neo4jError
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 
 # Initialize Docker client
@@ -292,13 +303,16 @@ def neo4j_connector():
 
                         # Save button
                         if st.button("Save Graph", use_container_width=True, key="save_graph_button"):
-                            with st.spinner("Exporting graph..."):
-                                success, message = export_graph_to_file(st.session_state.session, save_path)
-                                if success:
-                                    st.success(message)
-                                    st.info(f"Graph saved to: {save_path}")
-                                else:
-                                    st.error(message)
+                            job = get_job_manager().submit(
+                                "export",
+                                {"file_path": save_path, "database": st.session_state.selected_db},
+                                title=f"Export {st.session_state.selected_db or 'graph'}",
+                                resources=job_resources()
+                            )
+                            st.session_state["graph_export_attached"] = job.id
+                            st.info(f"Exporting in the background to: {save_path}")
+
+                        jobs_panel(kinds=["export"], key="graph_export", limit=3)
 
                     with load_col:
                         st.subheader("Load Graph")
@@ -402,20 +416,16 @@ def schema_sample_widget():
             st.rerun()
 
     with st.sidebar.expander("🕷️ Schema Sampling", expanded=False):
-        uri = st.session_state['neo4j_uri']
-        user = st.session_state['neo4j_user']
-        password = st.session_state['neo4j_password']
-
         st.text("Summarize schema of recall query")
         sample_mag = st.number_input("Order (1E??)", min_value=1, value=3, step=1)
         sample_size = 10**sample_mag
         st.text(f"Randomly sampling {sample_size} nodes")
-        include_all = st.checkbox("Include All (No Limit)", value=False)
+        include_all = st.checkbox("Include All (No Limit)", value=False,
+                                  help="Rows are still capped by the 🚦 Query Governor.")
         st.session_state.cached_layout = st.radio("Schema Layout", ["Hierarchical", "Force-Directed"], index=1)
         st.session_state.cached_physics_enabled = st.checkbox("Elasticity", value=False)
 
         if st.button("Pull Schema"):
-            session = get_neo4j_session(uri, user, password, database=st.session_state.selected_db)
             limit_clause = "" if include_all else f"LIMIT {sample_size}"
             with_clause = recall_query.strip() if recall_query.strip() else ""
 #            query = f"""
@@ -433,14 +443,396 @@ def schema_sample_widget():
                 labels(m)[0] AS objectLabel
             {limit_clause}
             """
-            with st.spinner("Sampling schema..."):
-                results = session.run(query)
-                results_list = [record.data() for record in results]
+            handle = governed_query(query, "Schema Sampling", key="schema_sample")
+            if handle:
+                results_list = [record.data() for record in handle.records]
                 st.success(f"Sampled {len(results_list)} rows from the schema!")
                 triples, nodes = extract_schema(results_list)
                 st.session_state.cached_triples = triples
                 st.session_state.cached_labels = sorted(nodes)  # Ensure this is updated
 
+def bulk_write_options(key):
+    """
+    Let the user choose how prepared node/edge tables are written to Neo4j.
+
+    Args:
+        key (str): Prefix for the widget keys, unique per page section.
+
+    Returns:
+        dict or None: Keyword arguments for `utils.server_import.load_tables_via_csv`,
+        or None for batched Bolt writes.
+    """
+    write_mode = st.radio(
+        "Write mode:",
+        ["Bolt batches", "Server-side LOAD CSV"],
+        key=f"{key}_write_mode",
+        horizontal=True,
+        help="Server-side LOAD CSV writes CSV files into the managed container's import directory "
+             "and lets Neo4j batch the load. Use it for very large pushes."
+    )
+    if write_mode == "Bolt batches":
+        return None
+
+    compress = st.checkbox("Gzip CSV files", value=True, key=f"{key}_csv_compress")
+    rows_per_transaction = st.number_input(
+        "Rows per transaction",
+        min_value=100,
+        value=DEFAULT_ROWS_PER_TRANSACTION,
+        step=1000,
+        key=f"{key}_rows_per_transaction"
+    )
+    method = st.radio(
+        "Server batching:",
+        ["CALL { } IN TRANSACTIONS", "apoc.periodic.iterate"],
+        key=f"{key}_load_method",
+        horizontal=True
+    )
+    return {
+        "compress": compress,
+        "rows_per_transaction": int(rows_per_transaction),
+        "method": "apoc" if method.startswith("apoc") else "transactions",
+    }
+
+def job_resources():
+    """Return the live objects background jobs need from this session (driver and container)."""
+    return {
+        "driver": st.session_state.get("db_connection"),
+        "container": get_neo4j_container(),
+    }
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+def jobs_panel(kinds=None, key="jobs", limit=5):
+    """
+    List background jobs with progress, throughput and ETA, refreshed every two seconds.
+
+    Running jobs can be cancelled; failed, cancelled or interrupted jobs can be
+    resumed from their checkpoint. Attaching to a job stores its id under
+    `st.session_state[f"{key}_attached"]`, and the app reruns once when the
+    attached job finishes so the page can pick up its results.
+
+    Args:
+        kinds (list, optional): Only show jobs of these kinds.
+        key (str): Prefix for the widget and session state keys.
+        limit (int): Maximum number of jobs shown.
+
+    Returns:
+        Job or None: The attached job, if any.
+    """
+    manager = get_job_manager()
+    attached_key = f"{key}_attached"
+
+    @st.fragment(run_every=2)
+    def _panel():
+        jobs = manager.list_jobs(kinds=kinds, limit=limit)
+        if not jobs:
+            st.caption("No background jobs yet.")
+            return
+
+        for job in jobs:
+            attached = st.session_state.get(attached_key) == job.id
+            with st.container(border=True):
+                st.markdown(f"{'📌 ' if attached else ''}**{job.title}** · `{job.status}`")
+                if job.progress is not None:
+                    st.progress(job.progress, text=job.message or f"{job.done:,} / {job.total:,}")
+                elif job.message:
+                    st.caption(job.message)
+
+                details = [f"{job.done:,} done"] if job.done else []
+                if job.throughput:
+                    details.append(f"{job.throughput:,.0f}/s")
+                if job.eta is not None:
+                    details.append(f"ETA {_format_duration(job.eta)}")
+                if details:
+                    st.caption(" · ".join(details))
+                if job.error:
+                    st.error(job.error)
+
+                if job.status in ACTIVE_STATES:
+                    if st.button("Cancel", key=f"{key}_cancel_{job.id}"):
+                        if not manager.cancel(job.id):
+                            st.warning("This job belongs to another process and cannot be cancelled here.")
+                elif job.status in RESUMABLE_STATES:
+                    if st.button("Resume", key=f"{key}_resume_{job.id}"):
+                        try:
+                            manager.resume(job.id, resources=job_resources())
+                        except ValueError as e:
+                            st.error(str(e))
+
+                if not attached and st.button("Attach", key=f"{key}_attach_{job.id}"):
+                    st.session_state[attached_key] = job.id
+                    st.rerun()
+
+                # Let the page pick up the attached job's results as soon as it stops
+                if attached and job.status not in ACTIVE_STATES \
+                        and st.session_state.get(f"{key}_finished") != job.id:
+                    st.session_state[f"{key}_finished"] = job.id
+                    st.rerun()
+
+    _panel()
+    attached_id = st.session_state.get(attached_key)
+    return manager.get(attached_id) if attached_id else None
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "default"
+
+def _format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:,.0f} {unit}" if unit == "B" else f"{size:,.1f} {unit}"
+        size /= 1024
+
+def session_frames(*keys):
+    """
+    Bring back the session tables a page is about to read, if they were spilled to disk.
+
+    The keys stay in use (never spilled) until the end of this run.
+
+    Args:
+        *keys (str): Session state keys, e.g. "scanned_files".
+    """
+    restore_frames(st.session_state, keys)
+    in_use = set(st.session_state.get("memory_in_use") or ())
+    st.session_state["memory_in_use"] = in_use | set(keys)
+
+@st.cache_resource(ttl=3600)
+def _clean_spill_dir():
+    clean_spill_dir()
+    return True
+
+def memory_sidebar():
+    """
+    Enforce the memory budgets and show what this session holds.
+
+    Runs after the page: tables the page did not ask for through
+    `session_frames` are spilled to disk, least recently used first, while the
+    session or the server is over budget.
+    """
+    _clean_spill_dir()
+    in_use = st.session_state.get("memory_in_use") or ()
+    spilled, total = enforce_budget(st.session_state, _session_id(), protected=in_use)
+    server_total, sessions = global_usage()
+
+    with st.sidebar.expander("🧠 Session Memory", expanded=False):
+        st.progress(min(total / DEFAULT_SESSION_BYTES, 1.0),
+                    text=f"This session: {_format_bytes(total)} of {_format_bytes(DEFAULT_SESSION_BYTES)}")
+        st.caption(f"Server: {_format_bytes(server_total)} of {_format_bytes(DEFAULT_GLOBAL_BYTES)} "
+                   f"across {sessions} session{'s' if sessions != 1 else ''}")
+        if spilled:
+            st.info(f"Moved {', '.join(spilled)} to disk; pages reload them when needed.")
+
+        usage = session_usage(st.session_state)
+        usage = usage[usage["bytes"] >= 1 << 20].head(10)
+        if not usage.empty:
+            st.dataframe(
+                usage.assign(size=usage["bytes"].map(_format_bytes))[["key", "type", "size", "spilled"]],
+                hide_index=True,
+                use_container_width=True
+            )
+
+        if st.button("Spill Unused Tables", key="memory_spill", use_container_width=True):
+            for key in SPILLABLE_KEYS:
+                if key not in in_use:
+                    spill_frame(st.session_state, key, session_id=_session_id())
+            st.rerun()
+
+@st.cache_resource(ttl=3600)
+def _clean_exports():
+    clean_exports()
+    return True
+
+def _discard_export(ready_key):
+    ready = st.session_state.pop(ready_key, None)
+    if ready:
+        Path(ready[0]).unlink(missing_ok=True)
+
+def export_button(label, frames, file_name, key, formats=("CSV", "Parquet")):
+    """
+    Offer a table for download without building it on every rerun.
+
+    The export is only written when "Prepare" is clicked, straight to disk in
+    chunks (see `utils.exports`), and the finished file is then served.
+
+    Args:
+        label (str): What is exported, e.g. "Taxonomy".
+        frames (callable): Returns the DataFrame, or sheet name -> DataFrame for
+            XLSX; only called when the export is prepared.
+        file_name (str): Download name without the extension.
+        key (str): Prefix for the widget and session state keys.
+        formats (tuple): Formats offered, see `utils.exports.EXPORT_FORMATS`.
+    """
+    _clean_exports()
+    ready_key = f"{key}_export"
+    fmt = formats[0]
+    if len(formats) > 1:
+        fmt = st.selectbox(f"{label} file format:", list(formats), key=f"{key}_format")
+
+    if st.button(f"Prepare {label} ({fmt})", key=f"{key}_prepare", use_container_width=True):
+        _discard_export(ready_key)
+        extension, mime = EXPORT_FORMATS[fmt]
+        try:
+            with st.spinner(f"Writing {label.lower()}..."):
+                path = write_export(frames(), fmt, f"{file_name}.{extension}")
+            st.session_state[ready_key] = (str(path), mime)
+        except Exception as e:
+            st.error(f"Error exporting {label.lower()}: {e}")
+
+    ready = st.session_state.get(ready_key)
+    if ready and os.path.exists(ready[0]):
+        path, mime = ready
+        download_col, discard_col = st.columns([4, 1])
+        with download_col:
+            with open(path, "rb") as f:
+                st.download_button(
+                    f"Download {os.path.basename(path)} ({_format_bytes(os.path.getsize(path))})",
+                    data=f,
+                    file_name=os.path.basename(path),
+                    mime=mime,
+                    key=f"{key}_download",
+                    on_click="ignore",
+                    use_container_width=True
+                )
+        with discard_col:
+            st.button("Discard", key=f"{key}_discard", on_click=_discard_export, args=(ready_key,),
+                      use_container_width=True)
+
+def query_limits():
+    """Return the query governor limits chosen in the sidebar (defaults until it is opened)."""
+    return QueryLimits(
+        max_rows=st.session_state.get("governor_max_rows", DEFAULT_MAX_ROWS),
+        timeout=st.session_state.get("governor_timeout", DEFAULT_TIMEOUT),
+        max_estimated_rows=st.session_state.get("governor_max_estimated_rows", DEFAULT_MAX_ESTIMATED_ROWS),
+        block_cartesian=st.session_state.get("governor_block_cartesian", True),
+    )
+
+def query_governor():
+    """Return a `QueryGovernor` for the connected database with the sidebar limits."""
+    driver = get_neo4j_driver(
+        st.session_state["neo4j_uri"],
+        st.session_state["neo4j_user"],
+        st.session_state["neo4j_password"]
+    )
+    return QueryGovernor(driver, database=st.session_state.get("selected_db"), limits=query_limits())
+
+def query_poll(placeholder, action):
+    """Return a governor `poll` callback that shows a running query's progress in `placeholder`."""
+    def poll(handle):
+        # Writing to the page also lets a pending rerun interrupt the wait, which cancels the query
+        placeholder.caption(f"⏳ {action}: {handle.elapsed:.0f}s, {len(handle.records):,} rows so far")
+    return poll
+
+def governed_query(query, action, key, params=None):
+    """
+    Run ad-hoc Cypher through the query governor, with a Cancel button while it runs.
+
+    Plan warnings, rejections, timeouts and failures are shown on the page.
+    Clicking Cancel (or anything else that reruns the page) terminates the
+    query on the server.
+
+    Args:
+        query (str): Cypher query.
+        action (str): Page or action, shown while the query runs.
+        key (str): Prefix for the widget keys.
+        params (dict, optional): Query parameters.
+
+    Returns:
+        GovernedQuery or None: The completed query, or None if it did not complete.
+    """
+    governor = query_governor()
+    cancel_placeholder = st.empty()
+    status_placeholder = st.empty()
+    cancel_placeholder.button("Cancel query", key=f"{key}_cancel")
+    try:
+        handle = governor.run(query, params, action=action, poll=query_poll(status_placeholder, action))
+    except QueryRejected as e:
+        cancel_placeholder.empty()
+        st.error(f"Query not run: {e}")
+        return None
+    except Neo4jError as e:
+        cancel_placeholder.empty()
+        st.error(f"Query not run: {e.message or e}")
+        return None
+    cancel_placeholder.empty()
+    status_placeholder.empty()
+
+    for warning in handle.report["warnings"]:
+        st.caption(f"⚠️ {warning}")
+    if handle.status != "completed":
+        st.error(handle.error or f"Query {handle.status}.")
+        return None
+    if handle.truncated:
+        st.warning(f"Stopped at the {governor.limits.max_rows:,}-row cap; raise it under 🚦 Query Governor to see more.")
+    return handle
+
+def query_governor_sidebar():
+    """Let the user set the limits applied to recall queries, label pulls and chat-generated Cypher."""
+    with st.sidebar.expander("🚦 Query Governor", expanded=False):
+        st.caption("Ad-hoc queries are checked with EXPLAIN, capped and timed out before they reach the database.")
+        st.number_input("Max rows returned", min_value=0, value=DEFAULT_MAX_ROWS, step=1000,
+                        key="governor_max_rows", help="0 keeps each query's own LIMIT.")
+        st.number_input("Timeout (s)", min_value=0.0, value=DEFAULT_TIMEOUT, step=10.0,
+                        key="governor_timeout", help="The server aborts queries running longer. 0 disables it.")
+        st.number_input("Max estimated rows", min_value=0, value=DEFAULT_MAX_ESTIMATED_ROWS, step=1_000_000,
+                        key="governor_max_estimated_rows",
+                        help="Queries whose plan estimates more rows at any step are not run. 0 disables the check.")
+        st.checkbox("Block cartesian products", value=True, key="governor_block_cartesian")
+
+def _page_action():
+    # Job and query worker threads have no script context and no session state
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    return st.session_state.get("current_page")
+
+def track_page(page):
+    """Attribute the queries of this run (and its fragment reruns) to `page` in the query profile."""
+    st.session_state["current_page"] = page
+    set_action_provider(_page_action)
+
+def query_profile_sidebar():
+    """Rank the app's queries by total time, with sampled PROFILE plans and the slow-query log."""
+    profiler = get_profiler()
+    with st.sidebar.expander("⏱️ Query Profile", expanded=False):
+        profiler.slow_seconds = st.number_input(
+            "Slow query threshold (s)",
+            min_value=0.1,
+            value=float(profiler.slow_seconds),
+            step=0.5,
+            key="profile_slow_seconds",
+            help="Slower queries are logged, and some of their later runs are sent with PROFILE to sample db hits."
+        )
+        top = profiler.top(10)
+        if top.empty:
+            st.caption("No queries recorded yet.")
+        else:
+            st.dataframe(
+                top.assign(query=top["query"].str.slice(0, 80)).drop(columns=["plan", "errors"]),
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "total_seconds": st.column_config.NumberColumn("total (s)", format="%.2f"),
+                    "mean_seconds": st.column_config.NumberColumn("mean (s)", format="%.3f"),
+                    "max_seconds": st.column_config.NumberColumn("max (s)", format="%.2f"),
+                    "db_hits": st.column_config.NumberColumn("db hits", format="%d"),
+                }
+            )
+            profiled = top[top["plan"].notna()]
+            if not profiled.empty:
+                choice = st.selectbox(
+                    "Sampled PROFILE plan",
+                    list(profiled.index),
+                    format_func=lambda i: f"{profiled.at[i, 'action']}: {profiled.at[i, 'query'][:60]}",
+                    key="profile_plan"
+                )
+                st.code("\n".join(format_plan(profiled.at[choice, "plan"])), language=None)
+        st.caption(f"Slow queries are logged to `{profiler.log_path}`.")
+        if st.button("Reset Statistics", key="profile_reset"):
+            profiler.reset()
+            st.rerun()
+
 def settings_sidebar():
     """
     Provides a UI for changing Streamlit configuration settings, including theme colors.
@@ -0,0 +1,220 @@
+"""
+Content-addressed parse cache for the CSV, JSON and Excel files loaded on the Map page.
+
+Parsing a large table on every Streamlit rerun is what makes an attached file
+slow. `load_table` instead:
+
+1. hashes the content once: uploads by their bytes (memoized per upload),
+   files on disk through `utils.hashing.HashCache`, so an unchanged file is
+   only stat'ed
+2. parses CSV with pyarrow's multithreaded reader, with `pd.read_csv`'s null
+   and date handling (pandas for JSON and Excel)
+3. keeps the parsed table as Parquet under `DEFAULT_CACHE_DIR`, named by the
+   digest, evicting the least recently used tables past `DEFAULT_CACHE_BYTES`
+
+Reopening a file then costs a Parquet read. `list_excel_sheets` reads sheet
+names from the workbook metadata (`xl/workbook.xml`) instead of the sheets.
+"""
+import hashlib
+import io
+import os
+import re
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+from xml.etree import ElementTree
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from utils.hashing import DEFAULT_ALGORITHM, HashCache, hash_file
+
+DEFAULT_CACHE_DIR = Path.home() / ".science_data_kit" / "parse_cache"
+DEFAULT_CACHE_BYTES = 4 << 30
+TABLE_TYPES = ["CSV", "Excel", "JSON"]
+
+# Part of every cache file name; bumped when parsing changes so stale tables are not reused
+PARSE_VERSION = 2
+
+# Upload digests memoized by Streamlit's per-upload file id
+_UPLOAD_DIGESTS = OrderedDict()
+_MAX_UPLOAD_DIGESTS = 64
+
+_SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def content_digest(source):
+    """
+    Return the content digest of a path or an uploaded file.
+
+    Args:
+        source (str or file-like): Path on disk, or an uploaded file (Streamlit
+            `UploadedFile` or any object with `getvalue()`/`read()`).
+
+    Returns:
+        str: Hex digest.
+    """
+    if isinstance(source, (str, Path)):
+        try:
+            stat = os.stat(source)
+        except OSError as e:
+            raise ValueError(f"File '{source}' cannot be read: {e}")
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cache = HashCache()
+        try:
+            digest = cache.get_many([key], DEFAULT_ALGORITHM, partial=False).get(key)
+            if digest is None:
+                digest = hash_file(str(source), DEFAULT_ALGORITHM)
+                cache.put_many([(key, digest)], DEFAULT_ALGORITHM, partial=False)
+        finally:
+            cache.close()
+        return digest
+
+    file_id = getattr(source, "file_id", None)
+    if file_id is not None and file_id in _UPLOAD_DIGESTS:
+        _UPLOAD_DIGESTS.move_to_end(file_id)
+        return _UPLOAD_DIGESTS[file_id]
+    data = source.getvalue() if hasattr(source, "getvalue") else source.read()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    if file_id is not None:
+        _UPLOAD_DIGESTS[file_id] = digest
+        while len(_UPLOAD_DIGESTS) > _MAX_UPLOAD_DIGESTS:
+            _UPLOAD_DIGESTS.popitem(last=False)
+    return digest
+
+
+def _buffer(source):
+    """Return something the parsers can read: the path, or a fresh buffer over the upload."""
+    if isinstance(source, (str, Path)):
+        return str(source)
+    if hasattr(source, "getvalue"):
+        return io.BytesIO(source.getvalue())
+    source.seek(0)
+    return source
+
+
+def _read_csv(source):
+    """Read a CSV with pyarrow, with `pd.read_csv`'s semantics: empty and NA cells are NaN, dates stay text."""
+    read_options = pa_csv.ReadOptions(use_threads=True)
+    convert_options = pa_csv.ConvertOptions(strings_can_be_null=True, quoted_strings_can_be_null=True)
+    table = pa_csv.read_csv(_buffer(source), read_options=read_options, convert_options=convert_options)
+    if len(set(table.column_names)) < len(table.column_names):
+        # pyarrow keeps repeated header names; pandas numbers them (`a`, `a.1`), so leave those files to pandas
+        return pd.read_csv(_buffer(source))
+    temporal = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+    if temporal:
+        # pyarrow infers dates and timestamps, pandas does not; read those columns again as text
+        convert_options.column_types = {name: pa.string() for name in temporal}
+        table = pa_csv.read_csv(_buffer(source), read_options=read_options, convert_options=convert_options)
+    return table.to_pandas()
+
+
+def _parse(source, file_type, sheet_name):
+    if file_type == "CSV":
+        try:
+            return _read_csv(source)
+        except pa.ArrowInvalid:
+            # Ragged rows and the like: pandas' parser is more forgiving
+            return pd.read_csv(_buffer(source))
+    if file_type == "JSON":
+        return pd.read_json(_buffer(source))
+    if file_type == "Excel":
+        return pd.read_excel(_buffer(source), sheet_name=sheet_name or 0)
+    raise ValueError(f"Unknown file type '{file_type}'. Expected one of {TABLE_TYPES}.")
+
+
+def _cache_path(cache_dir, digest, file_type, sheet_name):
+    suffix = ""
+    if sheet_name is not None:
+        # Sheet names may hold any character; the readable part is for humans, the hash keeps them apart
+        readable = re.sub(r"[^0-9A-Za-z_.-]+", "_", str(sheet_name))[:40]
+        suffix = f"-{readable}-{hashlib.blake2b(str(sheet_name).encode(), digest_size=4).hexdigest()}"
+    return Path(cache_dir) / f"{digest}-{file_type.lower()}-v{PARSE_VERSION}{suffix}.parquet"
+
+
+def evict(cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+    """
+    Delete the least recently used cached tables until the cache fits `max_bytes`.
+
+    Returns:
+        int: Bytes freed.
+    """
+    entries = []
+    for path in Path(cache_dir).glob("*.parquet"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total - freed <= max_bytes:
+            break
+        try:
+            path.unlink()
+            freed += size
+        except OSError:
+            continue
+    return freed
+
+
+def load_table(source, file_type, sheet_name=None, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+    """
+    Load a CSV, JSON or Excel table through the parse cache.
+
+    Args:
+        source (str or file-like): Path on disk or uploaded file.
+        file_type (str): One of `TABLE_TYPES`.
+        sheet_name (str, optional): Excel sheet; the first sheet by default.
+        cache_dir (str or Path): Directory holding the cached Parquet tables.
+        max_bytes (int): Cache size kept after adding a table.
+
+    Returns:
+        tuple: (DataFrame, digest)
+    """
+    digest = content_digest(source)
+    cached = _cache_path(cache_dir, digest, file_type, sheet_name)
+    if cached.exists():
+        try:
+            frame = pd.read_parquet(cached)
+            # The modification time is the LRU clock
+            os.utime(cached)
+            return frame, digest
+        except (OSError, pa.ArrowException):
+            cached.unlink(missing_ok=True)
+
+    frame = _parse(source, file_type, sheet_name)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    partial = cached.with_suffix(".tmp")
+    try:
+        frame.to_parquet(partial, index=False)
+        partial.replace(cached)
+        evict(cache_dir, max_bytes)
+    except (pa.ArrowException, ValueError, TypeError, OSError):
+        # Columns Parquet cannot hold (mixed object types) are simply not cached
+        partial.unlink(missing_ok=True)
+    return frame, digest
+
+
+def list_excel_sheets(source):
+    """
+    List the sheets of a workbook without parsing them.
+
+    `.xlsx` sheet names come from `xl/workbook.xml` inside the archive; other
+    formats fall back to `pd.ExcelFile`.
+
+    Args:
+        source (str or file-like): Path on disk or uploaded file.
+
+    Returns:
+        list: Sheet names in workbook order.
+    """
+    try:
+        with zipfile.ZipFile(_buffer(source)) as workbook:
+            root = ElementTree.fromstring(workbook.read("xl/workbook.xml"))
+        return [sheet.get("name") for sheet in root.iter(f"{_SPREADSHEET_NS}sheet")]
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError):
+        with pd.ExcelFile(_buffer(source)) as workbook:
+            return workbook.sheet_names
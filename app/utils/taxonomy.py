@@ -0,0 +1,189 @@
+"""
+Memoized, incremental taxonomy tables.
+
+A taxonomy is `frame.groupby(keys).size().reset_index(name="Count")`: one row
+per combination of key values, with the number of entities holding it.
+`TaxonomyCache` answers the same question without regrouping the raw rows
+every time the keys change:
+
+- the same keys in the same order are a dictionary lookup
+- the same keys in another order re-sort the cached table
+- dropping keys (coarsening) sums the counts of a cached finer table
+- adding keys (refining) combines the cached group codes of a coarser grouping
+  with the codes of the new columns, one vectorized pass over the rows; each
+  column is factorized once
+
+Everything is keyed by a cheap fingerprint of the frame (identity, shape,
+columns and a hash of a few sampled rows), so loading, filtering or editing
+the entities starts a fresh cache.
+"""
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+COUNT_COLUMN = "Count"
+
+# Rows hashed into the frame fingerprint
+FINGERPRINT_ROWS = 64
+
+# Row-level groupings kept for refinement; each holds one int64 per row
+DEFAULT_MAX_GROUPINGS = 8
+
+
+def frame_fingerprint(frame, rows=FINGERPRINT_ROWS):
+    """
+    Return a cheap fingerprint of a frame's identity and content.
+
+    Args:
+        frame (pd.DataFrame): Table to fingerprint.
+        rows (int): Evenly spaced rows hashed into the fingerprint.
+
+    Returns:
+        tuple: Hashable fingerprint.
+    """
+    sample = np.unique(np.linspace(0, len(frame) - 1, num=min(rows, len(frame)), dtype=np.int64))
+    try:
+        digest = int(pd.util.hash_pandas_object(frame.iloc[sample], index=True).sum())
+    except TypeError:
+        # Unhashable cells (lists, dicts): identity and shape only
+        digest = None
+    return id(frame), frame.shape, tuple(map(str, frame.columns)), digest
+
+
+def group_taxonomy(frame, keys):
+    """The plain computation: group the rows by `keys` and count them."""
+    return frame.groupby(list(keys)).size().reset_index(name=COUNT_COLUMN)
+
+
+def _compact(codes):
+    """Renumber group codes 0..n-1 in order of first appearance, keeping -1 for rows without a group."""
+    valid = codes >= 0
+    compact = np.full(len(codes), -1, dtype=np.int64)
+    compact[valid], uniques = pd.factorize(codes[valid])
+    return compact, len(uniques)
+
+
+class TaxonomyCache:
+    """
+    Taxonomy tables of one frame, derived incrementally as the keys change.
+
+    Args:
+        max_groupings (int): Row-level groupings kept for refinement.
+    """
+
+    def __init__(self, max_groupings=DEFAULT_MAX_GROUPINGS):
+        self.max_groupings = max_groupings
+        self._frame = None
+        self._fingerprint = None
+        self._columns = {}
+        self._groupings = OrderedDict()
+        self._tables = OrderedDict()
+
+    def _reset(self, frame, fingerprint):
+        self._frame = weakref.ref(frame)
+        self._fingerprint = fingerprint
+        self._columns.clear()
+        self._groupings.clear()
+        self._tables.clear()
+
+    def _column(self, frame, key):
+        """Return (codes, has_nulls) for one key column, factorized once."""
+        if key not in self._columns:
+            codes, _ = pd.factorize(frame[key])
+            codes = codes.astype(np.int64, copy=False)
+            self._columns[key] = (codes, bool((codes < 0).any()))
+        return self._columns[key]
+
+    def _grouping(self, frame, keys):
+        """Return (row codes, groups) for `keys`, refining the largest cached grouping over a subset of them."""
+        keys = tuple(keys)
+        if keys in self._groupings:
+            self._groupings.move_to_end(keys)
+            return self._groupings[keys]
+
+        # A grouping is a partition of the rows, so any cached subset of the keys can be refined, whatever its order
+        base = ()
+        for cached in self._groupings:
+            if len(cached) > len(base) and set(cached) <= set(keys):
+                base = cached
+        if base:
+            codes, groups = self._groupings[base]
+        else:
+            codes, groups = np.zeros(len(frame), dtype=np.int64), 1
+
+        for key in [key for key in keys if key not in base]:
+            column, _ = self._column(frame, key)
+            cardinality = int(column.max()) + 1 if len(column) else 0
+            combined = np.where((codes < 0) | (column < 0), -1, codes * cardinality + column)
+            codes, groups = _compact(combined)
+
+        self._groupings[keys] = (codes, groups)
+        while len(self._groupings) > self.max_groupings:
+            self._groupings.popitem(last=False)
+        return codes, groups
+
+    def _from_rows(self, frame, keys):
+        if not len(frame):
+            return group_taxonomy(frame, keys)
+        codes, groups = self._grouping(frame, keys)
+        valid = codes >= 0
+        # Codes are numbered by first appearance, so a group's first row is where the running maximum grows
+        running = np.maximum.accumulate(np.where(valid, codes, -1))
+        first = np.flatnonzero(valid & (codes > np.concatenate(([-1], running[:-1]))))
+        table = frame[list(keys)].iloc[first].reset_index(drop=True)
+        table[COUNT_COLUMN] = np.bincount(codes[valid], minlength=groups).astype(np.int64)
+        return table.sort_values(list(keys), ignore_index=True)
+
+    def _from_tables(self, frame, keys):
+        """Derive the table from a cached one over the same or more keys, or return None."""
+        wanted = set(keys)
+        for cached_keys, table in reversed(self._tables.items()):
+            if not wanted <= set(cached_keys):
+                continue
+            dropped = [key for key in cached_keys if key not in wanted]
+            if not dropped:
+                # Same keys, another order
+                return table[list(keys) + [COUNT_COLUMN]].sort_values(list(keys), ignore_index=True)
+            # Rows with a null in a dropped key were left out of the finer table but count here
+            if any(self._column(frame, key)[1] for key in dropped):
+                continue
+            return table.groupby(list(keys))[COUNT_COLUMN].sum().reset_index()
+        return None
+
+    def taxonomy(self, frame, keys):
+        """
+        Return `frame.groupby(keys).size().reset_index(name="Count")`, reusing earlier results.
+
+        Args:
+            frame (pd.DataFrame): Entities.
+            keys (list): Taxonomy levels, outermost first.
+
+        Returns:
+            pd.DataFrame: One row per key combination with its `Count`, sorted by the keys.
+        """
+        keys = tuple(keys)
+        fingerprint = frame_fingerprint(frame)
+        if self._frame is None or self._frame() is not frame or fingerprint != self._fingerprint:
+            self._reset(frame, fingerprint)
+        if keys in self._tables:
+            self._tables.move_to_end(keys)
+            return self._tables[keys]
+
+        if any(isinstance(frame[key].dtype, pd.CategoricalDtype) for key in keys):
+            # groupby also lists unobserved categories; leave those to pandas
+            table = group_taxonomy(frame, keys)
+        else:
+            table = self._from_tables(frame, keys)
+            if table is None:
+                try:
+                    table = self._from_rows(frame, keys)
+                except TypeError:
+                    # Keys mixing types that do not sort together
+                    table = group_taxonomy(frame, keys)
+
+        self._tables[keys] = table
+        while len(self._tables) > 4 * self.max_groupings:
+            self._tables.popitem(last=False)
+        return table
@@ -0,0 +1,82 @@
+"""
+Prefix and substring search over one column of a large table.
+
+`TextIndex` backs typeahead pickers: instead of handing every row to a
+widget, the page asks for the few rows whose value matches what was typed.
+The column's distinct values are lowercased and sorted once, so a prefix
+lookup is two binary searches; substring lookups scan the distinct values
+with one Arrow kernel. Matches come back prefix hits first, then the rest,
+capped at `limit` rows.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+DEFAULT_LIMIT = 50
+
+
+class TextIndex:
+    """
+    Search index over the values of one column.
+
+    Args:
+        values (pd.Series): Column to index; its index labels are what searches return.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        # Nulls stay null through astype(str) on newer pandas and would break the sort; they match nothing
+        text = values.astype(str).fillna("").str.lower().to_numpy(dtype=object)
+        # Distinct values sorted once; rows grouped by the distinct value they hold
+        self._keys, codes = np.unique(text, return_inverse=True)
+        self._order = np.argsort(codes, kind="stable")
+        self._starts = np.searchsorted(codes[self._order], np.arange(len(self._keys) + 1))
+        self._arrow_keys = pa.array(self._keys, type=pa.string())
+        self._labels = values.index.to_numpy()
+
+    def __len__(self):
+        return len(self.values)
+
+    def _rows(self, key_ids, limit):
+        rows = []
+        for key_id in key_ids:
+            start, end = self._starts[key_id], self._starts[key_id + 1]
+            rows.extend(self._order[start:min(end, start + limit - len(rows))])
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """
+        Find rows whose value starts with or contains `query` (case-insensitive).
+
+        Args:
+            query (str): Typed text; empty returns the first rows.
+            limit (int): Most rows returned.
+
+        Returns:
+            tuple: (index labels of the matching rows, total number of matching distinct values)
+        """
+        query = (query or "").strip().lower()
+        if not query:
+            return self._labels[:limit].tolist(), len(self._keys)
+
+        low, high = np.searchsorted(self._keys, [query, query + "\uffff"])
+        prefix_ids = np.arange(low, high)
+        contains = pc.match_substring(self._arrow_keys, query).to_numpy(zero_copy_only=False)
+        contains[low:high] = False
+        other_ids = np.flatnonzero(contains)
+        rows = self._rows(np.concatenate([prefix_ids, other_ids]), limit)
+        return self._labels[rows].tolist(), len(prefix_ids) + len(other_ids)
+
+    def value(self, label):
+        """Return the original value of a row by index label."""
+        return self.values.at[label]
+
+
+def build_index(frame, column):
+    """Index `frame[column]`; a positional index is used when the column is missing."""
+    if column is None or column not in frame.columns:
+        return TextIndex(pd.Series(frame.index.astype(str), index=frame.index))
+    return TextIndex(frame[column])
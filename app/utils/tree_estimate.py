@@ -0,0 +1,158 @@
+"""
+Quick estimates of a directory tree's size from random descents.
+
+Knuth's estimator walks one random path from the root to a leaf. At every
+directory it multiplies a weight by the number of subdirectories it could
+have chosen, and adds weight x (what it sees in that directory) to its
+totals; the expected value of those totals is the true total for the whole
+tree. Averaging many such probes gives estimates of file counts, bytes and
+the extension mix, with confidence intervals from the spread of the probes,
+after listing only a tiny fraction of the tree.
+
+Listings are cached between probes, so the directories near the root that
+every probe passes through are only read once.
+"""
+import math
+import os
+import random
+import time
+from collections import Counter
+from pathlib import PurePath
+
+import pandas as pd
+
+DEFAULT_TIME_BUDGET = 5.0
+DEFAULT_MAX_PROBES = 2000
+Z_95 = 1.96
+
+
+def _listing(path, cache):
+    if path in cache:
+        return cache[path]
+    files, size, extensions, subdirs = 0, 0, Counter(), []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    else:
+                        files += 1
+                        size += entry.stat(follow_symlinks=False).st_size
+                        extensions[PurePath(entry.name).suffix.lower() or "(none)"] += 1
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    cache[path] = (files, size, extensions, subdirs)
+    return cache[path]
+
+
+def knuth_probe(root, rng, cache, max_depth=None):
+    """
+    Walk one random path below `root` and return its Knuth estimate.
+
+    Returns:
+        dict: Estimated `files`, `bytes`, `directories` and `extensions` for the
+        whole tree, plus `child` (the top-level directory the probe went into)
+        and `below` (the part of the estimate that came from below that child).
+    """
+    weight = 1
+    estimate = {"files": 0., "bytes": 0., "directories": 1., "extensions": Counter(), "child": None}
+    path, depth = root, 0
+    below = {"files": 0., "bytes": 0.}
+    while True:
+        files, size, extensions, subdirs = _listing(path, cache)
+        estimate["files"] += weight * files
+        estimate["bytes"] += weight * size
+        for extension, count in extensions.items():
+            estimate["extensions"][extension] += weight * count
+        if depth > 0:
+            below["files"] += weight * files
+            below["bytes"] += weight * size
+        if not subdirs or (max_depth is not None and depth >= max_depth):
+            break
+        weight *= len(subdirs)
+        estimate["directories"] += weight
+        path = rng.choice(subdirs)
+        if depth == 0:
+            estimate["child"] = path
+        depth += 1
+    estimate["below"] = below
+    return estimate
+
+
+def _interval(values):
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        return mean, None, None
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+    half_width = Z_95 * std / math.sqrt(n)
+    return mean, max(mean - half_width, 0.), mean + half_width
+
+
+def estimate_tree(root, time_budget=DEFAULT_TIME_BUDGET, max_probes=DEFAULT_MAX_PROBES, seed=None, max_depth=None):
+    """
+    Estimate the size of the tree under `root` within a time budget.
+
+    Args:
+        root (str): Directory to estimate.
+        time_budget (float): Seconds to spend probing.
+        max_probes (int): Stop after this many probes even if time remains.
+        seed (int, optional): Random seed, for repeatable estimates.
+        max_depth (int, optional): Do not descend deeper than this.
+
+    Returns:
+        dict: `files`, `bytes` and `directories` as (estimate, low, high) 95%
+        intervals; `extensions` (DataFrame of estimated counts and shares);
+        `subtrees` (DataFrame of top-level directories with estimated files,
+        bytes and share of the files); `probes`; `directories_listed`; `seconds`.
+    """
+    rng = random.Random(seed)
+    cache = {}
+    probes = []
+    start = time.perf_counter()
+    while len(probes) < max_probes and (not probes or time.perf_counter() - start < time_budget):
+        probes.append(knuth_probe(root, rng, cache, max_depth=max_depth))
+
+    extension_totals = Counter()
+    for probe in probes:
+        extension_totals.update(probe["extensions"])
+    extensions = pd.DataFrame(
+        [(ext, count / len(probes)) for ext, count in extension_totals.most_common()],
+        columns=["Extension", "Estimated Files"]
+    )
+    total_ext = extensions["Estimated Files"].sum()
+    extensions["Share"] = extensions["Estimated Files"] / total_ext if total_ext else 0.
+
+    # A probe's contribution below its chosen child, averaged over all probes
+    # (zero when another child was chosen), is unbiased for that child's subtree
+    top_files, top_size, _, children = _listing(root, cache)
+    subtree_rows = []
+    for child in children:
+        chosen = [p["below"] for p in probes if p["child"] == child]
+        est_files = sum(b["files"] for b in chosen) / len(probes)
+        est_bytes = sum(b["bytes"] for b in chosen) / len(probes)
+        subtree_rows.append((child, est_files, est_bytes))
+    subtrees = pd.DataFrame(subtree_rows, columns=["Path", "Estimated Files", "Estimated Bytes"])
+    total_files = subtrees["Estimated Files"].sum() + top_files
+    subtrees["Share"] = subtrees["Estimated Files"] / total_files if total_files else 0.
+    subtrees = subtrees.sort_values("Estimated Files", ascending=False).reset_index(drop=True)
+
+    return {
+        "files": _interval([p["files"] for p in probes]),
+        "bytes": _interval([p["bytes"] for p in probes]),
+        "directories": _interval([p["directories"] for p in probes]),
+        "extensions": extensions,
+        "subtrees": subtrees,
+        "probes": len(probes),
+        "directories_listed": len(cache),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def suggest_shards(estimated_files, files_per_shard=250000, max_shards=None):
+    """Suggest a shard count for a full scan of about `estimated_files` files."""
+    max_shards = max_shards or max(1, min(8, os.cpu_count() or 1))
+    return int(min(max(1, math.ceil(estimated_files / files_per_shard)), max_shards))
@@ -0,0 +1,447 @@
+"""
+Watch mode: keep the Folder/File nodes of surveyed roots in sync with the filesystem.
+
+`Watcher` subscribes to filesystem events (inotify on Linux, through
+`watchdog`), coalesces bursts into debounced batches and applies each batch
+with the batched writes of `utils.bulk_load`:
+
+- creates MERGE the new Folder/File nodes and their `IS_IN` links (a created
+  or moved-in directory is walked, since no events arrive for its contents)
+- deletes remove the node and everything `IS_IN` it, whichever of the
+  Folder/File/Dataset/Archive labels a scan gave the path
+- moves are a delete of the old path and a create of the new one
+
+inotify needs one watch per directory. When the kernel's limit
+(`fs.inotify.max_user_watches`) would be exceeded, or `watchdog` is not
+installed, the watcher falls back to `IncrementalScanner`, which rescans
+periodically but only lists directories whose mtime changed.
+"""
+import errno
+import os
+import queue
+import time
+
+import pandas as pd
+
+from utils.bulk_load import DEFAULT_BATCH_SIZE, build_scan_tables, push_edges, push_nodes, write_rows
+from utils.identity import normalize_path, path_uid, scan_namespace
+from utils.prune import PruneRules, walk_tree
+from utils.scanner import SCAN_COLUMNS
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    FileSystemEventHandler = object
+    WATCHDOG_AVAILABLE = False
+
+DEFAULT_DEBOUNCE = 2.0
+DEFAULT_RESCAN_INTERVAL = 300.0
+
+# Longest a batch waits while events keep arriving, in multiples of the debounce
+_MAX_DELAY_FACTOR = 10
+
+
+def inotify_watch_limit():
+    """Return the per-user inotify watch limit, or None where it cannot be read."""
+    try:
+        with open("/proc/sys/fs/inotify/max_user_watches") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class ChangeSet:
+    """Coalesced creates and deletes, keyed by path (the last event for a path wins)."""
+
+    def __init__(self):
+        self.created = {}
+        self.deleted = {}
+
+    def __len__(self):
+        return len(self.created) + len(self.deleted)
+
+    def create(self, path, is_dir):
+        self.deleted.pop(path, None)
+        self.created[path] = is_dir
+
+    def delete(self, path, is_dir):
+        # The path may have existed before the batch, so the delete is kept even
+        # after a create; deleting a node that was never written is a no-op
+        self.created.pop(path, None)
+        self.deleted[path] = is_dir
+
+    def move(self, source, destination, is_dir):
+        self.delete(source, is_dir)
+        self.create(destination, is_dir)
+
+
+def _stat_row(path, is_dir):
+    stat = os.stat(path, follow_symlinks=False)
+    return (path, stat.st_size, getattr(stat, "st_blocks", 0) * 512, "Directory" if is_dir else "File")
+
+
+def change_rows(changes, rules=None, rules_root=None):
+    """
+    Turn created paths into scan rows, walking created directories.
+
+    Created files go through the same `rules.prunes_file` check as a walk.
+
+    Returns:
+        pd.DataFrame: Scan rows (`utils.scanner.SCAN_COLUMNS`) of everything that now exists.
+    """
+    frames, rows = [], []
+    for path, is_dir in changes.created.items():
+        try:
+            if is_dir:
+                frames.append(walk_tree(path, rules, rules_root=rules_root))
+                continue
+            row = _stat_row(path, False)
+        except OSError:
+            # Already gone again; a later delete event (or rescan) covers it
+            continue
+        relative = os.path.relpath(path, rules_root) if rules_root else os.path.basename(path)
+        if rules and rules.prunes_file(relative.replace(os.sep, "/"), row[1]):
+            continue
+        rows.append(row)
+    frames.append(pd.DataFrame(rows, columns=SCAN_COLUMNS))
+    return pd.concat(frames, ignore_index=True).drop_duplicates("Path")
+
+
+def apply_changes(session, changes, namespace, include_files=True, rules=None, rules_root=None,
+                  folder_label="Folder", file_label="File", relationship_type="IS_IN",
+                  dataset_label="Dataset", archive_label="Archive", batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Apply a batch of changes to the graph.
+
+    Args:
+        session: Neo4j session.
+        changes (ChangeSet): Coalesced creates and deletes.
+        namespace (str): Namespace the root was surveyed under.
+        include_files (bool): Whether File nodes are kept in sync as well as Folders.
+        rules (PruneRules, optional): Pruning rules for walking created directories.
+        rules_root (str, optional): Directory the rules are relative to.
+        dataset_label (str): Label of directories a scan collapsed into datasets
+            (`utils.datasets`); deleted with their directory.
+        archive_label (str): Label of archives a scan listed (`utils.archives`);
+            deleted with their file, members included.
+
+    Returns:
+        dict: Numbers of `created` and `deleted` paths written.
+    """
+    deleted_dirs = [path_uid(namespace, normalize_path(p)) for p, is_dir in changes.deleted.items() if is_dir]
+    deleted_files = [path_uid(namespace, normalize_path(p)) for p, is_dir in changes.deleted.items() if not is_dir]
+    # A path is deleted under every label a scan may have given it; one query per label keeps the uid lookups indexed
+    deletes = [(label, deleted_dirs) for label in (folder_label, dataset_label)]
+    deletes.append((archive_label, deleted_files))
+    if include_files:
+        deletes.append((file_label, deleted_files))
+    for label, uids in deletes:
+        if not uids:
+            continue
+        write_rows(session, f"""
+        UNWIND $rows AS row
+        MATCH (n:`{label}` {{uid: row.uid}})
+        OPTIONAL MATCH (child)-[:`{relationship_type}`*]->(n)
+        DETACH DELETE child, n
+        """, pd.DataFrame({"uid": uids}), batch_size)
+
+    created = change_rows(changes, rules, rules_root)
+    nodes, edges = build_scan_tables(created, namespace, include_files=include_files, folder_label=folder_label,
+                                     file_label=file_label, relationship_type=relationship_type)
+    push_nodes(session, nodes, batch_size)
+    push_edges(session, edges, batch_size)
+    return {"created": len(created), "deleted": len(deleted_dirs) + len(deleted_files)}
+
+
+class IncrementalScanner:
+    """
+    Periodic rescans that only list directories whose mtime changed.
+
+    Adding, removing or renaming an entry updates its directory's mtime, so
+    an unchanged directory's listing is reused and costs one `stat`.
+    """
+
+    def __init__(self, root, rules=None):
+        self.root = normalize_path(os.path.abspath(root))
+        self.rules = rules or PruneRules()
+        self.snapshot = {}
+        self._device = None
+
+    def _relative(self, path):
+        relative = os.path.relpath(path, self.root).replace(os.sep, "/")
+        return "" if relative == "." else relative
+
+    def _list(self, path):
+        entries = {}
+        relative = self._relative(path)
+        try:
+            with os.scandir(path) as iterator:
+                for entry in iterator:
+                    entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if is_dir and self.rules.prunes_directory(entry.path, entry_relative):
+                        continue
+                    if self.rules.patterns and self.rules.patterns.ignored(entry_relative, is_dir):
+                        continue
+                    # The rest of the checks `walk_tree` makes, so both record the same entries
+                    if self.rules.one_file_system or (self.rules.min_size and not is_dir):
+                        try:
+                            stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if is_dir and self.rules.one_file_system and stat.st_dev != self._device:
+                            continue
+                        if not is_dir and self.rules.prunes_file(entry_relative, stat.st_size):
+                            continue
+                    entries[entry.name] = is_dir
+        except OSError:
+            pass
+        return entries
+
+    def rescan(self):
+        """
+        Rescan the tree and return what changed since the last call.
+
+        The first call records a baseline and reports no changes.
+
+        Returns:
+            ChangeSet: Created and deleted paths.
+        """
+        changes = ChangeSet()
+        seen = set()
+        try:
+            self._device = os.stat(self.root).st_dev
+        except OSError:
+            # The root is gone; the walk below lists nothing
+            self._device = None
+        stack = [(self.root, 0)]
+        while stack:
+            path, depth = stack.pop()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(path)
+            cached = self.snapshot.get(path)
+            if cached is not None and cached[0] == mtime:
+                entries = cached[1]
+            else:
+                entries = self._list(path)
+                if cached is not None:
+                    for name, is_dir in cached[1].items():
+                        if entries.get(name) != is_dir:
+                            changes.delete(os.path.join(path, name), is_dir)
+                    for name, is_dir in entries.items():
+                        if cached[1].get(name) != is_dir:
+                            changes.create(os.path.join(path, name), is_dir)
+                self.snapshot[path] = (mtime, entries)
+            if self.rules.max_depth is not None and depth + 1 >= self.rules.max_depth:
+                continue
+            stack.extend((os.path.join(path, name), depth + 1) for name, is_dir in entries.items() if is_dir)
+
+        for path in list(self.snapshot):
+            if path not in seen:
+                del self.snapshot[path]
+        return changes
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def on_created(self, event):
+        self.events.put(("create", event.src_path, None, event.is_directory))
+
+    def on_deleted(self, event):
+        self.events.put(("delete", event.src_path, None, event.is_directory))
+
+    def on_moved(self, event):
+        self.events.put(("move", event.src_path, event.dest_path, event.is_directory))
+
+
+class Watcher:
+    """Keep the graph in sync with one or more surveyed roots; see the module docstring."""
+
+    def __init__(self, driver, roots, namespace=None, database=None, include_files=True, rules=None,
+                 debounce=DEFAULT_DEBOUNCE, rescan_interval=DEFAULT_RESCAN_INTERVAL, expected_directories=None,
+                 on_batch=None, log=None):
+        """
+        Args:
+            driver: Neo4j driver.
+            roots (list): Surveyed directories to watch.
+            namespace (str, optional): Namespace the roots were surveyed under.
+            database (str, optional): Target database.
+            include_files (bool): Keep File nodes in sync as well as Folders.
+            rules (PruneRules, optional): Pruning rules; pruned paths are ignored.
+            debounce (float): Seconds without events before a batch is applied.
+            rescan_interval (float): Seconds between rescans in the polling fallback.
+            expected_directories (int, optional): Directories under the roots (e.g.
+                from the last scan); more than the inotify limit means polling.
+            on_batch (callable, optional): Called with (mode, stats) after each batch.
+            log (callable, optional): Called with status messages.
+        """
+        self.driver = driver
+        self.roots = [normalize_path(os.path.abspath(root)) for root in roots]
+        self.namespace = scan_namespace(namespace)
+        self.database = database
+        self.include_files = include_files
+        self.rules = rules or PruneRules()
+        self.debounce = debounce
+        self.rescan_interval = rescan_interval
+        self.expected_directories = expected_directories
+        self.on_batch = on_batch
+        self.log = log or (lambda message: None)
+        self.mode = None
+
+    def _root_of(self, path):
+        return max((root for root in self.roots if path == root or path.startswith(root + "/")), key=len,
+                   default=None)
+
+    def _ignored(self, path, is_dir):
+        root = self._root_of(path)
+        if root is None:
+            return True
+        relative = os.path.relpath(path, root).replace(os.sep, "/")
+        if relative == ".":
+            return False
+        # The same checks `walk_tree` makes on the way down: depth, then every directory
+        # from the root to the path, then the file itself. A path that is already gone
+        # only gets the checks that need no `stat`.
+        parts = relative.split("/")
+        if self.rules.max_depth is not None and len(parts) > self.rules.max_depth:
+            return True
+        directories = parts if is_dir else parts[:-1]
+        root_device = None
+        if self.rules.one_file_system:
+            try:
+                root_device = os.stat(root).st_dev
+            except OSError:
+                pass
+        for index in range(1, len(directories) + 1):
+            directory = os.path.join(root, *directories[:index])
+            if self.rules.prunes_directory(directory, "/".join(directories[:index])):
+                return True
+            if root_device is not None:
+                try:
+                    if os.stat(directory, follow_symlinks=False).st_dev != root_device:
+                        return True
+                except OSError:
+                    pass
+        if is_dir:
+            return False
+        try:
+            size = os.stat(path, follow_symlinks=False).st_size
+        except OSError:
+            return bool(self.rules.patterns) and self.rules.patterns.ignored(relative, False)
+        return self.rules.prunes_file(relative, size)
+
+    def _apply(self, changes):
+        # One batch per root, so created directories are walked with that root's rules
+        by_root = {}
+        for path, is_dir in changes.deleted.items():
+            by_root.setdefault(self._root_of(path), ChangeSet()).delete(path, is_dir)
+        for path, is_dir in changes.created.items():
+            by_root.setdefault(self._root_of(path), ChangeSet()).create(path, is_dir)
+        by_root.pop(None, None)
+        totals = {"created": 0, "deleted": 0}
+        with self.driver.session(database=self.database) as session:
+            for root, root_changes in by_root.items():
+                stats = apply_changes(session, root_changes, self.namespace, include_files=self.include_files,
+                                      rules=self.rules, rules_root=root)
+                totals = {key: totals[key] + stats[key] for key in totals}
+        if self.on_batch:
+            self.on_batch(self.mode, totals)
+        return totals
+
+    def _start_observer(self, events):
+        limit = inotify_watch_limit()
+        if not WATCHDOG_AVAILABLE:
+            self.log("watchdog is not installed; polling for changes instead.")
+            return None
+        if limit is not None and self.expected_directories and self.expected_directories > limit:
+            self.log(f"{self.expected_directories} directories exceed the inotify limit of {limit}; "
+                     "polling for changes instead.")
+            return None
+        observer = Observer()
+        handler = _EventHandler(events)
+        try:
+            for root in self.roots:
+                observer.schedule(handler, root, recursive=True)
+            observer.start()
+        except OSError as e:
+            if e.errno in (errno.ENOSPC, errno.EMFILE):
+                self.log(f"Out of inotify watches ({e}); polling for changes instead.")
+                observer.stop()
+                return None
+            raise
+        return observer
+
+    def run(self, stop_event):
+        """
+        Watch until `stop_event` is set, applying debounced batches as they settle.
+
+        Falls back to incremental rescans when events are unavailable or the
+        observer dies (e.g. it ran out of watches for new directories).
+        """
+        events = queue.Queue()
+        observer = self._start_observer(events)
+        if observer is not None:
+            self.mode = "events"
+            self.log(f"Watching {len(self.roots)} root(s) for filesystem events.")
+            try:
+                self._run_events(observer, events, stop_event)
+            finally:
+                observer.stop()
+                observer.join(timeout=5)
+        if not stop_event.is_set():
+            self.mode = "polling"
+            self.log(f"Rescanning {len(self.roots)} root(s) every {self.rescan_interval:g}s.")
+            self._run_polling(stop_event)
+
+    def _run_events(self, observer, events, stop_event):
+        changes = ChangeSet()
+        first = last = None
+        while not stop_event.is_set():
+            try:
+                kind, path, destination, is_dir = events.get(timeout=min(self.debounce, 0.5))
+                path = normalize_path(path)
+                if kind == "move" and not self._ignored(normalize_path(destination), is_dir):
+                    changes.move(path, normalize_path(destination), is_dir)
+                elif kind == "move":
+                    changes.delete(path, is_dir)
+                elif not self._ignored(path, is_dir):
+                    getattr(changes, kind)(path, is_dir)
+                first = first or time.monotonic()
+                last = time.monotonic()
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if changes and (now - last >= self.debounce or now - first >= _MAX_DELAY_FACTOR * self.debounce):
+                self._apply(changes)
+                changes, first, last = ChangeSet(), None, None
+            if not observer.is_alive() or not all(emitter.is_alive() for emitter in observer.emitters):
+                self.log("The filesystem observer stopped, probably out of inotify watches; "
+                         "switching to polling.")
+                break
+        if changes:
+            self._apply(changes)
+
+    def _run_polling(self, stop_event):
+        scanners = [IncrementalScanner(root, self.rules) for root in self.roots]
+        for scanner in scanners:
+            scanner.rescan()
+        while not stop_event.wait(self.rescan_interval):
+            changes = ChangeSet()
+            for scanner in scanners:
+                found = scanner.rescan()
+                changes.created.update(found.created)
+                changes.deleted.update(found.deleted)
+            if changes:
+                self._apply(changes)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Science Data Kit - Headless pipeline entry point
+
+Runs a scan -> map -> push pipeline from a YAML spec without starting the
+Streamlit app, e.g. for nightly surveys from cron on a cluster login node.
+Stage statistics are printed to stdout as JSON lines. With --watch the
+process then stays up and keeps the scanned roots in sync with the graph.
+"""
+import argparse
+import os
+import sys
+
+
+def main():
+    """
+    Run a pipeline spec from the command line
+    """
+    parser = argparse.ArgumentParser(description="Run a Science Data Kit scan -> map -> push pipeline.")
+    parser.add_argument("spec", help="YAML pipeline spec")
+    parser.add_argument("--workers", type=int, help="Worker processes (overrides the spec)")
+    parser.add_argument("--stats", help="Append stage statistics to this file instead of stdout")
+    parser.add_argument("--output-dir", help="Directory for ncdu exports and dry-run tables")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Build the node/edge tables and write them as Parquet instead of pushing")
+    parser.add_argument("--watch", action="store_true",
+                        help="After the push, keep watching the roots and apply changes until interrupted")
+    args = parser.parse_args()
+
+    # The engines are imported the same way the app imports them
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+    from utils.pipeline import StatsWriter, load_pipeline_spec, run_pipeline, watch_pipeline
+
+    try:
+        spec = load_pipeline_spec(args.spec)
+        if args.workers:
+            spec["workers"] = args.workers
+        if args.watch and args.dry_run:
+            parser.error("--watch needs a push; it cannot be combined with --dry-run")
+        if args.stats:
+            with open(args.stats, "a") as stream:
+                run_pipeline(spec, StatsWriter(stream), dry_run=args.dry_run, output_dir=args.output_dir)
+                if args.watch:
+                    watch_pipeline(spec, StatsWriter(stream))
+        else:
+            run_pipeline(spec, dry_run=args.dry_run, output_dir=args.output_dir)
+            if args.watch:
+                watch_pipeline(spec)
+    except Exception as e:
+        print(f"Error running pipeline: {e}", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("Pipeline stopped by user", file=sys.stderr)
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,9 @@ setup(
     },
     install_requires=requirements,
     extras_require={
+        'imaging': [
+            'pydicom>=2.4',
+        ],
         'isatools': [
             'isatools>=0.14.2',
         ],
@@ -43,6 +46,7 @@ setup(
     entry_points={
         'console_scripts': [
             'science_data_kit=run_app:main',
+            'science_data_kit_pipeline=run_pipeline:main',
             'install_isatools=install_isatools:main',
             'install_isatools_py312=install_isatools_py312:main',
         ],